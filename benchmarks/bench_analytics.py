@@ -0,0 +1,94 @@
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+import mock_pyds
+mock_pyds.install()
+
+from common.analytics import AnalyticsEngine, ClassCounts, Line, LineCrossing, ZoneOccupancy
+from common.log import setup_logging
+from common.probe import FrameProcessor
+from common.replay import synthetic_frames
+from common.zones import Zone, ZoneMonitor
+from bench_probe_logging import make_batches
+from bench_probe_overlay import ZONES
+from bench_roi_engine import ROI, TIMEOUT
+
+# Counting lines across the 1920x1080 view
+LINES = [Line("L%d" % i, (200 + 400 * i, 100), (300 + 400 * i, 1000)) for i in range(4)]
+
+# Analytics added one after another
+STEPS = [
+    ('class counts', lambda: ClassCounts()),
+    ('occupancy', lambda: ZoneOccupancy(interval=1.0)),
+    ('4 lines', lambda: LineCrossing({0: LINES})),
+]
+
+
+def make_inputs(num_objects, num_frames):
+    """Per-frame arguments of AnalyticsEngine.process, as the probe passes them."""
+    monitor = ZoneMonitor([Zone.from_rect("ROI", ROI, TIMEOUT)] + ZONES)
+    inputs = []
+    for frame in synthetic_frames(num_objects, num_frames):
+        objects = np.array([obj[:6] for obj in frame.objects], dtype=np.float64).reshape(-1, 6)
+        track_ids = objects[:, 0].astype(np.int64)
+        boxes = objects[:, 2:6]
+        # A third of the objects are bags or faces
+        class_ids = np.where(np.arange(len(track_ids)) % 3 == 2, 1, 0)
+        persons = class_ids == 0
+        now = frame.frame_num / 30.0
+        update = monitor.update(track_ids[persons], boxes[persons], now)
+        inputs.append((0, frame.frame_num, now, track_ids, class_ids, boxes, persons, monitor, update))
+    return inputs
+
+
+def run_engine(inputs, num_analytics, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        engine = AnalyticsEngine([make() for _, make in STEPS[:num_analytics]])
+        engine.add_stream(0)
+        start = time.perf_counter()
+        for args in inputs:
+            engine.process(*args)
+        best = min(best, (time.perf_counter() - start) / len(inputs))
+    return best
+
+
+def run_probe(batches, analytics, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        engine = AnalyticsEngine([make() for _, make in STEPS]) if analytics else None
+        processor = FrameProcessor(Zone.from_rect("ROI", ROI, TIMEOUT), {0: ZONES}, annotate=False,
+                                   analytics=engine)
+        processor.add_stream(0)
+        start = time.perf_counter()
+        for batch_meta in batches:
+            processor.process_batch(batch_meta)
+        best = min(best, (time.perf_counter() - start) / len(batches))
+    return best
+
+
+def main():
+    setup_logging('warning')
+    logging.getLogger('deepstream').setLevel(logging.WARNING)
+    num_frames = 300
+    print("Analytics engine us/frame as analytics are added, and the whole probe without/with all of them")
+    print(f"{'objects':>8} {'engine only':>12}" + "".join(f" {'+ ' + name:>14}" for name, _ in STEPS) +
+          f" {'probe':>9} {'probe + all':>12}")
+    for num_objects in (10, 100, 1000):
+        inputs = make_inputs(num_objects, num_frames)
+        engine = [run_engine(inputs, n) for n in range(len(STEPS) + 1)]
+        batches = make_batches(num_objects, num_frames)
+        probe = run_probe(batches, False)
+        probe_all = run_probe(batches, True)
+        print(f"{num_objects:>8} {engine[0] * 1e6:>12.1f}" + "".join(f" {t * 1e6:>14.1f}" for t in engine[1:]) +
+              f" {probe * 1e6:>9.1f} {probe_all * 1e6:>12.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import collections
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import mock_pyds
+mock_pyds.install()
+
+from common.archive import STATUS_OK, ArchiveReport, ArchiveScheduler, find_files
+from common.log import setup_logging
+from common.probe import FrameProcessor
+from common.replay import synthetic_frames
+from common.zones import Zone
+from bench_roi_engine import ROI, TIMEOUT
+
+NUM_FILES = 24
+NUM_OBJECTS = 20
+# Simulated GPU time per batch: a fixed cost plus a cost per frame, so
+# fuller batches scan more frames per second
+BATCH_OVERHEAD = 0.010
+FRAME_COST = 0.002
+# Batches between the muxer and the probe (nvinfer, nvtracker)
+DEPTH = 3
+POLL_INTERVAL = 0.2
+
+
+class Alerts:
+    # Event sink of the reference runs
+    def __init__(self):
+        self.events = []
+
+    def push(self, event):
+        if event['type'] == 'alert':
+            self.events.append((event['zone'], event['track'], event['frame']))
+
+
+class StandInPipeline:
+    """What Pipeline does for an archive scan, on replayed detections and a
+    simulated clock: one frame per slot and batch into the muxer, DEPTH
+    batches in flight to the probe, and advance_archive every POLL_INTERVAL."""
+
+    def __init__(self, archive, slots, files):
+        self.archive = archive
+        self.num_sources = slots
+        self.files = files
+        self.processor = FrameProcessor(Zone.from_rect("ROI", ROI, TIMEOUT), annotate=False, events=archive)
+        # Frames left per slot
+        self.sources = {}
+        self.in_flight = collections.deque()
+        self.now = 0.0
+        self.next_poll = 0.0
+        self.polls = 0
+
+    def add_source(self, archive_file):
+        index = min(i for i in range(self.num_sources) if i not in self.sources)
+        self.processor.add_stream(index)
+        self.sources[index] = collections.deque(self.files[archive_file.path])
+
+    def remove_source(self, index):
+        del self.sources[index]
+        self.processor.remove_stream(index)
+
+    def advance_archive(self):
+        for index in self.archive.poll(self.now):
+            if index in self.sources:
+                self.remove_source(index)
+        while len(self.sources) < self.num_sources:
+            archive_file = self.archive.next_file()
+            if archive_file is None:
+                break
+            self.archive.start(min(set(range(self.num_sources)) - set(self.sources)), archive_file, self.now)
+            self.add_source(archive_file)
+        return not self.archive.finished
+
+    def run(self, max_polls=None):
+        while True:
+            if self.now >= self.next_poll:
+                if not self.advance_archive():
+                    return True
+                self.polls += 1
+                if max_polls is not None and self.polls >= max_polls:
+                    return False
+                self.next_poll += POLL_INTERVAL
+            batch = []
+            for index, frames in self.sources.items():
+                if not frames:
+                    continue
+                self.archive.decoded(index)
+                batch.append(frames.popleft()._replace(stream=index))
+                if not frames:
+                    # EOS right behind the file's last buffer
+                    self.archive.ended(index, self.now)
+            if batch:
+                self.in_flight.append(batch)
+            if len(self.in_flight) > DEPTH or (self.in_flight and not batch):
+                done = self.in_flight.popleft()
+                self.processor.process_batch(mock_pyds.batch_from_replay(done))
+                self.archive.frames([frame.stream for frame in done], self.now)
+                self.now += BATCH_OVERHEAD + FRAME_COST * len(done)
+            else:
+                self.now += 0.01
+
+
+def make_archive(directory):
+    # Dummy video files; the stand-in plays synthetic detections for each
+    files = {}
+    for i in range(NUM_FILES):
+        path = os.path.join(directory, f"day{i // 8}", f"cam{i % 8}.mp4")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'\0' * (i + 1))
+        files[path] = synthetic_frames(NUM_OBJECTS, 150 + 60 * (i % 6), turnover=0.3, seed=i)
+    return files
+
+
+def reference(frames):
+    alerts = Alerts()
+    processor = FrameProcessor(Zone.from_rect("ROI", ROI, TIMEOUT), annotate=False, events=alerts)
+    processor.add_stream(0)
+    for frame in frames:
+        processor.process_batch(mock_pyds.batch_from_replay([frame]))
+    return alerts.events
+
+
+def check(report_path, expected, files):
+    # Latest record per file against its frames and the alerts of scanning
+    # it alone
+    records = {}
+    with open(report_path) as f:
+        for line in f:
+            record = json.loads(line)
+            records[record['path']] = record
+    wrong = [path for path, events in expected.items()
+             if records.get(path, {}).get('status') != STATUS_OK or records[path]['frames'] != len(files[path])
+             or [(e['zone'], e['track'], e['frame']) for e in records[path]['events']] != events]
+    return wrong
+
+
+def scan(directory, files, report_path, slots, resume=True, max_polls=None):
+    archive = ArchiveScheduler(find_files(directory), ArchiveReport(report_path, resume))
+    pipeline = StandInPipeline(archive, slots, files)
+    start = time.perf_counter()
+    finished = pipeline.run(max_polls)
+    elapsed = time.perf_counter() - start
+    if finished:
+        archive.close(pipeline.now)
+    return archive, pipeline, finished, elapsed
+
+
+def main():
+    setup_logging('warning')
+    logging.getLogger('deepstream').setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        archive_dir = os.path.join(directory, 'archive')
+        files = make_archive(archive_dir)
+        expected = {path: reference(frames) for path, frames in files.items()}
+        total_frames = sum(len(frames) for frames in files.values())
+        print(f"{NUM_FILES} files, {total_frames} frames, {sum(map(len, expected.values()))} alerts; "
+              f"simulated {BATCH_OVERHEAD * 1e3:.0f} ms + {FRAME_COST * 1e3:.0f} ms/frame per batch, "
+              f"{DEPTH} batches in flight")
+        print(f"{'slots':>6} {'scan s (sim)':>13} {'frames/s (sim)':>15} {'cpu s':>7} {'files ok':>9} "
+              f"{'wrong files':>12}")
+        for slots in (1, 2, 4, 8):
+            report_path = os.path.join(directory, f'report{slots}.jsonl')
+            archive, pipeline, _, elapsed = scan(archive_dir, files, report_path, slots)
+            print(f"{slots:>6} {pipeline.now:>13.1f} {total_frames / pipeline.now:>15.0f} {elapsed:>7.2f} "
+                  f"{archive.counts[STATUS_OK]:>9} {len(check(report_path, expected, files)):>12}")
+
+        # Crash part way: the report only holds the files that finished
+        report_path = os.path.join(directory, 'crash.jsonl')
+        archive, _, finished, _ = scan(archive_dir, files, report_path, 4, max_polls=40)
+        done_before = archive.counts[STATUS_OK]
+        archive, _, finished, _ = scan(archive_dir, files, report_path, 4)
+        print(f"crash after {done_before} files, resume skipped {archive.skipped} and scanned "
+              f"{archive.counts[STATUS_OK]}; wrong files after resume: {len(check(report_path, expected, files))}")
+
+        # A manifest with a missing and a duplicate entry
+        manifest = os.path.join(archive_dir, 'manifest.txt')
+        listed = sorted(files)[:3]
+        with open(manifest, 'w') as f:
+            f.write("# three files, one missing, one twice\n")
+            f.write("\n".join(os.path.relpath(path, archive_dir) for path in listed + listed[:1]))
+            f.write("\nday9/missing.mp4\n")
+        archive = ArchiveScheduler(find_files(manifest), ArchiveReport(os.path.join(directory, 'm.jsonl')))
+        pipeline = StandInPipeline(archive, 2, files)
+        pipeline.run()
+        archive.close(pipeline.now)
+        print(f"manifest: {archive.stats()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import mock_pyds
+mock_pyds.install()
+
+from common.analytics import AnalyticsEngine
+from common.log import setup_logging
+from common.probe import FrameProcessor
+from common.zones import Zone
+from bench_analytics import STEPS
+from bench_probe_logging import make_batches
+from bench_probe_overlay import ZONES
+from bench_roi_engine import ROI, TIMEOUT
+
+NUM_STREAMS = 4
+
+
+def run(batches, decoupled, downstream, repeat=3):
+    """Streaming thread of the OSD: the probe, then `downstream` seconds of
+    work that does not hold the GIL (nvdsosd, encoder, sink), per batch.
+    Returns batches/sec and the probe time per batch, best of repeat."""
+    best_rate, best_probe = 0.0, float('inf')
+    for _ in range(repeat):
+        analytics = AnalyticsEngine([make() for _, make in STEPS])
+        processor = FrameProcessor(Zone.from_rect("ROI", ROI, TIMEOUT), {i: ZONES for i in range(NUM_STREAMS)},
+                                   analytics=analytics, decoupled=decoupled)
+        for i in range(NUM_STREAMS):
+            processor.add_stream(i)
+        probe = 0.0
+        start = time.perf_counter()
+        for batch_meta in batches:
+            batch_meta.reset()
+            probe_start = time.perf_counter()
+            processor.process_batch(batch_meta)
+            probe += time.perf_counter() - probe_start
+            if downstream:
+                time.sleep(downstream)
+        processor.stop()
+        elapsed = time.perf_counter() - start
+        best_rate = max(best_rate, len(batches) / elapsed)
+        best_probe = min(best_probe, probe / len(batches))
+    return best_rate, best_probe
+
+
+def main():
+    setup_logging('warning')
+    logging.getLogger('deepstream').setLevel(logging.WARNING)
+    num_frames = 200
+    print(f"{NUM_STREAMS} streams per batch, zones and all analytics; downstream is GIL-free work after the probe")
+    print(f"{'objects':>8} {'downstream ms':>14} {'inline batch/s':>15} {'decoupled batch/s':>18} "
+          f"{'inline probe us':>16} {'decoupled probe us':>19}")
+    for num_objects in (10, 100, 500):
+        batches = make_batches(num_objects, num_frames, NUM_STREAMS)
+        for downstream in (0.0, 0.005, 0.02):
+            inline_rate, inline_probe = run(batches, False, downstream)
+            decoupled_rate, decoupled_probe = run(batches, True, downstream)
+            print(f"{num_objects:>8} {downstream * 1e3:>14.0f} {inline_rate:>15.1f} {decoupled_rate:>18.1f} "
+                  f"{inline_probe * 1e6:>16.1f} {decoupled_probe * 1e6:>19.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.roi import BBox, BatchROIEngine, DetectionBatch, ROIInspector
+from bench_roi_engine import FPS, ROI, TIMEOUT, make_frames
+
+NUM_STREAMS = 8
+# Frames of detections kept alive per stream, like a short trajectory
+# window, so the collector has live objects to walk
+KEEP_FRAMES = 30
+
+
+class DictBBox:
+    # BBox as it was before __slots__: one __dict__ per detection
+    def __init__(self, left, top, width, height):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+
+    def get_area(self):
+        return self.width * self.height
+
+    def get_intersection(self, other):
+        return BBox.get_intersection(self, other)
+
+
+def per_object(box_type):
+    def setup():
+        return [ROIInspector(ROI, TIMEOUT) for _ in range(NUM_STREAMS)]
+
+    def frame(inspectors, stream, ids, values, now):
+        rows = zip(*[iter(values)] * 5)
+        boxes = [box_type(left, top, width, height) for left, top, width, height, _ in rows]
+        inspector = inspectors[stream]
+        return boxes, [inspector.update(track_id, box, now) for track_id, box in zip(ids[::2], boxes)]
+    return setup, frame
+
+
+def batched():
+    def setup():
+        return [BatchROIEngine(ROI, TIMEOUT) for _ in range(NUM_STREAMS)]
+
+    def frame(engines, stream, ids, values, now):
+        detections = DetectionBatch.from_lists(ids, values)
+        return detections, engines[stream].update(detections.track_ids, detections.boxes, now).alert
+    return setup, frame
+
+
+CASES = [
+    ('BBox with __dict__', per_object(DictBBox)),
+    ('BBox with __slots__', per_object(BBox)),
+    ('DetectionBatch', batched()),
+]
+
+
+def flat_lists(frames):
+    # What the probe collects from the metadata: (id, class) and
+    # (left, top, width, height, confidence) per object
+    flat = []
+    for ids, boxes in frames:
+        flat.append(([v for track_id in ids.tolist() for v in (track_id, 0)],
+                     [v for box in boxes.tolist() for v in (*box, 0.9)]))
+    return flat
+
+
+def run(case, streams):
+    setup, frame = case
+    state = setup()
+    kept = [deque(maxlen=KEEP_FRAMES) for _ in streams]
+    pauses = []
+    started = []
+
+    def on_gc(phase, info):
+        if phase == 'start':
+            started.append(time.perf_counter())
+        elif started:
+            pauses.append(time.perf_counter() - started.pop())
+
+    gc.collect()
+    gc.callbacks.append(on_gc)
+    try:
+        start = time.perf_counter()
+        for frame_idx in range(len(streams[0])):
+            now = frame_idx / FPS
+            for stream, frames in enumerate(streams):
+                ids, values = frames[frame_idx]
+                kept[stream].append(frame(state, stream, ids, values, now))
+        elapsed = time.perf_counter() - start
+    finally:
+        gc.callbacks.remove(on_gc)
+    live = sum(len(gc.get_objects(generation)) for generation in range(3))
+
+    # Memory of one more pass, traced separately since tracing is slow
+    state = setup()
+    tracemalloc.start()
+    for frame_idx in range(len(streams[0])):
+        now = frame_idx / FPS
+        for stream, frames in enumerate(streams):
+            ids, values = frames[frame_idx]
+            frame(state, stream, ids, values, now)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, pauses, live, peak
+
+
+def main():
+    num_frames = 150
+    print(f"{NUM_STREAMS} streams, ROI check per frame, the last {KEEP_FRAMES} frames of detections kept per stream")
+    print(f"{'objects':>8} {'representation':>20} {'us/frame':>9} {'gc runs':>8} {'gc total ms':>12} "
+          f"{'gc max ms':>10} {'gc objects':>11} {'peak KB':>8}")
+    for num_objects in (10, 100, 1000):
+        streams = [flat_lists(make_frames(num_objects, num_frames, seed=stream)) for stream in range(NUM_STREAMS)]
+        for name, case in CASES:
+            elapsed, pauses, live, peak = run(case, streams)
+            print(f"{num_objects:>8} {name:>20} {elapsed / (num_frames * NUM_STREAMS) * 1e6:>9.1f} "
+                  f"{len(pauses):>8} {sum(pauses) * 1e3:>12.2f} {max(pauses, default=0.0) * 1e3:>10.2f} "
+                  f"{live:>11} {peak / 1024:>8.0f}")
+    box = DictBBox(0.0, 0.0, 1.0, 1.0)
+    print(f"bytes per detection: BBox with __dict__ {sys.getsizeof(box) + sys.getsizeof(box.__dict__)}, "
+          f"with __slots__ {sys.getsizeof(BBox(0.0, 0.0, 1.0, 1.0))} (both plus 4 floats), "
+          f"DetectionBatch {DetectionBatch.empty().boxes.itemsize * 4 + 8 + 8 + 4}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import logging
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+import mock_pyds
+mock_pyds.install()
+
+from common.evidence import ArrayFrames, EvidenceRecorder, EvidenceStore, make_encoder
+from common.log import setup_logging
+from common.probe import FrameProcessor
+from common.replay import batch_frames, synthetic_frames
+from common.zones import Zone
+
+# The whole 1920x1080 view is watched with a short timeout, so the crowd
+# goes into alert together and new tracks keep alerting after that
+ROI = [0.0, 0.0, 1920.0, 1080.0]
+TIMEOUT = 0.5
+NUM_OBJECTS = 100
+TURNOVER = 0.5
+MAX_BYTES = 20 << 20
+
+UNLIMITED = dict(rate=1e9, burst=10 ** 9)
+SETUPS = [
+    ('no evidence', None),
+    ('crop, 1/s burst 5', dict()),
+    ('crop, no rate limit', UNLIMITED),
+    ('full frame, 1/s', dict(crop=False)),
+    ('full frame, no limit', dict(crop=False, **UNLIMITED)),
+    ('full + 10-frame clip', dict(crop=False, clip_frames=10)),
+]
+
+
+def run(batches, frames, fmt, settings, decoupled=False):
+    with tempfile.TemporaryDirectory() as directory:
+        evidence = None
+        if settings is not None:
+            encoder, extension = make_encoder(fmt)
+            evidence = EvidenceRecorder(EvidenceStore(directory, MAX_BYTES), encoder, extension, **settings)
+            evidence.start()
+        processor = FrameProcessor(Zone.from_rect("ROI", ROI, TIMEOUT), annotate=False, evidence=evidence,
+                                   decoupled=decoupled)
+        processor.add_stream(0)
+        times = []
+        start = time.perf_counter()
+        for batch_meta in batches:
+            batch_start = time.perf_counter()
+            processor.process_batch(batch_meta, frames)
+            times.append(time.perf_counter() - batch_start)
+        processor.stop()
+        probe_done = time.perf_counter() - start
+        stats = {}
+        if evidence is not None:
+            evidence.stop()
+            stats = evidence.stats()
+        total = time.perf_counter() - start
+    return np.mean(times), np.max(times), probe_done, total, stats
+
+
+def main():
+    setup_logging('warning')
+    logging.getLogger('deepstream').setLevel(logging.WARNING)
+    try:
+        make_encoder('jpeg')
+        fmt = 'jpeg'
+    except ValueError:
+        fmt = 'png'
+    num_frames = 300
+    frames = synthetic_frames(NUM_OBJECTS, num_frames, turnover=TURNOVER)
+    # Noise is the worst case for the encoder
+    rng = np.random.default_rng(0)
+    pixels = ArrayFrames({0: rng.integers(0, 256, size=(1080, 1920, 4), dtype=np.uint8)})
+    print(f"{NUM_OBJECTS} people alerting {TIMEOUT}s after entering, {TURNOVER:.0%} new tracks per second, "
+          f"{num_frames} frames of 1920x1080, {fmt}, {MAX_BYTES >> 20} MB cap")
+    print(f"{'mode':>6} {'setup':>22} {'probe us/frame':>15} {'max ms':>8} {'run s':>7} {'drain s':>8} "
+          f"{'written':>8} {'rate limited':>13} {'queue full':>11} {'MB on disk':>11}")
+    for decoupled in (False, True):
+        for name, settings in SETUPS:
+            batches = [mock_pyds.batch_from_replay(batch) for batch in batch_frames(frames)]
+            mean, peak, probe_done, total, stats = run(batches, pixels, fmt, settings, decoupled)
+            print(f"{'decoup' if decoupled else 'inline':>6} {name:>22} {mean * 1e6:>15.1f} {peak * 1e3:>8.2f} "
+                  f"{probe_done:>7.2f} {total - probe_done:>8.2f} {stats.get('written', 0):>8} "
+                  f"{stats.get('rate_limited', 0):>13} {stats.get('queue_full', 0):>11} "
+                  f"{stats.get('bytes', 0) / (1 << 20):>11.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
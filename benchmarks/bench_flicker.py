@@ -0,0 +1,157 @@
+import collections
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+import mock_pyds
+mock_pyds.install()
+
+from common.log import setup_logging
+from common.probe import FrameProcessor
+from common.replay import NSEC_PER_SEC, ReplayFrame
+from common.zones import Zone
+
+FPS = 30
+NUM_FRAMES = 9000
+ZONE = [600.0, 300.0, 700.0, 450.0]
+TIMEOUT = 10.0
+BOX = (60.0, 150.0)
+# People arriving per second; each stays either briefly or well past the
+# timeout, so every visit either should alert once or not at all
+ARRIVALS = 0.4
+SHORT_STAY = (2.0, 6.0)
+LONG_STAY = (14.0, 40.0)
+# Share of people standing on the zone edge, half inside (overlap 0.6),
+# where box jitter drops them below min_overlap every few frames
+EDGE = 0.3
+JITTER = 4.0
+# Per person and frame: a bad box for 1-2 frames (overlap 0)
+GLITCH = 0.005
+# Per person and second: hidden for 3-30 frames, e.g. behind someone else,
+# and back under a new track id with probability ID_SWITCH
+OCCLUSION = 0.1
+ID_SWITCH = 0.7
+
+
+class Person:
+    def __init__(self, rng, frame_num, track_id):
+        left, top, width, height = ZONE
+        self.long = rng.random() < 0.5
+        stay = rng.uniform(*(LONG_STAY if self.long else SHORT_STAY))
+        self.end = frame_num + int(stay * FPS)
+        if rng.random() < EDGE:
+            # 60% of the box inside the right edge
+            self.anchor = np.array([left + width - 0.6 * BOX[0], rng.uniform(top, top + height - BOX[1])])
+        else:
+            self.anchor = rng.uniform([left, top], [left + width - BOX[0], top + height - BOX[1]])
+        self.track_id = track_id
+        self.hidden_until = -1
+        self.glitch_until = -1
+
+
+class Alerts:
+    # Event sink counting alerts and leaves per track
+    def __init__(self):
+        self.alerts = collections.Counter()
+        self.leaves = 0
+
+    def push(self, event):
+        if event['type'] == 'alert':
+            self.alerts[event['track']] += 1
+        elif event['type'] == 'leave':
+            self.leaves += 1
+
+
+def make_frames(seed=0):
+    """Frames of one stream, and the person behind each track id."""
+    rng = np.random.default_rng(seed)
+    people = []
+    owner = {}
+    frames = []
+    next_id = 0
+    frame_ns = NSEC_PER_SEC // FPS
+    for frame_num in range(NUM_FRAMES):
+        if rng.random() < ARRIVALS / FPS:
+            people.append(Person(rng, frame_num, next_id))
+            owner[next_id] = people[-1]
+            next_id += 1
+        people = [p for p in people if p.end > frame_num]
+        objects = []
+        for p in people:
+            if p.hidden_until >= frame_num:
+                continue
+            if rng.random() < OCCLUSION / FPS:
+                p.hidden_until = frame_num + int(rng.integers(3, 31))
+                p.anchor += rng.normal(0.0, 5.0, 2)
+                if rng.random() < ID_SWITCH:
+                    p.track_id = next_id
+                    owner[next_id] = p
+                    next_id += 1
+                continue
+            x, y = p.anchor + rng.normal(0.0, JITTER, 2)
+            if p.glitch_until >= frame_num or rng.random() < GLITCH:
+                if p.glitch_until < frame_num:
+                    p.glitch_until = frame_num + int(rng.integers(0, 2))
+                x = ZONE[0] + ZONE[2] + 10.0
+            objects.append((p.track_id, 0, x, y, *BOX, 1.0, "Person"))
+        frames.append(ReplayFrame(0, frame_num, frame_num * frame_ns, 0, objects))
+    return frames, owner
+
+
+def run(frames, owner, zone, repeat=3, **limits):
+    batches = [mock_pyds.batch_from_replay([frame]) for frame in frames]
+    best = float('inf')
+    for _ in range(repeat):
+        alerts = Alerts()
+        processor = FrameProcessor(zone, annotate=False, events=alerts, track_limits=limits)
+        processor.add_stream(0)
+        start = time.perf_counter()
+        for batch in batches:
+            processor.process_batch(batch)
+        best = min(best, (time.perf_counter() - start) / len(batches))
+
+    per_person = collections.Counter()
+    for track_id, count in alerts.alerts.items():
+        per_person[owner[track_id]] += count
+    people = set(owner.values())
+    long_stays = [p for p in people if p.long]
+    missed = sum(1 for p in long_stays if not per_person[p])
+    duplicate = sum(max(per_person[p] - 1, 0) for p in long_stays)
+    false = sum(per_person[p] for p in people if not p.long)
+    lost = processor.zone_monitors[0].lost
+    return (len(long_stays), missed, duplicate, false, alerts.leaves, lost.reassociated if lost else 0,
+            best * 1e6)
+
+
+def main():
+    setup_logging('warning')
+    logging.getLogger('deepstream').setLevel(logging.WARNING)
+    frames, owner = make_frames()
+    people = len(set(owner.values()))
+    print(f"{NUM_FRAMES} frames at {FPS} fps, {people} people, {len(owner)} track ids, "
+          f"{sum(len(f.objects) for f in frames) / len(frames):.1f} boxes/frame; timeout {TIMEOUT:.0f}s")
+    configs = [
+        ("baseline", Zone.from_rect("zone", ZONE, TIMEOUT), {}),
+        ("exit 0.3", Zone.from_rect("zone", ZONE, TIMEOUT, exit_overlap=0.3), {}),
+        ("exit 0.3 + grace 3 frames", Zone.from_rect("zone", ZONE, TIMEOUT, exit_overlap=0.3, grace_frames=3), {}),
+        ("exit 0.3 + grace 0.5s", Zone.from_rect("zone", ZONE, TIMEOUT, exit_overlap=0.3, grace=0.5), {}),
+        ("  + reassociate 1.5s/64px", Zone.from_rect("zone", ZONE, TIMEOUT, exit_overlap=0.3, grace=0.5),
+         {'reassociate_gap': 1.5, 'reassociate_distance': 64.0}),
+        ("reassociate only", Zone.from_rect("zone", ZONE, TIMEOUT),
+         {'reassociate_gap': 1.5, 'reassociate_distance': 64.0}),
+    ]
+    print(f"{'':26} {'long stays':>10} {'missed':>7} {'duplicate':>10} {'false':>6} {'leaves':>7} "
+          f"{'reassoc':>8} {'us/frame':>9}")
+    for name, zone, limits in configs:
+        long_stays, missed, duplicate, false, leaves, reassociated, us = run(frames, owner, zone, **limits)
+        print(f"{name:26} {long_stays:>10} {missed:>7} {duplicate:>10} {false:>6} {leaves:>7} "
+              f"{reassociated:>8} {us:>9.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
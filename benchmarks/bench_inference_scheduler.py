@@ -0,0 +1,103 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from common.scheduler import InferenceScheduler
+from common.zones import Zone, ZoneMonitor
+from bench_roi_engine import FPS, ROI, TIMEOUT
+
+# Applying a new interval to nvinfer happens on a main loop timer
+APPLY_EVERY_FRAMES = 8
+
+
+def make_scene(duration, seed=0):
+    """Sparse activity: people cross a 1920x1080 view every ~30s on average,
+    some of them through the ROI and some of those stopping in it long
+    enough to raise an alert. Returns per-frame (ids, boxes)."""
+    rng = np.random.default_rng(seed)
+    num_frames = int(duration * FPS)
+    people = []
+    t = rng.exponential(30.0)
+    next_id = 0
+    while t < duration:
+        speed = rng.uniform(100, 200)
+        lane = rng.choice(['roi', 'far'], p=[0.6, 0.4])
+        y = rng.uniform(450, 650) if lane == 'roi' else rng.uniform(20, 200)
+        stop_x = rng.uniform(150, 300) if lane == 'roi' and rng.random() < 0.5 else None
+        stop = rng.uniform(3.0, 6.0) if stop_x is not None else 0.0
+        people.append((next_id, t, speed, y, stop_x, stop))
+        next_id += 1
+        t += rng.exponential(30.0)
+
+    frames = []
+    for f in range(num_frames):
+        now = f / FPS
+        ids, boxes = [], []
+        for track_id, start, speed, y, stop_x, stop in people:
+            walked = (now - start) * speed
+            if walked < 0:
+                continue
+            x = walked - 80
+            if stop_x is not None and x > stop_x:
+                # Standing still at stop_x for `stop` seconds, then walking on
+                x = stop_x + max(0.0, (now - start - (stop_x + 80) / speed - stop) * speed)
+            if x > 1920:
+                continue
+            ids.append(track_id)
+            boxes.append((x, y, 80.0, 200.0))
+        frames.append((np.array(ids, dtype=np.int64), np.array(boxes, dtype=np.float64).reshape(-1, 4)))
+    return frames
+
+
+def simulate(frames, idle_interval):
+    """Replays the scene through the scheduler with a simple tracker model:
+    objects become visible at the first inferred frame they are in and stay
+    tracked, in between inferences, until they leave the view."""
+    scheduler = InferenceScheduler(idle_interval)
+    scheduler.add_stream(0)
+    monitor = ZoneMonitor([Zone.from_rect("ROI", ROI, TIMEOUT)])
+    known = np.empty(0, dtype=np.int64)
+    interval = skip = inferences = 0
+    first_alert = {}
+    for f, (ids, boxes) in enumerate(frames):
+        now = f / FPS
+        if f % APPLY_EVERY_FRAMES == 0:
+            interval = scheduler.pipeline_interval()
+        if skip == 0:
+            inferences += 1
+            known = ids
+            skip = interval
+        else:
+            skip -= 1
+            known = known[np.isin(known, ids)]
+        visible = np.isin(ids, known)
+        ids, boxes = ids[visible], boxes[visible]
+        alerts = monitor.update(ids, boxes, now).alert
+        for track_id in ids[alerts].tolist():
+            first_alert.setdefault(track_id, now)
+        scheduler.observe(0, now, monitor.near(boxes, scheduler.margin))
+    return inferences, first_alert
+
+
+def main():
+    duration = 1800.0
+    frames = make_scene(duration)
+    base_inferences, base_alerts = simulate(frames, 0)
+    print(f"{duration / 60:.0f} min at {FPS:.0f} fps, {len(base_alerts)} alerts at full rate")
+    print(f"{'idle interval':>14} {'inferences':>11} {'saved':>7} {'alerts':>7} {'missed':>7} "
+          f"{'mean delay ms':>14} {'max delay ms':>13}")
+    for idle_interval in (0, 2, 4, 8, 15):
+        inferences, alerts = simulate(frames, idle_interval)
+        delays = [alerts[t] - base_alerts[t] for t in base_alerts if t in alerts]
+        missed = sum(1 for t in base_alerts if t not in alerts)
+        mean = np.mean(delays) * 1000 if delays else 0.0
+        worst = np.max(delays) * 1000 if delays else 0.0
+        print(f"{idle_interval:>14} {inferences:>11} {1 - inferences / base_inferences:>6.0%} {len(alerts):>7} "
+              f"{missed:>7} {mean:>14.1f} {worst:>13.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import collections
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from common.latency import LatencyBudget
+
+NUM_STREAMS = 4
+FPS = 30
+DURATION = 60.0
+STEP = 0.001
+BUDGET = 0.25
+QUEUE_SIZE = 2
+# Simulated nvinfer and probe time per batch: fixed plus per frame, about
+# 70% busy at 4 streams
+INFER = (0.006, 0.004)
+PROBE = (0.003, 0.001)
+# Probe stalls (start, seconds), e.g. a slow event sink or a GC pause, and
+# a stretch where inference costs more, e.g. a crowd in every camera
+STALLS = [(10.0, 0.6), (25.0, 0.6), (45.0, 1.5)]
+OVERLOAD = (30.0, 40.0, 1.6)
+# Network hiccups (stream, start, seconds): the frames captured meanwhile
+# arrive all at once at the end
+HICCUPS = [(1, 15.0, 1.0), (2, 50.0, 2.0)]
+
+
+def infer_time(frames, now):
+    start, end, factor = OVERLOAD
+    cost = INFER[0] + INFER[1] * len(frames)
+    return cost * factor if start <= now < end else cost
+
+
+def probe_time(frames, now):
+    cost = PROBE[0] + PROBE[1] * len(frames)
+    for start, seconds in STALLS:
+        if start <= now < start + seconds:
+            cost += start + seconds - now
+    return cost
+
+
+class Stage:
+    # One streaming thread: takes a batch from its input, holds it for the
+    # service time, then blocks until the output takes it
+    def __init__(self, service):
+        self.service = service
+        self.batch = None
+        self.done = 0.0
+
+    def step(self, now, source, push):
+        if self.batch is not None and now >= self.done and push(self.batch):
+            self.batch = None
+        if self.batch is None and source:
+            self.batch = source.popleft()
+            self.done = now + self.service(self.batch, now)
+
+
+def simulate(mode):
+    """mode: direct (elements linked without queues), queues (blocking
+    queues between the stages), leaky (leaky queue in front of nvinfer) or
+    budget (leaky queue and LatencyBudget)."""
+    budget = LatencyBudget(BUDGET)
+    for stream in range(NUM_STREAMS):
+        budget.add_stream(stream)
+    # Frames on their way to the muxer (arrival time, PTS), and those that
+    # arrived, per stream
+    arriving = [collections.deque() for _ in range(NUM_STREAMS)]
+    arrived = [collections.deque() for _ in range(NUM_STREAMS)]
+    # Batches the muxer could not push yet, i.e. held up in the sources
+    upstream = collections.deque()
+    infer_queue = collections.deque()
+    post_queue = collections.deque()
+    latencies = [[] for _ in range(NUM_STREAMS)]
+    produced = 0
+
+    def done(batch):
+        for stream, pts in batch:
+            budget.frame(stream, pts, now)
+            latencies[stream].append(now - pts * 1e-9)
+        return True
+
+    def to_post(batch):
+        if len(post_queue) >= QUEUE_SIZE:
+            return False
+        post_queue.append(batch)
+        return True
+
+    if mode == 'direct':
+        # nvinfer, tracker and probe run on the muxer's thread
+        chain = [Stage(lambda b, t: infer_time(b, t) + probe_time(b, t))]
+    else:
+        chain = [Stage(infer_time), Stage(probe_time)]
+    next_frame = 0.0
+    now = 0.0
+    while now < DURATION:
+        if now >= next_frame:
+            pts = int(round(next_frame * 1e9))
+            for stream in range(NUM_STREAMS):
+                arrival = now
+                for hiccup_stream, start, seconds in HICCUPS:
+                    if stream == hiccup_stream and start <= now < start + seconds:
+                        arrival = start + seconds
+                arriving[stream].append((arrival, pts))
+            produced += NUM_STREAMS
+            next_frame += 1.0 / FPS
+        for stream in range(NUM_STREAMS):
+            while arriving[stream] and arriving[stream][0][0] <= now:
+                pts = arriving[stream].popleft()[1]
+                if mode != 'budget' or budget.admit(stream, pts, now):
+                    arrived[stream].append(pts)
+        # One frame per stream and batch
+        batch = [(stream, frames.popleft()) for stream, frames in enumerate(arrived) if frames]
+        if batch:
+            upstream.append(batch)
+        while upstream:
+            if mode in ('leaky', 'budget') and len(infer_queue) >= QUEUE_SIZE:
+                infer_queue.popleft()
+                budget.queue_overrun()
+            elif len(infer_queue) >= QUEUE_SIZE:
+                break
+            infer_queue.append(upstream.popleft())
+        if mode == 'direct':
+            chain[0].step(now, infer_queue, done)
+        else:
+            chain[1].step(now, post_queue, done)
+            chain[0].step(now, infer_queue, to_post)
+        now += STEP
+    return budget, latencies, produced
+
+
+def main():
+    print(f"{NUM_STREAMS} live streams at {FPS} fps for {DURATION:.0f}s, budget {BUDGET * 1e3:.0f} ms, "
+          f"queues of {QUEUE_SIZE} batches; probe stalls {', '.join(f'{s:.1f}s' for _, s in STALLS)} "
+          f"and {OVERLOAD[2]}x inference cost for {OVERLOAD[1] - OVERLOAD[0]:.0f}s; "
+          f"network hiccups of {', '.join(f'{s:.1f}s on stream {i}' for i, _, s in HICCUPS)}")
+    print(f"{'mode':>8} {'processed':>10} {'p50 ms':>7} {'p99 ms':>8} {'max ms':>8} {'in budget':>10} "
+          f"{'budget drops':>13} {'queue drops':>12}")
+    for mode in ('direct', 'queues', 'leaky', 'budget'):
+        budget, latencies, produced = simulate(mode)
+        all_latencies = np.concatenate([np.array(l) for l in latencies])
+        processed = len(all_latencies)
+        within = np.count_nonzero(all_latencies <= BUDGET)
+        dropped = sum(s.dropped for s in budget.streams.values())
+        print(f"{mode:>8} {processed / produced:>10.1%} {np.percentile(all_latencies, 50) * 1e3:>7.0f} "
+              f"{np.percentile(all_latencies, 99) * 1e3:>8.0f} {all_latencies.max() * 1e3:>8.0f} "
+              f"{within / processed:>10.1%} {dropped:>13} {budget.queue_drops:>12}")
+        if mode == 'budget':
+            streams = budget.snapshot()['streams']
+            print("per stream (admitted/dropped/lost): " + ", ".join(
+                f"{i}: {s['admitted']}/{s['dropped']}/{s['lost']}" for i, s in streams.items()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
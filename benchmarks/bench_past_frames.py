@@ -0,0 +1,95 @@
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+import mock_pyds
+mock_pyds.install()
+
+from common.log import setup_logging
+from common.probe import FrameProcessor
+from common.replay import ReplayFrame, synthetic_frames
+from common.zones import Zone
+from bench_roi_engine import ROI, TIMEOUT
+
+# maxTargetsPerStream in config/config_tracker_NvDCF_perf.yml
+NUM_TARGETS = 150
+# maxShadowTrackingAge in the same file
+MAX_SHADOW_FRAMES = 30
+
+
+def make_batches(num_frames, shadow_rate, seed=0):
+    """One stream with NUM_TARGETS people. Each frame a visible track goes
+    into shadow mode with probability shadow_rate for up to
+    MAX_SHADOW_FRAMES frames: it is missing from the frames meanwhile, and
+    the batch it is reported in again carries its past-frame metadata."""
+    rng = np.random.default_rng(seed)
+    frames = synthetic_frames(NUM_TARGETS, num_frames, seed=seed)
+    shadow_until = np.full(NUM_TARGETS, -1)
+    shadowed = [[] for _ in range(NUM_TARGETS)]
+    batches = []
+    past_frames = 0
+    for frame in frames:
+        objects = []
+        past_tracks = []
+        start = rng.random(NUM_TARGETS) < shadow_rate
+        for i, obj in enumerate(frame.objects):
+            object_id, class_id, left, top, width, height, confidence, label = obj
+            if shadow_until[i] < frame.frame_num and start[i]:
+                shadow_until[i] = frame.frame_num + rng.integers(1, MAX_SHADOW_FRAMES + 1)
+            if shadow_until[i] >= frame.frame_num:
+                shadowed[i].append(mock_pyds.NvDsPastFrameObj(frame.frame_num, left, top, width, height, 0.3, 0))
+                continue
+            if shadowed[i]:
+                past_tracks.append(mock_pyds.NvDsPastFrameObjList(object_id, class_id, label, shadowed[i]))
+                past_frames += len(shadowed[i])
+                shadowed[i] = []
+            objects.append(obj)
+        user_metas = []
+        if past_tracks:
+            past_batch = mock_pyds.NvDsPastFrameObjBatch([mock_pyds.NvDsPastFrameObjStream(0, past_tracks)])
+            user_metas.append(mock_pyds.NvDsUserMeta(mock_pyds.NvDsMetaType.NVDS_TRACKER_PAST_FRAME_META,
+                                                     past_batch))
+        batch = mock_pyds.batch_from_replay([ReplayFrame(0, frame.frame_num, frame.pts, 0, objects)])
+        batch.batch_user_meta_list = mock_pyds.link(user_metas)
+        batches.append(batch)
+    return batches, past_frames / len(batches)
+
+
+def run(batches, past_frame_meta, track_history, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        processor = FrameProcessor(Zone.from_rect("ROI", ROI, TIMEOUT), annotate=False,
+                                   track_history=track_history)
+        processor.past_tracking_meta = int(past_frame_meta)
+        processor.add_stream(0)
+        start = time.perf_counter()
+        for batch_meta in batches:
+            processor.process_batch(batch_meta)
+        best = min(best, (time.perf_counter() - start) / len(batches))
+    history = processor.histories.get(0)
+    return best, history.nbytes if history is not None else 0
+
+
+def main():
+    setup_logging('warning')
+    logging.getLogger('deepstream').setLevel(logging.WARNING)
+    num_frames = 600
+    print(f"{NUM_TARGETS} targets, shadow tracking up to {MAX_SHADOW_FRAMES} frames")
+    print(f"{'shadow rate':>12} {'past frames/batch':>18} {'ignored us/batch':>17} {'history us/batch':>17} "
+          f"{'folded us/batch':>16} {'history KiB':>12}")
+    for shadow_rate in (0.0, 0.005, 0.02, 0.05):
+        batches, past_per_batch = make_batches(num_frames, shadow_rate)
+        ignored, _ = run(batches, False, 0)
+        history, _ = run(batches, False, 30)
+        folded, nbytes = run(batches, True, 30)
+        print(f"{shadow_rate:>12.3f} {past_per_batch:>18.1f} {ignored * 1e6:>17.1f} {history * 1e6:>17.1f} "
+              f"{folded * 1e6:>16.1f} {nbytes / 1024:>12.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Probe benchmark suite on mock pyds.
+
+Runs FrameProcessor over synthetic or recorded detections and reports
+us/frame and objects/sec. With --max-us it exits non-zero when any case is
+slower than the budget, so it can guard the Python hot path on CPU-only CI.
+
+    python3 benchmarks/bench_probe.py
+    python3 benchmarks/bench_probe.py --replay meta.jsonl --rate 30
+    python3 benchmarks/bench_probe.py --streams 4 --json results.json --max-us 5000
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import mock_pyds
+mock_pyds.install()
+
+from common.log import setup_logging
+from common.metrics import Metrics
+from common.probe import FrameProcessor
+from common.replay import ReplayWriter, batch_frames, paced, read_replay, synthetic_frames
+from common.zones import Zone
+from bench_roi_engine import ROI, TIMEOUT
+
+
+def run(frames, batches, num_streams, rate=0.0, repeat=3, annotate=True, metrics=False):
+    # Best of several fresh runs, to keep scheduler noise out of the numbers
+    num_objects = sum(len(frame.objects) for frame in frames)
+    best = float('inf')
+    for _ in range(repeat):
+        processor = FrameProcessor(Zone.from_rect("ROI", ROI, TIMEOUT), annotate=annotate,
+                                   metrics=Metrics() if metrics else None)
+        for stream in range(num_streams):
+            processor.add_stream(stream)
+        elapsed = 0.0
+        for batch_meta in paced(batches, rate):
+            batch_meta.reset()
+            start = time.perf_counter()
+            processor.process_batch(batch_meta)
+            elapsed += time.perf_counter() - start
+        best = min(best, elapsed)
+    return {'us_per_frame': best / len(frames) * 1e6, 'objects_per_sec': num_objects / best if best else 0.0}
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog=args[0])
+    parser.add_argument("--objects", default="10,100,1000", help="comma-separated objects per frame (synthetic)")
+    parser.add_argument("--frames", type=int, default=300, help="frames per stream (synthetic)")
+    parser.add_argument("--streams", type=int, default=1, help="streams per batch (synthetic)")
+    parser.add_argument("--turnover", type=float, default=0.1, help="fraction of tracks replaced per second (synthetic)")
+    parser.add_argument("--replay", help="replay file recorded with test.py --record-meta instead of synthetic data")
+    parser.add_argument("--save-replay", help="write the synthetic detections of the last case to this replay file")
+    parser.add_argument("--rate", type=float, default=0.0, help="batches per second, 0 runs as fast as possible")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--max-us", type=float, help="fail if any case exceeds this many us/frame")
+    opts = parser.parse_args(args[1:])
+    setup_logging('warning')
+    logging.getLogger('deepstream').setLevel(logging.WARNING)
+
+    if opts.replay:
+        header, frames = read_replay(opts.replay)
+        cases = [(os.path.basename(opts.replay), frames)]
+    else:
+        cases = []
+        for num_objects in (int(n) for n in opts.objects.split(',')):
+            frames = synthetic_frames(num_objects, opts.frames, opts.streams, turnover=opts.turnover)
+            cases.append((f"{num_objects} objects", frames))
+            if opts.save_replay:
+                writer = ReplayWriter(opts.save_replay)
+                for frame in frames:
+                    writer.write(frame)
+                writer.close()
+
+    results = []
+    print(f"{'case':>16} {'streams':>8} {'us/frame':>10} {'objects/s':>12} {'no OSD us/frame':>16} {'metrics us/frame':>17}")
+    for name, frames in cases:
+        num_streams = max(frame.stream for frame in frames) + 1
+        batches = [mock_pyds.batch_from_replay(batch) for batch in batch_frames(frames)]
+        osd = run(frames, batches, num_streams, opts.rate, opts.repeat)
+        no_osd = run(frames, batches, num_streams, opts.rate, opts.repeat, annotate=False)
+        with_metrics = run(frames, batches, num_streams, opts.rate, opts.repeat, metrics=True)
+        results.append({'case': name, 'streams': num_streams, 'osd': osd, 'no_osd': no_osd, 'metrics': with_metrics})
+        print(f"{name:>16} {num_streams:>8} {osd['us_per_frame']:>10.1f} {osd['objects_per_sec']:>12.0f} "
+              f"{no_osd['us_per_frame']:>16.1f} {with_metrics['us_per_frame']:>17.1f}")
+
+    if opts.json:
+        with open(opts.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if opts.max_us is not None:
+        slow = [r['case'] for r in results if r['osd']['us_per_frame'] > opts.max_us]
+        if slow:
+            print(f"Over budget of {opts.max_us:.0f} us/frame: {', '.join(slow)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,85 @@
+import logging
+import os
+import statistics
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+import mock_pyds
+mock_pyds.install()
+
+from common.log import get_logger, setup_logging
+from common.probe import FrameProcessor
+from common.replay import batch_frames, synthetic_frames
+from common.zones import Zone
+from bench_roi_engine import ROI, TIMEOUT
+
+log = get_logger('probe')
+
+
+def make_batches(num_objects, num_frames, num_streams=1):
+    frames = synthetic_frames(num_objects, num_frames, num_streams)
+    return [mock_pyds.batch_from_replay(batch) for batch in batch_frames(frames)]
+
+
+class EagerProcessor(FrameProcessor):
+    # One eagerly formatted line per person and frame, which is what the
+    # probe printed before it went through the leveled logger
+    def update_zones(self, stream_id, frame_number, frame_time, zone_monitor, track_ids, boxes, confidences,
+                     debug=False):
+        zone_update, alerts = super().update_zones(stream_id, frame_number, frame_time, zone_monitor, track_ids,
+                                                   boxes, confidences, debug)
+        ratios = np.zeros(len(track_ids))
+        ratios[zone_update.detection] = zone_update.pairs.ratio
+        for track_id, ratio in zip(track_ids.tolist(), ratios.tolist()):
+            log.info(f"Track {track_id}: intersection ratio = {ratio}")
+        return zone_update, alerts
+
+
+def time_run(batches, processor_cls, level, **limits):
+    logging.getLogger('deepstream').setLevel(level)
+    processor = processor_cls(Zone.from_rect("ROI", ROI, TIMEOUT), **limits)
+    processor.add_stream(0)
+    start = time.perf_counter()
+    for batch_meta in batches:
+        batch_meta.reset()
+        processor.process_batch(batch_meta)
+    return (time.perf_counter() - start) / len(batches)
+
+
+def run(batches, variants, repeat=7):
+    # Fresh processors, one warmup run each, then the variants interleaved
+    # in rotating order so drift in CPU clock or load hits them equally;
+    # the median of the repeats is reported
+    for processor_cls, level, limits in variants:
+        time_run(batches, processor_cls, level, **limits)
+    times = [[] for _ in variants]
+    for r in range(repeat):
+        for i in range(len(variants)):
+            index = (i + r) % len(variants)
+            processor_cls, level, limits = variants[index]
+            times[index].append(time_run(batches, processor_cls, level, **limits))
+    return [statistics.median(t) for t in times]
+
+
+def main():
+    with open(os.devnull, 'w') as devnull:
+        setup_logging('warning', devnull)
+        num_frames = 300
+        variants = [(EagerProcessor, logging.INFO, {}),
+                    (FrameProcessor, logging.WARNING, {}),
+                    (FrameProcessor, logging.DEBUG, {}),
+                    (FrameProcessor, logging.DEBUG, {'frame_log_interval': 0.0, 'object_log_every': 1})]
+        print(f"{'objects':>8} {'per-object prints':>18} {'logging off us/frame':>21} {'debug, limited':>15} "
+              f"{'debug, every frame':>19}")
+        for num_objects in (10, 100, 1000):
+            batches = make_batches(num_objects, num_frames)
+            eager, off, limited, unlimited = run(batches, variants)
+            print(f"{num_objects:>8} {eager * 1e6:>18.1f} {off * 1e6:>21.1f} {limited * 1e6:>15.1f} "
+                  f"{unlimited * 1e6:>19.1f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
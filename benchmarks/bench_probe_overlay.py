@@ -0,0 +1,58 @@
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import mock_pyds
+mock_pyds.install()
+
+from common.log import setup_logging
+from common.overlay import StreamOverlay
+from common.probe import FrameProcessor
+from common.zones import Zone
+from bench_probe_logging import make_batches
+from bench_roi_engine import ROI, TIMEOUT
+
+# A few polygon zones besides the ROI, drawn as line outlines
+ZONES = [Zone("Z%d" % i, [(100 + 150 * i, 400), (220 + 150 * i, 420), (200 + 150 * i, 560), (90 + 150 * i, 520)],
+              TIMEOUT) for i in range(4)]
+
+
+class UncachedProcessor(FrameProcessor):
+    # Lays out the overlay on each frame, which is what the probe did
+    # before the overlay was precomputed
+    def process_frame(self, batch_meta, frame_meta, debug=False, frames=None):
+        stream_id = frame_meta.pad_index
+        self.overlays[stream_id] = StreamOverlay(self.zone_monitors[stream_id].zones)
+        super().process_frame(batch_meta, frame_meta, debug, frames)
+
+
+def run(processor_cls, batches, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        processor = processor_cls(Zone.from_rect("ROI", ROI, TIMEOUT), {0: ZONES})
+        processor.add_stream(0)
+        start = time.perf_counter()
+        for batch_meta in batches:
+            batch_meta.reset()
+            processor.process_batch(batch_meta)
+        best = min(best, (time.perf_counter() - start) / len(batches))
+    return best
+
+
+def main():
+    setup_logging('warning')
+    logging.getLogger('deepstream').setLevel(logging.WARNING)
+    num_frames = 300
+    print(f"{'objects':>8} {'uncached us/frame':>18} {'cached us/frame':>16} {'speedup':>8}")
+    for num_objects in (0, 10, 100, 1000):
+        batches = make_batches(num_objects, num_frames)
+        uncached = run(UncachedProcessor, batches)
+        cached = run(FrameProcessor, batches)
+        print(f"{num_objects:>8} {uncached * 1e6:>18.1f} {cached * 1e6:>16.1f} {uncached / cached:>7.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
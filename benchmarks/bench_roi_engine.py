@@ -0,0 +1,71 @@
+import contextlib
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from common.roi import BBox, ROIInspector, BatchROIEngine
+
+ROI = [10.0, 400.0, 500.0, 400.0]
+TIMEOUT = 2.0
+FPS = 30.0
+
+
+def make_frames(num_objects, num_frames, seed=0):
+    # People random-walking over a 1920x1080 frame, so tracks keep
+    # entering and leaving the ROI.
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform([0, 0], [1800, 900], size=(num_objects, 2))
+    size = rng.uniform([40, 80], [120, 240], size=(num_objects, 2))
+    ids = np.arange(num_objects, dtype=np.int64)
+    frames = []
+    for _ in range(num_frames):
+        pos += rng.normal(0.0, 15.0, size=pos.shape)
+        np.clip(pos, 0, [1800, 900], out=pos)
+        frames.append((ids, np.hstack((pos, size))))
+    return frames
+
+
+def run_per_object(frames):
+    inspector = ROIInspector(ROI, TIMEOUT)
+    results = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        for frame_idx, (ids, boxes) in enumerate(frames):
+            now = frame_idx / FPS
+            results.append([inspector.update(int(track_id), BBox(*box), now)
+                            for track_id, box in zip(ids.tolist(), boxes.tolist())])
+        elapsed = time.perf_counter() - start
+    return elapsed, results
+
+
+def run_batched(frames):
+    engine = BatchROIEngine(ROI, TIMEOUT)
+    results = []
+    start = time.perf_counter()
+    for frame_idx, (ids, boxes) in enumerate(frames):
+        results.append(engine.update(ids, boxes, frame_idx / FPS).alert)
+    elapsed = time.perf_counter() - start
+    return elapsed, [r.tolist() for r in results]
+
+
+def main():
+    num_frames = 300
+    print(f"{'objects':>8} {'per-object us/frame':>20} {'batched us/frame':>17} {'speedup':>8} {'alerts':>7}")
+    for num_objects in (10, 100, 1000):
+        frames = make_frames(num_objects, num_frames)
+        t_obj, r_obj = run_per_object(frames)
+        t_batch, r_batch = run_batched(frames)
+        if r_obj != r_batch:
+            sys.stderr.write(f"Mismatch between per-object and batched results at {num_objects} objects\n")
+            return 1
+        alerts = sum(sum(r) for r in r_batch)
+        print(f"{num_objects:>8} {t_obj / num_frames * 1e6:>20.1f} {t_batch / num_frames * 1e6:>17.1f} "
+              f"{t_obj / t_batch:>7.1f}x {alerts:>7}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from common.zones import Zone, ZoneMonitor
+
+FPS = 30.0
+
+
+def rss_kib():
+    # Resident set size of this process, Linux only
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024
+    except (OSError, ValueError):
+        return float('nan')
+
+
+def state_kib(state):
+    return (state._ids.nbytes + sum(getattr(state, name).nbytes for name, _, _ in state._COLUMNS)) / 1024
+
+
+def soak(num_track_ids, concurrent, lifetime, report_every, **limits):
+    # Every track is born inside the zone and disappears there, the case that
+    # leaks without expiry: it is never seen leaving the zone.
+    monitor = ZoneMonitor([Zone.from_rect("ROI", [0, 0, 1920, 1080], 2.0)], **limits)
+    rng = np.random.default_rng(0)
+    boxes = np.hstack((rng.uniform([0, 0], [1800, 900], size=(concurrent, 2)), np.full((concurrent, 2), 80.0)))
+    births_per_frame = max(1, concurrent // lifetime)
+    num_frames = num_track_ids // births_per_frame
+
+    start = time.perf_counter()
+    rows = []
+    for frame in range(num_frames):
+        # A sliding window of ids: each frame retires the oldest tracks and
+        # adds as many new ones
+        first = frame * births_per_frame
+        ids = np.arange(first, first + concurrent, dtype=np.int64)
+        monitor.update(ids, boxes, frame / FPS)
+        if (frame + 1) % report_every == 0 or frame == num_frames - 1:
+            rows.append((first + concurrent, len(monitor.state), state_kib(monitor.state), rss_kib(),
+                         monitor.state.evicted))
+    elapsed = time.perf_counter() - start
+    return rows, elapsed / num_frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay synthetic track ids and report dwell state size")
+    parser.add_argument("--track-ids", type=int, default=2_000_000)
+    parser.add_argument("--concurrent", type=int, default=50, help="tracks visible per frame")
+    parser.add_argument("--lifetime", type=int, default=10, help="frames a track stays visible")
+    parser.add_argument("--baseline-track-ids", type=int, default=200_000,
+                        help="track ids replayed without expiry, to show the growth")
+    opts = parser.parse_args()
+
+    configs = [
+        ("no expiry", opts.baseline_track_ids, {}),
+        ("max_age=2s", opts.track_ids, {'max_age': 2.0}),
+        ("max_age_frames=60", opts.track_ids, {'max_age_frames': 60}),
+        ("max_tracks=500", opts.track_ids, {'max_tracks': 500}),
+    ]
+    for name, num_ids, limits in configs:
+        report_every = max(1, num_ids // (opts.concurrent // opts.lifetime) // 8)
+        rows, per_frame = soak(num_ids, opts.concurrent, opts.lifetime, report_every, **limits)
+        print(f"{name}: {per_frame * 1e6:.1f} us/frame")
+        print(f"  {'track ids seen':>15} {'tracks held':>12} {'state KiB':>10} {'RSS KiB':>10} {'evicted':>10}")
+        for seen, held, kib, rss, evicted in rows:
+            print(f"  {seen:>15} {held:>12} {kib:>10.1f} {rss:>10.0f} {evicted:>10}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import mock_pyds
+mock_pyds.install()
+
+from common.events import EventDispatcher, EventQueue
+from common.health import Backoff
+from common.log import setup_logging
+from common.metrics import Metrics, MetricsExporter
+from common.probe import FrameProcessor
+from common.replay import synthetic_frames
+from common.supervisor import Supervisor, SupervisorLink, plan_shards
+from common.zones import Zone
+from bench_roi_engine import ROI, TIMEOUT
+
+NUM_STREAMS = 8
+NUM_OBJECTS = 100
+NUM_FRAMES = 300
+SOURCES = [f"stream{i}" for i in range(NUM_STREAMS)]
+
+
+class Alerts:
+    # Event sink of the supervisor and of the reference run
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def push(self, event):
+        if event['type'] == 'alert':
+            with self._lock:
+                self.events.append((event['stream'], event['zone'], event['track'], event['frame']))
+
+
+def fake_worker(index, count, socket_path, crash_file=None):
+    # What test.py --shard INDEX/COUNT --supervisor SOCKET does, on replayed
+    # detections instead of decoded video
+    shard = plan_shards(SOURCES, count)[index]
+    link = SupervisorLink(socket_path, index)
+    events = EventDispatcher([link], EventQueue(100000))
+    metrics = MetricsExporter(Metrics(), interval=0.2, publish=link.publish)
+    processor = FrameProcessor(Zone.from_rect("ROI", ROI, TIMEOUT), annotate=False, events=events,
+                               metrics=metrics.metrics)
+    frames = [synthetic_frames(NUM_OBJECTS, NUM_FRAMES, turnover=0.3, seed=stream) for stream in shard.streams]
+    for local in range(len(frames)):
+        processor.add_stream(local)
+    events.start()
+    metrics.start()
+    for frame_idx in range(NUM_FRAMES):
+        if crash_file and frame_idx == NUM_FRAMES // 2 and not os.path.exists(crash_file):
+            # Crash half way on the first run only
+            open(crash_file, 'w').close()
+            os._exit(3)
+        batch = [stream_frames[frame_idx]._replace(stream=local) for local, stream_frames in enumerate(frames)]
+        processor.process_batch(mock_pyds.batch_from_replay(batch))
+    processor.stop()
+    metrics.stop()
+    events.stop()
+    return 0
+
+
+def reference():
+    # Alerts of one process running every stream
+    alerts = Alerts()
+    processor = FrameProcessor(Zone.from_rect("ROI", ROI, TIMEOUT), annotate=False, events=alerts)
+    frames = [synthetic_frames(NUM_OBJECTS, NUM_FRAMES, turnover=0.3, seed=stream) for stream in range(NUM_STREAMS)]
+    for stream in range(NUM_STREAMS):
+        processor.add_stream(stream)
+    start = time.perf_counter()
+    for frame_idx in range(NUM_FRAMES):
+        batch = [stream_frames[frame_idx]._replace(stream=stream) for stream, stream_frames in enumerate(frames)]
+        processor.process_batch(mock_pyds.batch_from_replay(batch))
+    return alerts.events, time.perf_counter() - start
+
+
+def supervise(directory, workers, crash=None):
+    shards = plan_shards(SOURCES, workers)
+
+    def command(shard, socket_path):
+        argv = [sys.executable, os.path.abspath(__file__), '--fake-worker', f"{shard.index}/{len(shards)}",
+                socket_path]
+        if shard.index == crash:
+            argv += ['--crash-file', os.path.join(directory, f'crashed{workers}')]
+        return argv
+
+    alerts = Alerts()
+    supervisor = Supervisor(shards, command, os.path.join(directory, f'ipc{workers}.sock'), alerts,
+                            Backoff(initial=0.5), stop_timeout=5.0)
+    start = time.monotonic()
+    supervisor.start(start)
+    while not supervisor.finished and time.monotonic() - start < 300:
+        supervisor.poll(time.monotonic())
+        time.sleep(0.02)
+    elapsed = time.monotonic() - start
+    supervisor.stop()
+    return supervisor, alerts.events, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fake-worker", metavar="INDEX/COUNT")
+    parser.add_argument("socket", nargs="?")
+    parser.add_argument("--crash-file")
+    opts = parser.parse_args()
+    if opts.fake_worker:
+        index, count = map(int, opts.fake_worker.split('/'))
+        return fake_worker(index, count, opts.socket, opts.crash_file)
+
+    setup_logging('error')
+    expected, solo = reference()
+    total_frames = NUM_STREAMS * NUM_FRAMES
+    print(f"{NUM_STREAMS} streams x {NUM_FRAMES} frames, {NUM_OBJECTS} objects, {len(expected)} alerts; "
+          f"{os.cpu_count()} CPU(s); one process in-line: {solo:.2f}s, {total_frames / solo:.0f} frames/s")
+    print(f"{'workers':>8} {'wall s':>7} {'frames/s':>9} {'alerts':>7} {'missing':>8} {'extra':>6} "
+          f"{'streams in metrics':>19} {'messages':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for workers in (1, 2, 4):
+            supervisor, alerts, elapsed = supervise(directory, workers)
+            snap = supervisor.aggregate()
+            frames = sum(s['frames'] for s in snap['streams'].values())
+            print(f"{workers:>8} {elapsed:>7.2f} {frames / elapsed:>9.0f} {len(alerts):>7} "
+                  f"{len(set(expected) - set(alerts)):>8} {len(set(alerts) - set(expected)):>6} "
+                  f"{len(snap['streams']):>19} {supervisor.messages:>9}")
+
+        # Worker 1 crashes half way: the supervisor restarts it after the
+        # backoff and the other workers carry on
+        supervisor, alerts, elapsed = supervise(directory, 4, crash=1)
+        crashed = set(plan_shards(SOURCES, 4)[1].streams)
+        others = [a for a in alerts if a[0] not in crashed]
+        print(f"crash of worker 1: {supervisor.stats()['workers']}; {elapsed:.2f}s, "
+              f"missing alerts {len(set(expected) - set(alerts))}, other workers' alerts "
+              f"{len(others)}/{sum(1 for a in expected if a[0] not in crashed)}, "
+              f"repeated by the restart {len(alerts) - len(set(alerts))}")
+        text = supervisor.prometheus_text()
+        print(f"prometheus: {sum(line.startswith('ds_stream_fps{') for line in text.splitlines())} stream fps "
+              f"series, {sum(line.startswith('ds_worker_up{') for line in text.splitlines())} worker series")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from common.roi import BatchROIEngine
+from common.zones import Zone, ZoneMonitor
+from bench_roi_engine import make_frames
+
+TIMEOUT = 2.0
+FPS = 30.0
+
+
+def make_zones(num_zones, polygon_share=0.0, seed=1):
+    rng = np.random.default_rng(seed)
+    zones = []
+    for i in range(num_zones):
+        left, top = rng.uniform([0, 0], [1800, 980])
+        width, height = rng.uniform([60, 60], [240, 240])
+        if rng.random() < polygon_share:
+            # Irregular hexagon inscribed in the rectangle
+            cx, cy = left + width / 2, top + height / 2
+            angles = np.sort(rng.uniform(0, 2 * np.pi, 6))
+            points = np.stack((cx + np.cos(angles) * width / 2, cy + np.sin(angles) * height / 2), axis=1)
+            zones.append(Zone(f"zone-{i}", points, TIMEOUT))
+        else:
+            zones.append(Zone.from_rect(f"zone-{i}", [left, top, width, height], TIMEOUT))
+    return zones
+
+
+def run_indexed(zones, frames):
+    monitor = ZoneMonitor(zones)
+    results = []
+    start = time.perf_counter()
+    for frame_idx, (ids, boxes) in enumerate(frames):
+        results.append(monitor.update(ids, boxes, frame_idx / FPS).alert)
+    elapsed = time.perf_counter() - start
+    return elapsed, [r.tolist() for r in results]
+
+
+def run_brute_force(zones, frames):
+    # Every zone tests every box, one vectorized call per zone
+    engines = [BatchROIEngine(z.bounds.tolist(), z.timeout) for z in zones]
+    results = []
+    start = time.perf_counter()
+    for frame_idx, (ids, boxes) in enumerate(frames):
+        alert = np.zeros(len(ids), dtype=bool)
+        for engine in engines:
+            alert |= engine.update(ids, boxes, frame_idx / FPS).alert
+        results.append(alert)
+    elapsed = time.perf_counter() - start
+    return elapsed, [r.tolist() for r in results]
+
+
+def main():
+    num_objects = 100
+    num_frames = 100
+    frames = make_frames(num_objects, num_frames)
+    print(f"{num_objects} objects per frame")
+    print(f"{'zones':>6} {'brute us/frame':>15} {'grid us/frame':>14} {'grid+20% poly us/frame':>23}")
+    for num_zones in (1, 10, 50, 100, 250, 500, 1000):
+        rect_zones = make_zones(num_zones)
+        t_brute, r_brute = run_brute_force(rect_zones, frames)
+        t_grid, r_grid = run_indexed(make_zones(num_zones), frames)
+        if r_brute != r_grid:
+            sys.stderr.write(f"Mismatch between brute-force and indexed results at {num_zones} zones\n")
+            return 1
+        t_mixed, _ = run_indexed(make_zones(num_zones, polygon_share=0.2), frames)
+        print(f"{num_zones:>6} {t_brute / num_frames * 1e6:>15.1f} {t_grid / num_frames * 1e6:>14.1f} "
+              f"{t_mixed / num_frames * 1e6:>23.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""CPU-only check of the TensorRT engine cache naming and lookup.
+
+A change to the computed engine name makes every pipeline rebuild its
+engines at startup, which takes minutes, without any error. This resolves
+the shipped nvinfer config and a throwaway one against a temporary cache
+and checks the name format and the hit, miss and stale cases. Exits
+non-zero if any check fails.
+"""
+import os
+import shutil
+import sys
+import tempfile
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.config import DEFAULT_INFER_CONFIG
+from common.engine import EngineCache, engine_filename, read_infer_config
+from common.log import setup_logging
+
+MODEL_CONFIG = """[property]
+gpu-id=0
+onnx-file=model.onnx
+model-engine-file=model.onnx_b1_gpu0_fp32.engine
+batch-size=1
+network-mode=0
+"""
+
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'w').close()
+
+
+def run_checks(work_dir):
+    results = []
+
+    def check(name, ok):
+        results.append((name, bool(ok)))
+
+    # nvinfer's own naming: <model file>_b<batch>_gpu<id>_<precision>.engine
+    check("name format", engine_filename('/models/model.onnx', 4, 1, 'fp16') == 'model.onnx_b4_gpu1_fp16.engine')
+    shipped = read_infer_config(DEFAULT_INFER_CONFIG)['property']
+    spec = EngineCache(os.path.join(work_dir, 'shipped')).resolve(DEFAULT_INFER_CONFIG, 1)
+    check("shipped config keeps its engine name",
+          os.path.basename(spec.engine_path) == os.path.basename(shipped['model-engine-file']))
+
+    model_dir = os.path.join(work_dir, 'model')
+    os.makedirs(model_dir)
+    config_path = os.path.join(model_dir, 'config_infer.txt')
+    with open(config_path, 'w') as f:
+        f.write(MODEL_CONFIG)
+    touch(os.path.join(model_dir, 'model.onnx'))
+    cache_dir = os.path.join(work_dir, 'engines')
+    cache = EngineCache(cache_dir)
+
+    spec = cache.resolve(config_path, 2)
+    check("miss on an empty cache", not spec.cached and cache.stats() == {'hits': 0, 'misses': 1})
+    check("engine path in the cache directory",
+          spec.engine_path == os.path.join(cache_dir, 'model.onnx_b2_gpu0_fp32.engine'))
+    generated = read_infer_config(spec.config_path)['property']
+    check("generated config points at the engine",
+          generated['model-engine-file'] == spec.engine_path and generated['batch-size'] == '2'
+          and generated['onnx-file'] == os.path.join(model_dir, 'model.onnx'))
+
+    # nvinfer serializes the engine it built next to the model
+    touch(os.path.join(model_dir, os.path.basename(spec.engine_path)))
+    check("store moves a built engine into the cache", cache.store(spec) and os.path.isfile(spec.engine_path))
+    check("hit once stored", cache.resolve(config_path, 2).cached and cache.hits == 1)
+
+    # An engine only fits the batch size, precision, GPU and device it was built for
+    check("stale on another batch size", not cache.resolve(config_path, 4).cached)
+    check("stale on another precision", not cache.resolve(config_path, 2, precision='fp16').cached)
+    check("stale on another GPU", not cache.resolve(config_path, 2, gpu_id=1).cached)
+    check("stale on another device",
+          not EngineCache(cache_dir, device_tag='orin-trt8.6').resolve(config_path, 2).cached)
+    return results
+
+
+def main():
+    # Hits and misses are logged at info and warning level
+    setup_logging('error')
+    work_dir = tempfile.mkdtemp(prefix='engine_cache_')
+    try:
+        results = run_checks(work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    for name, ok in results:
+        print(f"{'ok' if ok else 'FAIL':>4}  {name}")
+    return 0 if all(ok for _, ok in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""Pure-Python stand-in for the parts of pyds the probe uses.
+
+Call install() before importing common.probe so that `import pyds` picks
+this module up. Structures mirror the DeepStream metadata layout: batch ->
+frame list -> object list, plus a display meta pool.
+"""
+import sys
+
+MAX_ELEMENTS_IN_DISPLAY_META = 16
+
+
+def install():
+    sys.modules['pyds'] = sys.modules[__name__]
+
+
+class GList:
+    __slots__ = ('data', 'next')
+
+    def __init__(self, data, next=None):
+        self.data = data
+        self.next = next
+
+
+def link(items):
+    """Build a GList chain from a Python sequence, None when empty."""
+    head = None
+    for item in reversed(items):
+        head = GList(item, head)
+    return head
+
+
+class NvOSD_ColorParams:
+    def __init__(self):
+        self.red = self.green = self.blue = self.alpha = 0.0
+
+    def set(self, red, green, blue, alpha):
+        self.red, self.green, self.blue, self.alpha = red, green, blue, alpha
+
+
+class NvOSD_RectParams:
+    def __init__(self, left=0.0, top=0.0, width=0.0, height=0.0):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.border_width = 0
+        self.border_color = NvOSD_ColorParams()
+        self.has_bg_color = 0
+        self.bg_color = NvOSD_ColorParams()
+
+
+class NvOSD_FontParams:
+    def __init__(self):
+        self.font_name = ""
+        self.font_size = 0
+        self.font_color = NvOSD_ColorParams()
+
+
+class NvOSD_TextParams:
+    def __init__(self):
+        self.display_text = ""
+        self.x_offset = 0
+        self.y_offset = 0
+        self.font_params = NvOSD_FontParams()
+        self.set_bg_clr = 0
+        self.text_bg_clr = NvOSD_ColorParams()
+
+
+class NvOSD_LineParams:
+    def __init__(self):
+        self.x1 = self.y1 = self.x2 = self.y2 = 0
+        self.line_width = 0
+        self.line_color = NvOSD_ColorParams()
+
+
+class _Castable:
+    @classmethod
+    def cast(cls, data):
+        return data
+
+
+class NvDsObjectMeta(_Castable):
+    def __init__(self, object_id, class_id, left, top, width, height, confidence=1.0, obj_label=""):
+        self.object_id = object_id
+        self.class_id = class_id
+        self.confidence = confidence
+        self.obj_label = obj_label
+        self.rect_params = NvOSD_RectParams(left, top, width, height)
+        self.text_params = NvOSD_TextParams()
+
+
+class NvDsDisplayMeta:
+    def __init__(self):
+        self.num_rects = 0
+        self.num_labels = 0
+        self.num_lines = 0
+        self.rect_params = [NvOSD_RectParams() for _ in range(MAX_ELEMENTS_IN_DISPLAY_META)]
+        self.text_params = [NvOSD_TextParams() for _ in range(MAX_ELEMENTS_IN_DISPLAY_META)]
+        self.line_params = [NvOSD_LineParams() for _ in range(MAX_ELEMENTS_IN_DISPLAY_META)]
+
+
+class NvDsFrameMeta(_Castable):
+    def __init__(self, pad_index, frame_num, buf_pts, obj_metas, ntp_timestamp=0):
+        self.pad_index = pad_index
+        self.source_id = pad_index
+        self.batch_id = pad_index
+        self.frame_num = frame_num
+        self.buf_pts = buf_pts
+        self.ntp_timestamp = ntp_timestamp
+        self.num_obj_meta = len(obj_metas)
+        self.obj_meta_list = link(obj_metas)
+        self.display_meta_list = []
+
+
+class NvDsBatchMeta:
+    def __init__(self, frame_metas, user_metas=()):
+        self.frame_meta_list = link(frame_metas)
+        self.batch_user_meta_list = link(list(user_metas))
+        self.num_frames_in_batch = len(frame_metas)
+        # Display metas come from a pool that is reused across batches, as in
+        # DeepStream; the pool is shared by all batches in this process
+        self.display_pool = _DISPLAY_POOL
+        self.display_pool_used = 0
+
+    def reset(self):
+        # Return display metas to the pool so a batch can be processed again
+        self.display_pool_used = 0
+        l_frame = self.frame_meta_list
+        while l_frame is not None:
+            l_frame.data.display_meta_list.clear()
+            l_frame = l_frame.next
+
+
+_DISPLAY_POOL = []
+
+
+def batch_from_replay(frames):
+    """NvDsBatchMeta holding one batch of common.replay.ReplayFrame."""
+    frame_metas = []
+    for frame in frames:
+        objs = [NvDsObjectMeta(object_id, class_id, left, top, width, height, confidence, label)
+                for object_id, class_id, left, top, width, height, confidence, label in frame.objects]
+        frame_metas.append(NvDsFrameMeta(frame.stream, frame.frame_num, frame.pts, objs, frame.ntp))
+    return NvDsBatchMeta(frame_metas)
+
+
+def nvds_acquire_display_meta_from_pool(batch_meta):
+    pool = batch_meta.display_pool
+    if batch_meta.display_pool_used == len(pool):
+        pool.append(NvDsDisplayMeta())
+    display_meta = pool[batch_meta.display_pool_used]
+    batch_meta.display_pool_used += 1
+    display_meta.num_rects = display_meta.num_labels = display_meta.num_lines = 0
+    return display_meta
+
+
+def nvds_add_display_meta_to_frame(frame_meta, display_meta):
+    frame_meta.display_meta_list.append(display_meta)
+
+
+def get_string(value):
+    return value
+
+
+class NvDsMetaType:
+    NVDS_TRACKER_PAST_FRAME_META = 'NVDS_TRACKER_PAST_FRAME_META'
+
+
+class NvDsBaseMeta:
+    def __init__(self, meta_type):
+        self.meta_type = meta_type
+
+
+class NvDsUserMeta(_Castable):
+    def __init__(self, meta_type, user_meta_data):
+        self.base_meta = NvDsBaseMeta(meta_type)
+        self.user_meta_data = user_meta_data
+
+
+class NvDsPastFrameObj:
+    def __init__(self, frameNum, left, top, width, height, confidence, age):
+        self.frameNum = frameNum
+        self.tBbox = NvOSD_RectParams(left, top, width, height)
+        self.confidence = confidence
+        self.age = age
+
+
+class NvDsPastFrameObjList(_Castable):
+    def __init__(self, uniqueId, classId, objLabel, past_objs):
+        self.uniqueId = uniqueId
+        self.classId = classId
+        self.objLabel = objLabel
+        self.numObj = len(past_objs)
+        self._items = past_objs
+
+    @staticmethod
+    def list(obj_list):
+        return iter(obj_list._items)
+
+
+class NvDsPastFrameObjStream(_Castable):
+    def __init__(self, streamID, obj_lists):
+        self.streamID = streamID
+        self.surfaceStreamID = streamID
+        self.numFilled = len(obj_lists)
+        self._items = obj_lists
+
+    @staticmethod
+    def list(stream):
+        return iter(stream._items)
+
+
+class NvDsPastFrameObjBatch(_Castable):
+    def __init__(self, streams):
+        self.numFilled = len(streams)
+        self._items = streams
+
+    @staticmethod
+    def list(batch):
+        return iter(batch._items)
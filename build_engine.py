@@ -0,0 +1,63 @@
+import sys
+sys.path.append('../')
+import argparse
+import time
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+from common.config import DEFAULT_INFER_CONFIG
+from common.engine import PRECISIONS, EngineCache
+from common.log import get_logger, setup_logging
+
+log = get_logger('engine')
+
+
+def build(config_path, batch_size):
+    # nvinfer builds and serializes a missing engine when it starts, so a
+    # one-buffer test pipeline through it is enough
+    Gst.init(None)
+    pipeline = Gst.parse_launch(
+        "videotestsrc num-buffers=1 ! nvvideoconvert ! video/x-raw(memory:NVMM),format=NV12,width=1920,height=1080 "
+        f"! mux.sink_0 nvstreammux name=mux batch-size={batch_size} width=1920 height=1080 "
+        f"batched-push-timeout=40000 ! nvinfer config-file-path={config_path} ! fakesink")
+    pipeline.set_state(Gst.State.PLAYING)
+    message = pipeline.get_bus().timed_pop_filtered(Gst.CLOCK_TIME_NONE,
+                                                    Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    pipeline.set_state(Gst.State.NULL)
+    if message.type == Gst.MessageType.ERROR:
+        err, debug = message.parse_error()
+        log.error("%s: %s", err, debug)
+        return False
+    return True
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog=args[0], description="Pre-build the TensorRT engines the pipeline needs")
+    parser.add_argument("--batch-size", type=int, action="append", required=True,
+                        help="batch size (number of sources) to build for, repeatable")
+    parser.add_argument("--config", default=DEFAULT_INFER_CONFIG,
+                        help="nvinfer config (default: config/config_infer_peoplenet.txt)")
+    parser.add_argument("--engine-cache", help="engine directory (default: next to the model)")
+    parser.add_argument("--gpu-id", type=int)
+    parser.add_argument("--precision", choices=list(PRECISIONS.values()))
+    opts = parser.parse_args(args[1:])
+    setup_logging('info')
+
+    cache = EngineCache(opts.engine_cache)
+    failed = 0
+    for batch_size in opts.batch_size:
+        spec = cache.resolve(opts.config, batch_size, opts.gpu_id, opts.precision)
+        if spec.cached:
+            continue
+        start = time.monotonic()
+        if build(spec.config_path, batch_size) and cache.store(spec):
+            log.info("Built %s in %.1fs", spec.engine_path, time.monotonic() - start)
+        else:
+            log.error("Unable to build %s", spec.engine_path)
+            failed += 1
+    log.info("Engine cache: %s", cache.stats())
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
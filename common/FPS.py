@@ -16,51 +16,62 @@
 ################################################################################
 
 import time
-from threading import Lock
+from common.log import get_logger
 start_time=time.time()
 
-fps_mutex = Lock()
+log = get_logger('perf')
 
 class GETFPS:
+    # frame_count only grows and is only written by the streaming thread;
+    # get_fps() works on the difference since its previous call, so the
+    # two sides never need a lock
     def __init__(self,stream_id):
         global start_time
         self.start_time=start_time
         self.is_first=True
         self.frame_count=0
+        self.last_count=0
         self.stream_id=stream_id
 
     def update_fps(self):
-        end_time = time.time()
         if self.is_first:
-            self.start_time = end_time
+            self.start_time = time.time()
             self.is_first = False
         else:
-            global fps_mutex
-            with fps_mutex:
-                self.frame_count = self.frame_count + 1
+            self.frame_count = self.frame_count + 1
 
     def get_fps(self):
         end_time = time.time()
-        with fps_mutex:
-            stream_fps = float(self.frame_count/(end_time - self.start_time))
-            self.frame_count = 0
+        frame_count = self.frame_count
+        elapsed = end_time - self.start_time
+        stream_fps = float((frame_count - self.last_count)/elapsed) if elapsed > 0 else 0.0
+        self.last_count = frame_count
         self.start_time = end_time
         return round(stream_fps, 2)
 
     def print_data(self):
-        print('frame_count=',self.frame_count)
-        print('start_time=',self.start_time)
+        log.info("frame_count=%d start_time=%f", self.frame_count, self.start_time)
 
 class PERF_DATA:
     def __init__(self, num_streams=1):
         self.perf_dict = {}
         self.all_stream_fps = {}
         for i in range(num_streams):
-            self.all_stream_fps["stream{0}".format(i)]=GETFPS(i)
+            self.add_stream(i)
+
+    def add_stream(self, index):
+        self.all_stream_fps["stream{0}".format(index)]=GETFPS(index)
+
+    def remove_stream(self, index):
+        self.all_stream_fps.pop("stream{0}".format(index), None)
+        self.perf_dict.pop("stream{0}".format(index), None)
+
+    def update_perf_dict(self):
+        self.perf_dict = {stream_index:stream.get_fps() for (stream_index, stream) in list(self.all_stream_fps.items())}
+        return self.perf_dict
 
     def perf_print_callback(self):
-        self.perf_dict = {stream_index:stream.get_fps() for (stream_index, stream) in self.all_stream_fps.items()}
-        print ("\n**PERF: ", self.perf_dict, "\n")
+        log.info("**PERF: %s", self.update_perf_dict())
         return True
     
     def update_fps(self, stream_index):
@@ -0,0 +1,347 @@
+"""Frame analytics fed from the probe's per-frame object arrays.
+
+The probe walks each frame's object list once and hands the result to
+AnalyticsEngine.process() as a FrameData of NumPy arrays. Every registered
+Analytic works on that same data, with box anchors computed once per frame,
+so adding an analytic adds vectorized work but no pass over the metadata.
+"""
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from common.roi import UNTRACKED_OBJECT_ID
+from common.zones import ZoneMonitor, ZoneUpdate
+
+# Class names for PeopleNet's class IDs
+CLASS_NAMES = ('person', 'bag', 'face')
+
+
+class FrameData(NamedTuple):
+    stream: int
+    frame_num: int
+    time: float                 # frame time, see FrameClock
+    track_ids: np.ndarray       # per object
+    class_ids: np.ndarray
+    boxes: np.ndarray           # (n, 4) left, top, width, height
+    anchors: np.ndarray         # (n, 2) bottom center of the boxes, where people stand
+    persons: np.ndarray         # mask of the objects the zones are checked for
+    zone_monitor: ZoneMonitor
+    zone_update: Optional[ZoneUpdate]  # detection indexes refer to the persons, None without persons
+
+
+class Analytic:
+    """Base class of the analytics an AnalyticsEngine runs.
+
+    process() is called on the streaming thread for every frame;
+    snapshot() is called from the metrics thread and only reads.
+    """
+
+    name = ''
+
+    def add_stream(self, stream: int):
+        pass
+
+    def remove_stream(self, stream: int):
+        pass
+
+    def process(self, frame: FrameData):
+        raise NotImplementedError
+
+    def snapshot(self) -> dict:
+        return {}
+
+
+class AnalyticsEngine:
+    def __init__(self, analytics: Sequence[Analytic] = ()):
+        self.analytics: List[Analytic] = []
+        self.streams = set()
+        for analytic in analytics:
+            self.register(analytic)
+
+    def register(self, analytic: Analytic):
+        if any(a.name == analytic.name for a in self.analytics):
+            raise ValueError(f"Analytic {analytic.name!r} is already registered")
+        self.analytics.append(analytic)
+        for stream in self.streams:
+            analytic.add_stream(stream)
+
+    def add_stream(self, stream: int):
+        self.streams.add(stream)
+        for analytic in self.analytics:
+            analytic.add_stream(stream)
+
+    def remove_stream(self, stream: int):
+        self.streams.discard(stream)
+        for analytic in self.analytics:
+            analytic.remove_stream(stream)
+
+    def process(self, stream, frame_num, frame_time, track_ids, class_ids, boxes, persons, zone_monitor,
+                zone_update=None):
+        anchors = np.empty((len(boxes), 2), dtype=np.float64)
+        anchors[:, 0] = boxes[:, 0] + boxes[:, 2] / 2
+        anchors[:, 1] = boxes[:, 1] + boxes[:, 3]
+        frame = FrameData(stream, frame_num, frame_time, track_ids, class_ids, boxes, anchors, persons,
+                          zone_monitor, zone_update)
+        for analytic in self.analytics:
+            analytic.process(frame)
+
+    def snapshot(self) -> dict:
+        return {analytic.name: analytic.snapshot() for analytic in self.analytics}
+
+
+class ClassCounts(Analytic):
+    """Objects per class in the latest frame and summed over all frames of each stream."""
+
+    name = 'class_counts'
+
+    def __init__(self, class_names: Sequence[str] = CLASS_NAMES):
+        self.class_names = list(class_names)
+        self.current: Dict[int, np.ndarray] = {}
+        self.totals: Dict[int, np.ndarray] = {}
+
+    def add_stream(self, stream: int):
+        self.current[stream] = np.zeros(len(self.class_names), dtype=np.int64)
+        self.totals[stream] = np.zeros(len(self.class_names), dtype=np.int64)
+
+    def remove_stream(self, stream: int):
+        self.current.pop(stream, None)
+        self.totals.pop(stream, None)
+
+    def process(self, frame: FrameData):
+        counts = np.bincount(frame.class_ids, minlength=len(self.class_names))[:len(self.class_names)]
+        self.current[frame.stream] = counts
+        self.totals[frame.stream] += counts
+
+    def snapshot(self) -> dict:
+        return {str(stream): {'current': dict(zip(self.class_names, self.current[stream].tolist())),
+                              'total': dict(zip(self.class_names, totals.tolist()))}
+                for stream, totals in list(self.totals.items())}
+
+
+class _OccupancyState:
+    def __init__(self, zones, start: float):
+        self.zones = zones
+        self.current = np.zeros(len(zones), dtype=np.int64)
+        self.bucket_start = start
+        self.frames = 0
+        self.sum = np.zeros(len(zones), dtype=np.int64)
+        self.max = np.zeros(len(zones), dtype=np.int64)
+
+
+class ZoneOccupancy(Analytic):
+    """People inside each zone per frame, and its mean and maximum per
+    interval seconds of frame time for the last `history` intervals."""
+
+    name = 'occupancy'
+
+    def __init__(self, interval: float = 60.0, history: int = 60):
+        self.interval = interval
+        self.history = history
+        self.state: Dict[int, _OccupancyState] = {}
+        # (interval start, {zone id: (mean, max)}) per stream, oldest first
+        self.series: Dict[int, deque] = {}
+
+    def add_stream(self, stream: int):
+        self.series[stream] = deque(maxlen=self.history)
+        self.state.pop(stream, None)
+
+    def remove_stream(self, stream: int):
+        self.state.pop(stream, None)
+        self.series.pop(stream, None)
+
+    def process(self, frame: FrameData):
+        zones = frame.zone_monitor.zones
+        state = self.state.get(frame.stream)
+        if state is None or state.zones is not zones:
+            # New stream or reloaded zones
+            state = self.state[frame.stream] = _OccupancyState(zones, frame.time)
+        elif frame.time >= state.bucket_start + self.interval:
+            self._close_bucket(frame.stream, state, frame.time)
+
+        update = frame.zone_update
+        if update is not None:
+            counts = np.bincount(update.zone[update.inside], minlength=len(zones))
+        else:
+            counts = np.zeros(len(zones), dtype=np.int64)
+        state.current = counts
+        state.frames += 1
+        state.sum += counts
+        np.maximum(state.max, counts, out=state.max)
+
+    def _close_bucket(self, stream: int, state: _OccupancyState, now: float):
+        if state.frames:
+            mean = (state.sum / state.frames).tolist()
+            self.series[stream].append((state.bucket_start, {zone.zone_id: (m, x) for zone, m, x in
+                                                             zip(state.zones, mean, state.max.tolist())}))
+        # Intervals without frames are skipped
+        state.bucket_start += self.interval * ((now - state.bucket_start) // self.interval)
+        state.frames = 0
+        state.sum[:] = 0
+        state.max[:] = 0
+
+    def snapshot(self) -> dict:
+        snapshot = {}
+        for stream, state in list(self.state.items()):
+            series = self.series.get(stream, ())
+            snapshot[str(stream)] = {
+                'current': {zone.zone_id: count for zone, count in zip(state.zones, state.current.tolist())},
+                'intervals': [{'start': start, 'zones': {zone_id: {'mean': mean, 'max': peak}
+                                                         for zone_id, (mean, peak) in zones.items()}}
+                              for start, zones in list(series)],
+            }
+        return snapshot
+
+
+class Line:
+    """A counting line from p1 to p2. Crossings toward the right-hand side
+    of the line, seen on screen walking from p1 to p2, count as 'in', the
+    others as 'out'."""
+
+    def __init__(self, line_id: str, p1: Tuple[float, float], p2: Tuple[float, float]):
+        self.line_id = line_id
+        self.p1 = np.asarray(p1, dtype=np.float64)
+        self.p2 = np.asarray(p2, dtype=np.float64)
+        if np.array_equal(self.p1, self.p2):
+            raise ValueError(f"Line {line_id}: the end points must differ")
+
+
+def parse_lines(data) -> Dict[int, List[Line]]:
+    """Lines per stream from either a list of {"id", "points": [[x1, y1], [x2, y2]]}
+    objects (applied to stream 0) or a mapping of stream index to such a list."""
+    if isinstance(data, list):
+        data = {'0': data}
+    if not isinstance(data, dict):
+        raise ValueError("Expected a list of lines or a mapping of stream index to lines")
+    lines = {}
+    for stream, specs in data.items():
+        lines[int(stream)] = []
+        for spec in specs:
+            (x1, y1), (x2, y2) = spec['points']
+            lines[int(stream)].append(Line(str(spec['id']), (float(x1), float(y1)), (float(x2), float(y2))))
+    return lines
+
+
+class _TrackPositions:
+    # Last anchor of every track of one stream, sorted by track id, and the
+    # last side of each line it was on: -1 or 1, 0 while it has only been on the line
+
+    def __init__(self, num_lines: int):
+        self.ids = np.empty(0, dtype=np.uint64)
+        self.points = np.empty((0, 2), dtype=np.float64)
+        self.sides = np.empty((0, num_lines), dtype=np.int8)
+        self.last_frame = np.empty(0, dtype=np.int64)
+
+
+class LineCrossing(Analytic):
+    """Directional counts of person tracks crossing lines.
+
+    A crossing is the segment between a track's anchor in its previous and
+    current frame intersecting the line, tested for all tracks and lines of
+    a stream at once. A track stopping on a line keeps the side it came
+    from, so it is only counted once it leaves on the other side. Tracks
+    not seen for max_idle frames are forgotten.
+    """
+
+    name = 'line_crossing'
+
+    def __init__(self, lines: Dict[int, List[Line]], max_idle: int = 300):
+        self.lines = lines
+        self.max_idle = max_idle
+        self.tracks: Dict[int, _TrackPositions] = {}
+        self.frames: Dict[int, int] = {}
+        # Per stream, (lines, 2) counts of 'in' and 'out' crossings
+        self.counts: Dict[int, np.ndarray] = {}
+        # Start point and direction of the lines per stream, as arrays
+        self._lines_geometry: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def add_stream(self, stream: int):
+        self.tracks[stream] = _TrackPositions(len(self.lines.get(stream, [])))
+        self.frames[stream] = 0
+        self.counts[stream] = np.zeros((len(self.lines.get(stream, [])), 2), dtype=np.int64)
+
+    def remove_stream(self, stream: int):
+        self.tracks.pop(stream, None)
+        self.frames.pop(stream, None)
+        self.counts.pop(stream, None)
+
+    def process(self, frame: FrameData):
+        lines = self.lines.get(frame.stream)
+        if not lines:
+            return
+        tracks = self.tracks[frame.stream]
+        self.frames[frame.stream] += 1
+        now = self.frames[frame.stream]
+        ids = frame.track_ids[frame.persons]
+        points = frame.anchors[frame.persons]
+        tracked = ids != UNTRACKED_OBJECT_ID
+        if not tracked.all():
+            ids, points = ids[tracked], points[tracked]
+        sides = self._sides(frame.stream, lines, points)
+
+        idx = np.searchsorted(tracks.ids, ids)
+        found = idx < len(tracks.ids)
+        found[found] = tracks.ids[idx[found]] == ids[found]
+        if found.any():
+            if found.all():
+                rows, sides_found, points_found = idx, sides, points
+            else:
+                rows, sides_found, points_found = idx[found], sides[found], points[found]
+            # On the line, a track keeps its last side
+            last_sides = tracks.sides[rows]
+            moved = np.where(sides_found != 0, sides_found, last_sides)
+            self._count(frame.stream, lines, tracks.points[rows], points_found, last_sides, moved)
+            tracks.points[rows] = points_found
+            tracks.sides[rows] = moved
+            tracks.last_frame[rows] = now
+
+        keep = tracks.last_frame >= now - self.max_idle
+        # A track id seen twice in the frame is added once
+        new_ids, first = np.unique(ids[~found], return_index=True)
+        if len(new_ids) or not keep.all():
+            new = np.flatnonzero(~found)[first]
+            all_ids = np.concatenate((tracks.ids[keep], new_ids))
+            all_points = np.concatenate((tracks.points[keep], points[new]))
+            all_sides = np.concatenate((tracks.sides[keep], sides[new]))
+            all_frames = np.concatenate((tracks.last_frame[keep], np.full(len(new_ids), now, dtype=np.int64)))
+            order = np.argsort(all_ids, kind='stable')
+            tracks.ids, tracks.points = all_ids[order], all_points[order]
+            tracks.sides, tracks.last_frame = all_sides[order], all_frames[order]
+
+    def _sides(self, stream: int, lines: List[Line], points: np.ndarray) -> np.ndarray:
+        # Side of each line (columns) each point (rows) is on: -1, 0 on the line or 1
+        p1, d = self._geometry(stream, lines)
+        cross = d[:, :1] * (points[:, 1] - p1[:, 1:]) - d[:, 1:] * (points[:, 0] - p1[:, :1])
+        return ((cross > 0).view(np.int8) - (cross < 0).view(np.int8)).T
+
+    def _count(self, stream: int, lines: List[Line], start: np.ndarray, end: np.ndarray,
+               before: np.ndarray, after: np.ndarray):
+        # before and after are the (tracks, lines) last sides before and after the move
+        p1, d = self._geometry(stream, lines)
+        track_idx, line_idx = np.nonzero((before != 0) & (before != after))
+        if len(line_idx) == 0:
+            return
+        # The infinite line was crossed; check that the move passes between the end points
+        move = end[track_idx] - start[track_idx]
+        to_p1 = p1[line_idx] - start[track_idx]
+        to_p2 = to_p1 + d[line_idx]
+        end1 = move[:, 0] * to_p1[:, 1] - move[:, 1] * to_p1[:, 0]
+        end2 = move[:, 0] * to_p2[:, 1] - move[:, 1] * to_p2[:, 0]
+        crossed = end1 * end2 <= 0
+        line_idx = line_idx[crossed]
+        inward = after[track_idx[crossed], line_idx] > 0
+        counts = self.counts[stream]
+        counts[:, 0] += np.bincount(line_idx[inward], minlength=len(lines))
+        counts[:, 1] += np.bincount(line_idx[~inward], minlength=len(lines))
+
+    def _geometry(self, stream: int, lines: List[Line]):
+        geometry = self._lines_geometry.get(stream)
+        if geometry is None:
+            p1 = np.array([line.p1 for line in lines])
+            geometry = self._lines_geometry[stream] = (p1, np.array([line.p2 for line in lines]) - p1)
+        return geometry
+
+    def snapshot(self) -> dict:
+        return {str(stream): {line.line_id: {'in': int(c_in), 'out': int(c_out)}
+                              for line, (c_in, c_out) in zip(self.lines.get(stream, []), counts.tolist())}
+                for stream, counts in list(self.counts.items())}
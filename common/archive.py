@@ -0,0 +1,280 @@
+"""Scanning recorded video archives for alerts as fast as the pipeline runs.
+
+The files of a directory or manifest are fed through the multi-input
+pipeline, up to one per batch slot, without syncing to the clock. When a
+file ends its slot drains and is handed the next file. Every finished file
+appends one line to a JSON lines report
+
+    {"path": ..., "size": ..., "mtime": ..., "status": "ok", "frames": 9000,
+     "alerts": 3, "zones": {"ROI": 2, "gate": 1}, "events": [{"zone": ..., "track": ..., "frame": ..., "time": ...}],
+     "started": <wall time>, "elapsed": 41.2}
+
+and the report is also the checkpoint: a scan started again with the same
+report skips the files recorded as ok (with unchanged size and mtime), so a
+crash costs at most the files that were in flight.
+
+Nothing here touches GStreamer; the pipeline reports decoded buffers, the
+frames its probe saw, file ends and errors, and calls poll() on the main
+loop, which is what benchmarks/bench_archive.py does with a stand-in.
+"""
+import collections
+import json
+import os
+import pathlib
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from common.events import EVENT_ALERT
+from common.log import get_logger
+
+log = get_logger('archive')
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.mov', '.avi', '.ts', '.h264', '.h265', '.264', '.265', '.webm')
+
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+# The scan stopped before the file ended; scanned again on resume
+STATUS_INTERRUPTED = 'interrupted'
+
+
+class ArchiveFile(NamedTuple):
+    path: str              # absolute
+    size: Optional[int]    # None if the file does not exist
+    mtime: float
+
+    @property
+    def uri(self) -> str:
+        return pathlib.Path(self.path).as_uri()
+
+    @classmethod
+    def stat(cls, path: str) -> 'ArchiveFile':
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return cls(path, None, 0.0)
+        return cls(path, st.st_size, st.st_mtime)
+
+
+def find_files(source: str, extensions=VIDEO_EXTENSIONS) -> List[ArchiveFile]:
+    """The video files below a directory, in path order, or the files a
+    manifest lists: a JSON list of paths, or one path per line with # for
+    comments. Relative manifest paths are relative to the manifest."""
+    if os.path.isdir(source):
+        paths = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            paths.extend(os.path.join(root, name) for name in sorted(files)
+                         if os.path.splitext(name)[1].lower() in extensions)
+        return [ArchiveFile.stat(path) for path in paths]
+
+    with open(source) as f:
+        if source.lower().endswith('.json'):
+            paths = json.load(f)
+            if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+                raise ValueError(f"{source}: expected a JSON list of paths")
+        else:
+            paths = [line.strip() for line in f]
+            paths = [path for path in paths if path and not path.startswith('#')]
+    base_dir = os.path.dirname(os.path.abspath(source))
+    seen = set()
+    files = []
+    for path in paths:
+        path = os.path.join(base_dir, os.path.expanduser(path))
+        archive_file = ArchiveFile.stat(path)
+        # A file listed twice is scanned once
+        if archive_file.path not in seen:
+            seen.add(archive_file.path)
+            files.append(archive_file)
+    return files
+
+
+class ArchiveReport:
+    """The per-file report, read back as the checkpoint when resuming.
+
+    Each record is flushed and synced before the next file is reported, and
+    a line cut short by a crash is skipped when reading.
+    """
+
+    def __init__(self, path: str, resume: bool = True):
+        self.path = path
+        # Latest record per path
+        self.records: Dict[str, Dict] = {}
+        if resume and os.path.exists(path):
+            self._load()
+        self._file = open(path, 'a' if resume else 'w')
+
+    def _load(self):
+        with open(self.path) as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    self.records[record['path']] = record
+                except (ValueError, KeyError, TypeError):
+                    log.warning("%s:%d: skipping unreadable record", self.path, number)
+
+    def is_done(self, archive_file: ArchiveFile) -> bool:
+        record = self.records.get(archive_file.path)
+        return (record is not None and record.get('status') == STATUS_OK
+                and record.get('size') == archive_file.size and record.get('mtime') == archive_file.mtime)
+
+    def write(self, record: Dict):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.records[record['path']] = record
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class _Slot:
+    def __init__(self, archive_file: ArchiveFile, now: float):
+        self.file = archive_file
+        self.started = now
+        self.wall_time = time.time()
+        # Buffers that entered the muxer, and frames the probe saw
+        self.decoded = 0
+        self.frames = 0
+        self.last_frame = now
+        self.ended: Optional[float] = None
+        self.error: Optional[str] = None
+        self.events: List[Dict] = []
+
+
+class ArchiveScheduler:
+    """Hands out archive files to batch slots and reports each one.
+
+    The decoder threads call decoded() and ended(), the probe frames() and,
+    as the processor's event sink, push(); the main loop calls next_file(),
+    start() and poll(). A slot whose file ended keeps its file until the
+    probe has seen every buffer that entered the muxer for it and settle
+    seconds have passed (for events of a decoupled worker), or nothing more
+    arrived for drain_timeout seconds, so frames still in flight are not
+    credited to the next file.
+    """
+
+    def __init__(self, files: List[ArchiveFile], report: ArchiveReport, events=None, drain_timeout: float = 2.0,
+                 settle: float = 0.2):
+        self.report = report
+        # Events are passed on, e.g. to an EventDispatcher
+        self.events = events
+        self.drain_timeout = drain_timeout
+        self.settle = settle
+        self.total = len(files)
+        self.skipped = sum(1 for f in files if report.is_done(f))
+        self.pending = collections.deque(f for f in files if not report.is_done(f))
+        self.slots: Dict[int, _Slot] = {}
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return not self.pending and not self.slots
+
+    def next_file(self) -> Optional[ArchiveFile]:
+        """The next file to scan, None when there is none left. Files that
+        do not exist are reported as errors on the way."""
+        while self.pending:
+            archive_file = self.pending.popleft()
+            if archive_file.size is not None:
+                return archive_file
+            self.failed(archive_file, "no such file")
+        return None
+
+    def start(self, slot: int, archive_file: ArchiveFile, now: float):
+        with self._lock:
+            self.slots[slot] = _Slot(archive_file, now)
+        log.info("Scanning %s in slot %d", archive_file.path, slot)
+
+    def failed(self, archive_file: ArchiveFile, error: str):
+        # The file could not even be started
+        with self._lock:
+            for slot, state in list(self.slots.items()):
+                if state.file == archive_file:
+                    del self.slots[slot]
+        self._write(archive_file, STATUS_ERROR, error=error)
+
+    def decoded(self, slot: int):
+        state = self.slots.get(slot)
+        if state is not None:
+            state.decoded += 1
+
+    def frames(self, slots: List[int], now: float):
+        # Pad indexes of the frames of a batch that reached the probe
+        for slot in slots:
+            state = self.slots.get(slot)
+            if state is not None:
+                state.frames += 1
+                state.last_frame = now
+
+    def push(self, event: Dict):
+        if event['type'] == EVENT_ALERT:
+            with self._lock:
+                state = self.slots.get(event['stream'])
+                if state is not None:
+                    state.events.append({'zone': event['zone'], 'track': event['track'],
+                                         'frame': event['frame'], 'time': event['time']})
+        if self.events is not None:
+            self.events.push(event)
+
+    def ended(self, slot: int, now: float, error: Optional[str] = None):
+        state = self.slots.get(slot)
+        if state is not None and state.ended is None:
+            state.ended = now
+            state.error = error
+
+    def poll(self, now: float) -> List[int]:
+        """Report the files that ended and drained; returns their slots,
+        which are free for the next files."""
+        done = []
+        for slot, state in list(self.slots.items()):
+            if state.ended is None:
+                continue
+            quiet = now - max(state.ended, state.last_frame)
+            if quiet < (self.settle if state.frames >= state.decoded else self.drain_timeout):
+                continue
+            self._finish(slot, STATUS_ERROR if state.error else STATUS_OK, now)
+            done.append(slot)
+        return done
+
+    def close(self, now: float):
+        # The scan stopped: files that ended are reported as usual, the
+        # others as interrupted so a resumed scan starts them over
+        for slot, state in list(self.slots.items()):
+            if state.ended is not None:
+                self._finish(slot, STATUS_ERROR if state.error else STATUS_OK, now)
+            else:
+                self._finish(slot, STATUS_INTERRUPTED, now)
+        self.report.close()
+
+    def _finish(self, slot: int, status: str, now: float):
+        with self._lock:
+            state = self.slots.pop(slot)
+        self._write(state.file, status, state, now)
+        log.info("%s %s: %d frames, %d alerts in %.1fs", status, state.file.path, state.frames,
+                 len(state.events), now - state.started)
+
+    def _write(self, archive_file: ArchiveFile, status: str, state: _Slot = None, now: float = None,
+               error: str = None):
+        record = {'path': archive_file.path, 'size': archive_file.size, 'mtime': archive_file.mtime,
+                  'status': status}
+        if state is not None:
+            zones = collections.Counter(event['zone'] for event in state.events)
+            record.update(error=state.error, frames=state.frames, alerts=len(state.events), zones=dict(zones),
+                          events=state.events, started=state.wall_time, elapsed=round(now - state.started, 3))
+        else:
+            record['error'] = error
+        self.report.write(record)
+        self.counts[status] += 1
+        if state is not None:
+            self.counts['frames'] += state.frames
+            self.counts['alerts'] += len(state.events)
+
+    def stats(self) -> Dict:
+        return {'files': self.total, 'skipped': self.skipped, 'pending': len(self.pending),
+                'scanning': len(self.slots), **self.counts}
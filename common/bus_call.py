@@ -16,19 +16,45 @@
 ################################################################################
 
 import gi
-import sys
 gi.require_version('Gst', '1.0')
 from gi.repository import Gst
-def bus_call(bus, message, loop):
+from common.log import get_logger
+
+log = get_logger('bus')
+
+SOURCE_BIN_PREFIX = "source-bin-"
+
+def source_index(element):
+    # Index of the source bin an element belongs to, None outside source bins
+    while element is not None:
+        name = element.get_name()
+        if name and name.startswith(SOURCE_BIN_PREFIX):
+            try:
+                return int(name[len(SOURCE_BIN_PREFIX):])
+            except ValueError:
+                return None
+        element = element.get_parent()
+    return None
+
+def bus_call(bus, message, loop, source_error=None, fatal_error=None):
     t = message.type
     if t == Gst.MessageType.EOS:
-        sys.stdout.write("End-of-stream\n")
+        log.info("End-of-stream")
         loop.quit()
     elif t==Gst.MessageType.WARNING:
         err, debug = message.parse_warning()
-        sys.stderr.write("Warning: %s: %s\n" % (err, debug))
+        log.warning("%s: %s", err, debug)
     elif t == Gst.MessageType.ERROR:
         err, debug = message.parse_error()
-        sys.stderr.write("Error: %s: %s\n" % (err, debug))
-        loop.quit()
+        # Errors inside one source bin are handed to source_error so the
+        # other streams keep running; anything else stops the pipeline
+        index = source_index(message.src) if source_error is not None else None
+        if index is not None:
+            log.error("Source %d: %s: %s", index, err, debug)
+            source_error(index, str(err))
+        else:
+            log.error("%s: %s", err, debug)
+            if fatal_error is not None:
+                fatal_error(str(err))
+            loop.quit()
     return True
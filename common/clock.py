@@ -0,0 +1,47 @@
+import time
+from typing import Dict
+
+NSEC_PER_SEC = 1e9
+
+# pts:  buffer presentation timestamp (frame_meta.buf_pts), follows media time,
+#       so replaying faster than real time still measures dwell correctly
+# ntp:  frame_meta.ntp_timestamp, the capture time reported by the source
+#       (RTCP sender reports) or the streammux system timestamp
+# wall: time.time() when the probe sees the frame
+CLOCK_SOURCES = ('pts', 'ntp', 'wall')
+
+
+class FrameClock:
+    """Turns per-frame timestamps into seconds for dwell tracking.
+
+    Times are kept monotonic per stream: when a source restarts and its
+    timestamps jump backwards, an offset is added so dwell time never goes
+    negative.
+    """
+
+    def __init__(self, source: str = 'pts'):
+        if source not in CLOCK_SOURCES:
+            raise ValueError(f"Unknown clock source '{source}', expected one of {', '.join(CLOCK_SOURCES)}")
+        self.source = source
+        self._offset: Dict[int, float] = {}
+        self._last: Dict[int, float] = {}
+
+    def frame_time(self, stream_id: int, buf_pts: int, ntp_timestamp: int) -> float:
+        if self.source == 'pts':
+            t = buf_pts / NSEC_PER_SEC
+        elif self.source == 'ntp':
+            t = ntp_timestamp / NSEC_PER_SEC if ntp_timestamp else time.time()
+        else:
+            return time.time()
+
+        t += self._offset.get(stream_id, 0.0)
+        last = self._last.get(stream_id)
+        if last is not None and t < last:
+            self._offset[stream_id] = self._offset.get(stream_id, 0.0) + last - t
+            t = last
+        self._last[stream_id] = t
+        return t
+
+    def reset(self, stream_id: int):
+        self._offset.pop(stream_id, None)
+        self._last.pop(stream_id, None)
@@ -0,0 +1,399 @@
+"""Declarative pipeline configuration.
+
+One YAML, TOML or JSON file describes sources, zones, batch size, inference,
+tracker, output, events, metrics and source health (see
+config/pipeline_example.yaml). It is validated once at startup into a
+PipelineConfig, from which the pipeline builds its zone monitors, elements
+and services, so nothing on the streaming threads reads configuration.
+Relative paths are resolved against the directory of the config file.
+"""
+import configparser
+import json
+import os
+from typing import Dict, List, NamedTuple, Optional
+
+from common.analytics import Line, parse_lines
+from common.clock import CLOCK_SOURCES
+from common.evidence import EVIDENCE_FORMATS
+from common.log import LEVELS
+from common.scheduler import SCHEDULE_MODES
+from common.tracker import read_tracker_config
+from common.zones import ROI_ZONE_ID, Zone, parse_zones
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config')
+DEFAULT_INFER_CONFIG = os.path.join(CONFIG_DIR, 'config_infer_peoplenet.txt')
+DEFAULT_TRACKER_CONFIG = os.path.join(CONFIG_DIR, 'config_tracker.txt')
+
+# display: on-screen window, fake: discard frames (throughput runs),
+# file: H.264 in an MP4 file, rtsp: H.264 served over RTSP.
+# Kept here rather than in common.output so a config can be validated
+# without GStreamer.
+OUTPUT_MODES = ('display', 'fake', 'file', 'rtsp')
+
+
+class ConfigError(ValueError):
+    pass
+
+
+class PipelineConfig(NamedTuple):
+    sources: List[str]                # URIs
+    batch_size: int                   # 0: one batch slot per source
+    roi: Optional[Zone]               # first zone of every stream
+    zones: Dict[int, List[Zone]]      # additional zones per stream
+    timeout: float
+    clock: str
+    track_limits: Dict
+    track_history: int                # trajectory entries kept per track, 0 disables
+    infer_config: str
+    engine_cache: Optional[str]
+    idle_interval: int
+    idle_after: float
+    schedule: str
+    tracker: Dict                     # nvtracker properties
+    output_mode: str
+    osd: bool
+    output_file: str
+    bitrate: int
+    rtsp_port: int
+    events: List[str]                 # event sink specs, see common.events.create_sink
+    event_queue_size: int
+    metrics_port: Optional[int]
+    metrics_file: Optional[str]
+    metrics_interval: float
+    control_port: Optional[int]
+    stall_timeout: float
+    reconnect_max_delay: float
+    record_meta: Optional[str]
+    log_level: str
+    class_counts: bool
+    occupancy: bool
+    occupancy_interval: float
+    occupancy_history: int
+    lines: Dict[int, List[Line]]      # counting lines per stream
+    decoupled: bool                   # metadata processed off the streaming thread
+    evidence: Optional[Dict]          # alert image settings, see main() in test.py; None disables
+    archive: Optional[Dict]           # archive scan settings, see common/archive.py; None for a normal run
+    gpu_id: Optional[int]             # GPU of the pipeline's elements, None: the nvinfer config's gpu-id
+    supervisor: Dict                  # worker processes of supervisor.py, see common/supervisor.py
+    latency: Optional[Dict]           # latency budget mode, see common/latency.py; None disables
+
+
+def resolve_path(path: str, base_dir: str) -> str:
+    path = os.path.expanduser(path)
+    return path if os.path.isabs(path) else os.path.normpath(os.path.join(base_dir, path))
+
+
+def read_file(path: str):
+    """Parse a YAML, TOML or JSON file, by extension."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.json':
+        with open(path) as f:
+            try:
+                return json.load(f)
+            except ValueError as e:
+                raise ConfigError(f"{path}: {e}") from e
+    if ext == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            raise ConfigError("TOML configs need Python 3.11 or later, use YAML instead")
+        with open(path, 'rb') as f:
+            try:
+                return tomllib.load(f)
+            except tomllib.TOMLDecodeError as e:
+                raise ConfigError(f"{path}: {e}") from e
+    if ext in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ConfigError("YAML configs need PyYAML (pip3 install pyyaml)")
+        with open(path) as f:
+            try:
+                return yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise ConfigError(f"{path}: {e}") from e
+    raise ConfigError(f"{path}: unknown config format, expected .yaml, .yml, .toml or .json")
+
+
+class _Section:
+    # Takes the keys of one mapping out one by one with type checks, so
+    # whatever is left over at done() is a misspelled or unknown key
+
+    def __init__(self, data, name: str, base_dir: str):
+        if data is None:
+            data = {}
+        if not isinstance(data, dict):
+            raise ConfigError(f"{name or 'config'}: expected a mapping, got {data!r}")
+        self.data = dict(data)
+        self.name = name
+        self.base_dir = base_dir
+
+    def key(self, key: str) -> str:
+        return f"{self.name}.{key}" if self.name else key
+
+    def section(self, key: str) -> '_Section':
+        return _Section(self.data.pop(key, None), self.key(key), self.base_dir)
+
+    def raw(self, key: str):
+        return self.data.pop(key, None)
+
+    def get(self, key: str, kind, default=None, choices=None, minimum=None, required=False):
+        value = self.data.pop(key, None)
+        if value is None:
+            if required:
+                raise ConfigError(f"{self.key(key)}: missing")
+            return default
+        if kind is float and isinstance(value, int) and not isinstance(value, bool):
+            value = float(value)
+        if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+            raise ConfigError(f"{self.key(key)}: expected {kind.__name__}, got {value!r}")
+        if choices is not None and value not in choices:
+            raise ConfigError(f"{self.key(key)}: {value!r} is not one of {', '.join(choices)}")
+        if minimum is not None and value < minimum:
+            raise ConfigError(f"{self.key(key)}: must be at least {minimum}, got {value!r}")
+        return value
+
+    def path(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        value = self.get(key, str, default)
+        return resolve_path(value, self.base_dir) if value is not None else None
+
+    def port(self, key: str, default: Optional[int] = None) -> Optional[int]:
+        port = self.get(key, int, default, minimum=0)
+        if port is not None and port > 65535:
+            raise ConfigError(f"{self.key(key)}: {port} is not a port number")
+        return port
+
+    def strings(self, key: str) -> List[str]:
+        values = self.get(key, list, [])
+        if not all(isinstance(value, str) for value in values):
+            raise ConfigError(f"{self.key(key)}: expected a list of strings")
+        return values
+
+    def done(self):
+        if self.data:
+            raise ConfigError(f"{self.name or 'config'}: unknown key(s) {', '.join(map(str, self.data))}")
+
+
+def _parse_roi(rect, timeout: float, debounce: Dict) -> Zone:
+    if (not isinstance(rect, list) or len(rect) != 4
+            or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in rect)):
+        raise ConfigError(f"roi: expected [left, top, width, height], got {rect!r}")
+    if rect[2] <= 0 or rect[3] <= 0:
+        raise ConfigError(f"roi: width and height must be positive, got {rect!r}")
+    if debounce['exit_overlap'] is not None:
+        debounce = dict(debounce, exit_overlap=min(debounce['exit_overlap'], 0.5))
+    return Zone.from_rect(ROI_ZONE_ID, [float(v) for v in rect], timeout, **debounce)
+
+
+def _parse_zones(data, base_dir: str, timeout: float, debounce: Dict) -> Dict[int, List[Zone]]:
+    # Inline zones, or the path of a zones file in the format of load_zones
+    try:
+        if isinstance(data, str):
+            data = read_file(resolve_path(data, base_dir))
+        zones = parse_zones(data, timeout, debounce)
+    except OSError as e:
+        raise ConfigError(f"zones: {e}") from e
+    except KeyError as e:
+        raise ConfigError(f"zones: missing key {e}") from e
+    except (ValueError, TypeError) as e:
+        raise ConfigError(f"zones: {e}") from e
+    if any(stream < 0 for stream in zones):
+        raise ConfigError("zones: stream indexes must not be negative")
+    return zones
+
+
+def _parse_lines(data, base_dir: str) -> Dict[int, List[Line]]:
+    # Inline lines, or the path of a file with them
+    try:
+        if isinstance(data, str):
+            data = read_file(resolve_path(data, base_dir))
+        return parse_lines(data)
+    except OSError as e:
+        raise ConfigError(f"analytics.lines: {e}") from e
+    except KeyError as e:
+        raise ConfigError(f"analytics.lines: missing key {e}") from e
+    except (ValueError, TypeError) as e:
+        raise ConfigError(f"analytics.lines: {e}") from e
+
+
+def parse_config(data, base_dir: str) -> PipelineConfig:
+    """Validate a config mapping; relative paths are resolved against base_dir."""
+    root = _Section(data, '', base_dir)
+    sources = root.strings('sources')
+    archive = root.section('archive')
+    archive_path = archive.path('path')
+    archive_settings = {
+        'path': archive_path,
+        'report': archive.path('report', 'archive_report.jsonl'),
+        'resume': archive.get('resume', bool, True),
+        'drain_timeout': archive.get('drain_timeout', float, 2.0, minimum=0.0),
+    }
+    archive.done()
+    if archive_path is not None:
+        if sources:
+            raise ConfigError("sources: not used with archive.path, the archive lists the files to scan")
+        if not os.path.exists(archive_path):
+            raise ConfigError(f"archive.path: no such directory or manifest {archive_path}")
+    elif not sources:
+        raise ConfigError("sources: expected at least one video file path or URI")
+    uris = [source if "://" in source else "file://" + resolve_path(source, base_dir) for source in sources]
+    batch_size = root.get('batch_size', int, 0, minimum=0)
+    timeout = root.get('timeout', float, required=True, minimum=0.0)
+    # Defaults of the zones' exit threshold and grace period, see Zone
+    debounce = root.section('debounce')
+    debounce_settings = {
+        'exit_overlap': debounce.get('exit_overlap', float, minimum=0.0),
+        'grace': debounce.get('grace', float, 0.0, minimum=0.0),
+        'grace_frames': debounce.get('grace_frames', int, 0, minimum=0),
+    }
+    if debounce_settings['exit_overlap'] is not None and debounce_settings['exit_overlap'] > 1.0:
+        raise ConfigError("debounce.exit_overlap: must be at most 1")
+    debounce.done()
+    rect = root.raw('roi')
+    roi = _parse_roi(rect, timeout, debounce_settings) if rect is not None else None
+    zone_data = root.raw('zones')
+    zones = _parse_zones(zone_data, base_dir, timeout, debounce_settings) if zone_data is not None else {}
+    clock = root.get('clock', str, 'pts', choices=CLOCK_SOURCES)
+
+    tracks = root.section('tracks')
+    # 0 disables the age limit
+    track_limits = {'max_age': tracks.get('max_age', float, 60.0, minimum=0.0) or None,
+                    'max_tracks': tracks.get('max_tracks', int, minimum=1),
+                    # A new track id inside a zone takes over a track lost
+                    # there at most this many seconds ago and pixels away,
+                    # 0 disables
+                    'reassociate_gap': tracks.get('reassociate_gap', float, 0.0, minimum=0.0),
+                    'reassociate_distance': tracks.get('reassociate_distance', float, 64.0, minimum=0.0)}
+    track_history = tracks.get('history', int, 30, minimum=0)
+    tracks.done()
+
+    inference = root.section('inference')
+    infer_config = inference.path('config', DEFAULT_INFER_CONFIG)
+    if not os.path.isfile(infer_config):
+        raise ConfigError(f"inference.config: no such file {infer_config}")
+    engine_cache = inference.path('engine_cache')
+    idle_interval = inference.get('idle_interval', int, 0, minimum=0)
+    idle_after = inference.get('idle_after', float, 2.0, minimum=0.0)
+    schedule = inference.get('schedule', str, 'interval', choices=SCHEDULE_MODES)
+    gpu_id = inference.get('gpu_id', int, minimum=0)
+    inference.done()
+
+    tracker = root.section('tracker')
+    tracker_config = tracker.path('config', DEFAULT_TRACKER_CONFIG)
+    # Individual [tracker] keys, e.g. enable-past-frame: 1
+    overrides = tracker.get('properties', dict, {})
+    tracker.done()
+    try:
+        tracker_props = read_tracker_config(tracker_config, overrides, base_dir)
+    except (OSError, ValueError, configparser.Error) as e:
+        raise ConfigError(f"tracker: {e}") from e
+
+    output = root.section('output')
+    output_mode = output.get('mode', str, 'display', choices=OUTPUT_MODES)
+    osd = output.get('osd', bool, True)
+    output_file = output.path('file', 'out.mp4')
+    bitrate = output.get('bitrate', int, 4000000, minimum=1)
+    rtsp_port = output.port('rtsp_port', 8554)
+    output.done()
+
+    events = root.section('events')
+    event_sinks = events.strings('sinks')
+    event_queue_size = events.get('queue_size', int, 10000, minimum=1)
+    events.done()
+
+    metrics = root.section('metrics')
+    metrics_port = metrics.port('port')
+    metrics_file = metrics.path('file')
+    metrics_interval = metrics.get('interval', float, 5.0)
+    if metrics_interval <= 0:
+        raise ConfigError("metrics.interval: must be positive")
+    metrics.done()
+
+    control = root.section('control')
+    control_port = control.port('port')
+    control.done()
+
+    health = root.section('health')
+    # 0 disables stall detection and reconnects
+    stall_timeout = health.get('stall_timeout', float, 10.0, minimum=0.0)
+    reconnect_max_delay = health.get('reconnect_max_delay', float, 60.0, minimum=1.0)
+    health.done()
+
+    analytics = root.section('analytics')
+    class_counts = analytics.get('class_counts', bool, False)
+    occupancy = analytics.get('occupancy', bool, False)
+    occupancy_interval = analytics.get('occupancy_interval', float, 60.0)
+    if occupancy_interval <= 0:
+        raise ConfigError("analytics.occupancy_interval: must be positive")
+    occupancy_history = analytics.get('occupancy_history', int, 60, minimum=1)
+    line_data = analytics.raw('lines')
+    lines = _parse_lines(line_data, base_dir) if line_data is not None else {}
+    decoupled = analytics.get('decoupled', bool, False)
+    analytics.done()
+
+    evidence = root.section('evidence')
+    evidence_dir = evidence.path('dir')
+    evidence_settings = {
+        'directory': evidence_dir,
+        'format': evidence.get('format', str, 'jpeg', choices=EVIDENCE_FORMATS),
+        'quality': evidence.get('quality', int, 90, minimum=1),
+        'max_bytes': evidence.get('max_mb', int, 1024, minimum=1) << 20,
+        'crop': evidence.get('crop', bool, True),
+        'margin': evidence.get('margin', float, 0.2, minimum=0.0),
+        'rate': evidence.get('rate', float, 1.0),
+        'burst': evidence.get('burst', int, 5, minimum=1),
+        'workers': evidence.get('workers', int, 2, minimum=1),
+        'queue_size': evidence.get('queue_size', int, 16, minimum=1),
+        'clip_frames': evidence.get('clip_frames', int, 0, minimum=0),
+        'clip_stride': evidence.get('clip_stride', int, 5, minimum=1),
+        'clip_scale': evidence.get('clip_scale', int, 2, minimum=1),
+    }
+    if evidence_settings['quality'] > 100:
+        raise ConfigError("evidence.quality: must be at most 100")
+    if evidence_settings['rate'] <= 0:
+        raise ConfigError("evidence.rate: must be positive")
+    evidence.done()
+
+    supervisor = root.section('supervisor')
+    supervisor_settings = {
+        'workers': supervisor.get('workers', int, 2, minimum=1),
+        'gpus': supervisor.get('gpus', list, []),
+        'socket': supervisor.path('socket'),
+        'restart_max_delay': supervisor.get('restart_max_delay', float, 60.0, minimum=1.0),
+        'stable_after': supervisor.get('stable_after', float, 60.0, minimum=0.0),
+    }
+    if not all(isinstance(gpu, int) and not isinstance(gpu, bool) and gpu >= 0
+               for gpu in supervisor_settings['gpus']):
+        raise ConfigError("supervisor.gpus: expected a list of GPU ids")
+    supervisor.done()
+
+    latency = root.section('latency')
+    latency_settings = {
+        # Seconds from a frame's PTS to the probe, 0 disables
+        'budget': latency.get('budget', float, 0.0, minimum=0.0),
+        'queue_size': latency.get('queue_size', int, 2, minimum=1),
+    }
+    latency.done()
+    if latency_settings['budget'] and archive_path is not None:
+        raise ConfigError("latency.budget: archive scans process every frame, leave it out")
+
+    record_meta = root.path('record_meta')
+    log_level = root.get('log_level', str, 'info', choices=LEVELS)
+    root.done()
+
+    return PipelineConfig(uris, batch_size, roi, zones, timeout, clock, track_limits, track_history, infer_config,
+                          engine_cache, idle_interval, idle_after, schedule, tracker_props, output_mode, osd,
+                          output_file, bitrate, rtsp_port, event_sinks, event_queue_size, metrics_port, metrics_file,
+                          metrics_interval, control_port, stall_timeout, reconnect_max_delay, record_meta,
+                          log_level, class_counts, occupancy, occupancy_interval, occupancy_history, lines,
+                          decoupled, evidence_settings if evidence_dir is not None else None,
+                          archive_settings if archive_path is not None else None, gpu_id, supervisor_settings,
+                          latency_settings if latency_settings['budget'] else None)
+
+
+def load_config(path: str) -> PipelineConfig:
+    try:
+        data = read_file(path)
+    except OSError as e:
+        raise ConfigError(f"Unable to read config {path}: {e}") from e
+    return parse_config(data, os.path.dirname(os.path.abspath(path)))
@@ -0,0 +1,114 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from common.log import get_logger
+
+log = get_logger('control')
+
+
+class SourceControl:
+    """What the control API needs from the pipeline; calls come from the
+    HTTP server threads, so implementations hand them to the main loop."""
+
+    def list_sources(self) -> Dict[int, str]:
+        raise NotImplementedError
+
+    def add_source(self, uri: str) -> int:
+        raise NotImplementedError
+
+    def remove_source(self, index: int):
+        raise NotImplementedError
+
+
+class ControlServer:
+    """Local HTTP API for adding and removing sources at runtime.
+
+        GET    /sources              {"sources": {"0": "file:///a.mp4", ...}}
+        POST   /sources {"uri": ...} {"id": 1}
+        DELETE /sources/<id>         {"id": 1}
+
+    Invalid requests get 400, unknown sources 404 and pipeline failures 409.
+    """
+
+    def __init__(self, sources: SourceControl, port: int, host: str = '127.0.0.1'):
+        self.sources = sources
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def _handler(self):
+        sources = self.sources
+
+        class Handler(BaseHTTPRequestHandler):
+            def reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def handle_request(self, action):
+                try:
+                    self.reply(200, action())
+                except (ValueError, TypeError) as e:
+                    self.reply(400, {'error': str(e)})
+                except KeyError as e:
+                    self.reply(404, {'error': f"Unknown source {e}"})
+                except RuntimeError as e:
+                    self.reply(409, {'error': str(e)})
+
+            def do_GET(self):
+                if self.path.rstrip('/') != '/sources':
+                    self.reply(404, {'error': "Not found"})
+                    return
+                self.handle_request(lambda: {'sources': {str(i): uri for i, uri in sources.list_sources().items()}})
+
+            def do_POST(self):
+                if self.path.rstrip('/') != '/sources':
+                    self.reply(404, {'error': "Not found"})
+                    return
+
+                def add():
+                    length = int(self.headers.get('Content-Length', 0))
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                    uri = body.get('uri')
+                    if not isinstance(uri, str) or "://" not in uri:
+                        raise ValueError("Expected {\"uri\": \"<scheme>://...\"}")
+                    index = sources.add_source(uri)
+                    log.info("Added source %d: %s", index, uri)
+                    return {'id': index}
+                self.handle_request(add)
+
+            def do_DELETE(self):
+                prefix = '/sources/'
+                if not self.path.startswith(prefix):
+                    self.reply(404, {'error': "Not found"})
+                    return
+
+                def remove():
+                    index = int(self.path[len(prefix):].rstrip('/'))
+                    sources.remove_source(index)
+                    log.info("Removed source %d", index)
+                    return {'id': index}
+                self.handle_request(remove)
+
+            def log_message(self, format, *args):
+                log.debug("%s %s", self.address_string(), format % args)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="control", daemon=True)
+        self._thread.start()
+        log.info("Source control API at http://%s:%d/sources", *self._server.server_address[:2])
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
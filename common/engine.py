@@ -0,0 +1,133 @@
+"""TensorRT engine cache for nvinfer.
+
+nvinfer looks for `model-engine-file` and, when it is missing or was built
+for another batch size, precision or GPU, rebuilds the engine from the
+model at startup, which takes minutes. EngineCache derives the engine name
+from exactly those parameters, using nvinfer's own naming scheme so an
+engine nvinfer serializes lands where the cache expects it, and writes a
+generated nvinfer config pointing at it.
+"""
+import configparser
+import os
+import shutil
+from typing import Dict, NamedTuple, Optional
+
+from common.log import get_logger
+
+log = get_logger('engine')
+
+# network-mode values of nvinfer
+PRECISIONS = {0: 'fp32', 1: 'int8', 2: 'fp16'}
+
+# Keys whose values are paths relative to the config file
+PATH_KEYS = ('tlt-encoded-model', 'onnx-file', 'model-file', 'proto-file', 'uff-file', 'labelfile-path',
+             'int8-calib-file', 'model-engine-file', 'custom-lib-path')
+MODEL_KEYS = ('tlt-encoded-model', 'onnx-file', 'uff-file', 'model-file')
+
+
+class EngineSpec(NamedTuple):
+    model_path: str
+    batch_size: int
+    gpu_id: int
+    precision: str
+    engine_path: str
+    config_path: str
+    cached: bool
+
+
+def engine_filename(model_path: str, batch_size: int, gpu_id: int, precision: str) -> str:
+    # Same as nvinfer's default, e.g. resnet34_peoplenet_int8.etlt_b1_gpu0_int8.engine
+    return f"{os.path.basename(model_path)}_b{batch_size}_gpu{gpu_id}_{precision}.engine"
+
+
+def read_infer_config(path: str) -> configparser.ConfigParser:
+    config = configparser.ConfigParser()
+    # nvinfer keys are case sensitive
+    config.optionxform = str
+    if not config.read(path):
+        raise OSError(f"Unable to read nvinfer config {path}")
+    if 'property' not in config:
+        raise ValueError(f"{path}: missing [property] section")
+    return config
+
+
+class EngineCache:
+    """Resolves nvinfer configs to cached engines and generated configs.
+
+    By default engines are kept next to the model, where nvinfer writes
+    them when it builds one itself. A device tag (e.g. GPU model and
+    TensorRT version) puts engines in a subdirectory, since an engine only
+    loads on the setup it was built for.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, device_tag: Optional[str] = None):
+        self.cache_dir = cache_dir
+        self.device_tag = device_tag
+        self.hits = 0
+        self.misses = 0
+
+    def engine_dir(self, model_path: str) -> str:
+        base = self.cache_dir or os.path.dirname(model_path)
+        return os.path.join(base, self.device_tag) if self.device_tag else base
+
+    def resolve(self, config_path: str, batch_size: int, gpu_id: Optional[int] = None,
+                precision: Optional[str] = None, output_dir: Optional[str] = None) -> EngineSpec:
+        """Write an nvinfer config for batch_size/gpu/precision and report whether its engine is cached."""
+        config = read_infer_config(config_path)
+        props = config['property']
+        config_dir = os.path.dirname(os.path.abspath(config_path))
+        for key in PATH_KEYS:
+            if key in props and not os.path.isabs(props[key]):
+                props[key] = os.path.normpath(os.path.join(config_dir, props[key]))
+
+        model_key = next((key for key in MODEL_KEYS if key in props), None)
+        if model_key is None:
+            raise ValueError(f"{config_path}: no model file ({', '.join(MODEL_KEYS)})")
+        model_path = props[model_key]
+
+        if gpu_id is None:
+            gpu_id = int(props.get('gpu-id', 0))
+        if precision is None:
+            precision = PRECISIONS[int(props.get('network-mode', 0))]
+        modes = {name: mode for mode, name in PRECISIONS.items()}
+        if precision not in modes:
+            raise ValueError(f"Unknown precision {precision!r}, expected one of {', '.join(modes)}")
+
+        engine_dir = self.engine_dir(model_path)
+        engine_path = os.path.join(engine_dir, engine_filename(model_path, batch_size, gpu_id, precision))
+        props['model-engine-file'] = engine_path
+        props['batch-size'] = str(batch_size)
+        props['gpu-id'] = str(gpu_id)
+        props['network-mode'] = str(modes[precision])
+
+        output_dir = output_dir or engine_dir
+        os.makedirs(output_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(config_path))[0]
+        generated = os.path.join(output_dir, f"{stem}_b{batch_size}_gpu{gpu_id}_{precision}.txt")
+        with open(generated, 'w') as f:
+            f.write(f"# Generated from {os.path.abspath(config_path)}, do not edit\n")
+            config.write(f, space_around_delimiters=False)
+
+        cached = os.path.isfile(engine_path)
+        if cached:
+            self.hits += 1
+            log.info("Engine cache hit: %s", engine_path)
+        else:
+            self.misses += 1
+            log.warning("Engine cache miss: %s, nvinfer will build it at startup "
+                        "(pre-build it with build_engine.py)", engine_path)
+        return EngineSpec(model_path, batch_size, gpu_id, precision, engine_path, generated, cached)
+
+    def store(self, spec: EngineSpec) -> bool:
+        """Move an engine nvinfer serialized next to the model into the cache."""
+        if os.path.isfile(spec.engine_path):
+            return True
+        built = os.path.join(os.path.dirname(spec.model_path), os.path.basename(spec.engine_path))
+        if not os.path.isfile(built):
+            return False
+        os.makedirs(os.path.dirname(spec.engine_path), exist_ok=True)
+        shutil.move(built, spec.engine_path)
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses}
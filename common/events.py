@@ -0,0 +1,270 @@
+import collections
+import json
+import os
+import socket
+import sys
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, List, Optional
+
+from common.log import RateLimiter, get_logger
+
+log = get_logger('events')
+
+# Event types pushed by the probe
+EVENT_ENTER = 'enter'
+EVENT_LEAVE = 'leave'
+EVENT_ALERT = 'alert'
+
+
+class EventQueue:
+    """Bounded queue between the streaming thread and the event worker.
+
+    collections.deque appends and pops are atomic, so producers never take a
+    lock. When the queue is full the oldest event is dropped and counted, a
+    slow consumer can therefore never block inference.
+    """
+
+    def __init__(self, maxlen: int = 10000):
+        self._events = collections.deque(maxlen=maxlen)
+        self.pushed = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def push(self, event: Dict):
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        self._events.append(event)
+        self.pushed += 1
+
+    def pop_batch(self, max_events: int) -> List[Dict]:
+        batch = []
+        try:
+            while len(batch) < max_events:
+                batch.append(self._events.popleft())
+        except IndexError:
+            pass
+        return batch
+
+
+class EventSink:
+    """Destination for events, written from the event worker thread only."""
+
+    def __init__(self):
+        self.written = 0
+        self.errors = 0
+
+    def write_batch(self, events: List[Dict]):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __repr__(self):
+        return self.__class__.__name__
+
+
+class JsonlFileSink(EventSink):
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._file = open(path, 'a')
+
+    def write_batch(self, events: List[Dict]):
+        self._file.write(''.join(json.dumps(e) + '\n' for e in events))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __repr__(self):
+        return f"JsonlFileSink({self.path})"
+
+
+class RotatingFileSink(JsonlFileSink):
+    """JSONL file that is rotated to path.1 .. path.N once it reaches max_bytes."""
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5):
+        super().__init__(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+    def write_batch(self, events: List[Dict]):
+        super().write_batch(events)
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, 'a')
+
+
+class SocketSink(EventSink):
+    """Sends one JSON line per event over UDP, or a stream of lines over TCP."""
+
+    def __init__(self, host: str, port: int, protocol: str = 'udp'):
+        super().__init__()
+        if protocol not in ('udp', 'tcp'):
+            raise ValueError(f"Unknown socket protocol '{protocol}'")
+        self.address = (host, port)
+        self.protocol = protocol
+        self._sock = None
+
+    def _connect(self):
+        if self.protocol == 'udp':
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            self._sock = socket.create_connection(self.address, timeout=5.0)
+
+    def write_batch(self, events: List[Dict]):
+        if self._sock is None:
+            self._connect()
+        try:
+            if self.protocol == 'udp':
+                for e in events:
+                    self._sock.sendto((json.dumps(e) + '\n').encode(), self.address)
+            else:
+                self._sock.sendall(''.join(json.dumps(e) + '\n' for e in events).encode())
+        except OSError:
+            # Reconnect on the next batch
+            self.close()
+            raise
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def __repr__(self):
+        return f"SocketSink({self.protocol}://{self.address[0]}:{self.address[1]})"
+
+
+class WebhookSink(EventSink):
+    """POSTs each batch as a JSON array to an HTTP endpoint."""
+
+    def __init__(self, url: str, timeout: float = 2.0):
+        super().__init__()
+        self.url = url
+        self.timeout = timeout
+
+    def write_batch(self, events: List[Dict]):
+        request = urllib.request.Request(self.url, data=json.dumps(events).encode(),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def __repr__(self):
+        return f"WebhookSink({self.url})"
+
+
+def create_sink(spec: str) -> EventSink:
+    """Build a sink from a command line spec.
+
+    jsonl:PATH, rotating:PATH[:MAX_BYTES[:BACKUPS]], udp:HOST:PORT,
+    tcp:HOST:PORT or an http(s):// URL for a webhook.
+    """
+    if spec.startswith(('http://', 'https://')):
+        return WebhookSink(spec)
+    kind, _, rest = spec.partition(':')
+    if kind == 'jsonl' and rest:
+        return JsonlFileSink(rest)
+    if kind == 'rotating' and rest:
+        path, *options = rest.split(':')
+        return RotatingFileSink(path, *[int(o) for o in options])
+    if kind in ('udp', 'tcp'):
+        host, _, port = rest.rpartition(':')
+        return SocketSink(host or '127.0.0.1', int(port), kind)
+    raise ValueError(f"Unknown event sink '{spec}'")
+
+
+class EventDispatcher:
+    """Background worker that drains an EventQueue into the sinks in batches."""
+
+    def __init__(self, sinks: List[EventSink], queue: Optional[EventQueue] = None,
+                 batch_size: int = 256, flush_interval: float = 0.2):
+        self.sinks = sinks
+        self.queue = queue if queue is not None else EventQueue()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="event-dispatcher", daemon=True)
+        self._error_limiter = RateLimiter(10.0)
+
+    def start(self):
+        self._thread.start()
+
+    def push(self, event: Dict):
+        self.queue.push(event)
+
+    def _drain(self):
+        while True:
+            batch = self.queue.pop_batch(self.batch_size)
+            if not batch:
+                return
+            for sink in self.sinks:
+                try:
+                    sink.write_batch(batch)
+                    sink.written += len(batch)
+                except Exception as e:
+                    sink.errors += 1
+                    if self._error_limiter.allow(repr(sink)):
+                        log.warning("Event sink %r failed (%d errors so far): %s", sink, sink.errors, e)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._drain()
+        self._drain()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        for sink in self.sinks:
+            sink.close()
+
+    def stats(self) -> Dict:
+        return {
+            'pushed': self.queue.pushed,
+            'dropped': self.queue.dropped,
+            'queued': len(self.queue),
+            'sinks': {repr(s): {'written': s.written, 'errors': s.errors} for s in self.sinks},
+        }
+
+
+def run_webhook_receiver(port: int, host: str = '127.0.0.1'):
+    """Local stand-in for a webhook endpoint, prints every event it receives."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            for event in json.loads(body or b'[]'):
+                print(json.dumps(event))
+            sys.stdout.flush()
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer((host, port), Handler)
+    print(f"Webhook stand-in listening on http://{host}:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    run_webhook_receiver(int(sys.argv[1]) if len(sys.argv) > 1 else 8080)
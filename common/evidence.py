@@ -0,0 +1,417 @@
+"""Evidence capture: images, and optionally short clips, of alerts.
+
+When a track enters the alert state, the probe passes the alert and a
+FrameProvider for the frame's pixels to EvidenceRecorder.capture(). Only
+the crops (or full frames) that will be saved are copied on the streaming
+thread. Encoding and writing happen in a bounded pool of worker threads.
+A per-stream token bucket and a bounded queue cap the work that a crowd
+entering a zone can cause, and EvidenceStore caps the disk space used by
+removing the oldest files.
+
+Nothing here needs a GPU: ArrayFrames serves synthetic NumPy frames, so the
+encoding, rate limiting and storage can be exercised on a CPU.
+"""
+import collections
+import json
+import os
+import queue
+import re
+import struct
+import threading
+import time
+import zlib
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from common.log import RateLimiter, get_logger
+
+log = get_logger('evidence')
+
+EVIDENCE_FORMATS = ('jpeg', 'png')
+
+INDEX_FILE = 'evidence.jsonl'
+
+# Added to the nice value of the encoding threads
+WORKER_NICENESS = 10
+
+# Encodes an (h, w, 3) RGB uint8 image
+Encoder = Callable[[np.ndarray], bytes]
+
+# track id, zone id, bbox (left, top, width, height)
+Alert = Tuple[int, str, Sequence[float]]
+
+
+def encode_png(image: np.ndarray, level: int = 1) -> bytes:
+    """PNG with the standard library only; zlib releases the GIL while compressing."""
+    height, width = image.shape[:2]
+    rows = np.empty((height, 1 + width * 3), dtype=np.uint8)
+    rows[:, 0] = 0  # no filter
+    rows[:, 1:] = image.reshape(height, width * 3)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(rows.tobytes(), level))
+            + chunk(b'IEND', b''))
+
+
+def make_encoder(fmt: str = 'jpeg', quality: int = 90) -> Tuple[Encoder, str]:
+    """Encoder and file extension for a format. JPEG needs OpenCV or Pillow."""
+    if fmt == 'png':
+        return encode_png, '.png'
+    if fmt != 'jpeg':
+        raise ValueError(f"Unknown evidence format {fmt!r}, expected one of {', '.join(EVIDENCE_FORMATS)}")
+    try:
+        import cv2
+    except ImportError:
+        cv2 = None
+    if cv2 is not None:
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+
+        def encode_cv2(image: np.ndarray) -> bytes:
+            ok, data = cv2.imencode('.jpg', np.ascontiguousarray(image[:, :, ::-1]), params)
+            if not ok:
+                raise ValueError("JPEG encoding failed")
+            return data.tobytes()
+        return encode_cv2, '.jpg'
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ValueError("JPEG evidence needs OpenCV (python3-opencv) or Pillow, or use the png format")
+    import io
+
+    def encode_pil(image: np.ndarray) -> bytes:
+        out = io.BytesIO()
+        Image.fromarray(image).save(out, 'JPEG', quality=quality)
+        return out.getvalue()
+    return encode_pil, '.jpg'
+
+
+class FrameProvider:
+    """Pixels of the frames of one batch, fetched only when needed.
+
+    get() returns an (h, w, 3 or 4) uint8 array, RGB(A), that is only valid
+    until release(); EvidenceRecorder copies what it keeps.
+    """
+
+    def get(self, frame_meta) -> Optional[np.ndarray]:
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+
+class SurfaceFrames(FrameProvider):
+    """Frames of a DeepStream batch buffer. The buffer must be RGBA in
+    memory the CPU can map (unified memory on dGPU), see the pipeline's
+    evidence converter."""
+
+    def __init__(self, buffer_address: int):
+        self.address = buffer_address
+        self.mapped: List[int] = []
+
+    def get(self, frame_meta) -> Optional[np.ndarray]:
+        import pyds
+        try:
+            frame = pyds.get_nvds_buf_surface(self.address, frame_meta.batch_id)
+        except RuntimeError as e:
+            log.warning("Unable to map frame %d of stream %d: %s", frame_meta.frame_num, frame_meta.pad_index, e)
+            return None
+        self.mapped.append(frame_meta.batch_id)
+        return frame
+
+    def release(self):
+        from common.is_aarch_64 import is_aarch64
+        if self.mapped and is_aarch64():
+            import pyds
+            for batch_id in self.mapped:
+                pyds.unmap_nvds_buf_surface(self.address, batch_id)
+        self.mapped = []
+
+
+class ArrayFrames(FrameProvider):
+    """Synthetic frames: one array per stream, e.g. for benchmarks."""
+
+    def __init__(self, frames: Dict[int, np.ndarray]):
+        self.frames = frames
+
+    def get(self, frame_meta) -> Optional[np.ndarray]:
+        return self.frames.get(frame_meta.pad_index)
+
+
+class EvidenceStore:
+    """Directory of evidence files, capped at max_bytes.
+
+    Files are written under a temporary name and renamed, so readers never
+    see partial images. Once the total size passes max_bytes the oldest
+    files go first; files already in the directory count too. Every capture
+    is also appended to evidence.jsonl, which is not part of the cap.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.removed = 0
+        self._files = collections.deque()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        existing = []
+        for root, _, names in os.walk(directory):
+            for name in names:
+                path = os.path.join(root, name)
+                if name != INDEX_FILE and not name.endswith('.tmp'):
+                    stat = os.stat(path)
+                    existing.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(existing):
+            self._files.append((path, size))
+            self.bytes += size
+        self._index = open(os.path.join(directory, INDEX_FILE), 'a')
+        self._trim()
+
+    def write(self, name: str, data: bytes, record: Optional[Dict] = None) -> str:
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._files.append((path, len(data)))
+            self.bytes += len(data)
+            if record is not None:
+                self._index.write(json.dumps(dict(record, path=name)) + "\n")
+                self._index.flush()
+            self._trim()
+        return path
+
+    def _trim(self):
+        while self.bytes > self.max_bytes and self._files:
+            path, size = self._files.popleft()
+            self.bytes -= size
+            self.removed += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            # Clip directories go with their last frame
+            parent = os.path.dirname(path)
+            if parent != self.directory and parent.endswith('_clip'):
+                try:
+                    os.rmdir(parent)
+                except OSError:
+                    pass
+
+    def close(self):
+        with self._lock:
+            self._index.close()
+
+
+class _Job(NamedTuple):
+    name: str
+    image: np.ndarray
+    record: Optional[Dict]
+
+
+class _Clip:
+    # Frames still to save for the clip that follows a capture
+    def __init__(self, prefix: str, frames: int):
+        self.prefix = prefix
+        self.remaining = frames
+        self.count = 0
+
+
+def crop_box(frame: np.ndarray, bbox: Sequence[float], margin: float) -> np.ndarray:
+    """Copy of the RGB pixels of a bbox grown by margin (a fraction of its size) on each side."""
+    left, top, width, height = bbox
+    height_px, width_px = frame.shape[:2]
+    x0 = max(0, int(left - margin * width))
+    y0 = max(0, int(top - margin * height))
+    x1 = min(width_px, int(np.ceil(left + width * (1 + margin))))
+    y1 = min(height_px, int(np.ceil(top + height * (1 + margin))))
+    if x1 <= x0 or y1 <= y0:
+        return np.empty((0, 0, 3), dtype=np.uint8)
+    return frame[y0:y1, x0:x1, :3].copy()
+
+
+def _safe(name: str) -> str:
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+class EvidenceRecorder:
+    """Saves an image per alert, cropped to the track or the full frame,
+    and optionally clip_frames more frames of the stream, every clip_stride
+    frames, with frames downscaled by clip_scale.
+
+    capture() runs on the streaming thread and only copies pixels; images
+    go to `workers` threads through a queue of queue_size, and when it is
+    full new captures are dropped. Each stream gets `burst` captures at
+    once and `rate` per second after that; clip frames are not limited.
+    """
+
+    def __init__(self, store: EvidenceStore, encoder: Encoder, extension: str, crop: bool = True,
+                 margin: float = 0.2, rate: float = 1.0, burst: int = 5, workers: int = 2, queue_size: int = 16,
+                 clip_frames: int = 0, clip_stride: int = 5, clip_scale: int = 2):
+        self.store = store
+        self.encoder = encoder
+        self.extension = extension
+        self.crop = crop
+        self.margin = margin
+        self.rate = rate
+        self.burst = burst
+        self.clip_frames = clip_frames
+        self.clip_stride = clip_stride
+        self.clip_scale = clip_scale
+        self.captured = 0
+        self.rate_limited = 0
+        self.queue_full = 0
+        # Counted by the worker threads, under _counts_lock
+        self.written = 0
+        self.errors = 0
+        self._counts_lock = threading.Lock()
+        # Per stream, available captures and when they were last topped up
+        self._tokens: Dict[int, Tuple[float, float]] = {}
+        self._clips: Dict[int, _Clip] = {}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = [threading.Thread(target=self._run, name=f"evidence-{i}", daemon=True)
+                         for i in range(workers)]
+        self._error_limiter = RateLimiter(10.0)
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def recording(self, stream: int) -> bool:
+        # Whether the stream's next frames are wanted for a clip
+        return stream in self._clips
+
+    def remove_stream(self, stream: int):
+        self._tokens.pop(stream, None)
+        self._clips.pop(stream, None)
+
+    def _take_token(self, stream: int, now: float) -> bool:
+        tokens, last = self._tokens.get(stream, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+        if tokens < 1.0:
+            self._tokens[stream] = (tokens, now)
+            return False
+        self._tokens[stream] = (tokens - 1.0, now)
+        return True
+
+    def _has_room(self) -> bool:
+        # Checked before copying any pixels. capture() is the only producer,
+        # so a queue that is not full now still has room at the put
+        if self._queue.full():
+            self.queue_full += 1
+            return False
+        return True
+
+    def _submit(self, name: str, image: np.ndarray, record: Optional[Dict]):
+        self._queue.put_nowait(_Job(name, image, record))
+
+    def capture(self, stream: int, frame_num: int, frame_time: float, alerts: Sequence[Alert],
+                get_frame: Callable[[], Optional[np.ndarray]]):
+        """Save evidence of the alerts of one frame and the next frame of a
+        running clip. get_frame is only called if pixels are needed."""
+        clip = self._clips.get(stream)
+        if not alerts and clip is None:
+            return
+        wall_time = time.time()
+        prefix = f"stream{stream}/{int(wall_time * 1000)}_f{frame_num}"
+        frame = None
+        if alerts:
+            now = time.monotonic()
+            if self.crop:
+                wanted = [alert for alert in alerts if self._take_token(stream, now)]
+                self.rate_limited += len(alerts) - len(wanted)
+            else:
+                # One full frame covers all alerts of the frame
+                wanted = list(alerts) if self._take_token(stream, now) else []
+                self.rate_limited += int(not wanted)
+            if wanted:
+                frame = get_frame()
+            if frame is not None:
+                record = {'stream': stream, 'frame': frame_num, 'time': frame_time, 'wall_time': wall_time}
+                self._save_alerts(prefix, frame, wanted, record)
+                if self.clip_frames and clip is None:
+                    # The clip starts with the next frame
+                    self._clips[stream] = _Clip(f"{prefix}_clip/", self.clip_frames)
+                    return
+
+        if clip is not None:
+            if clip.count % self.clip_stride == 0:
+                if frame is None:
+                    frame = get_frame()
+                if frame is not None:
+                    if self._has_room():
+                        step = self.clip_scale
+                        self._submit(f"{clip.prefix}{clip.count // self.clip_stride:03d}{self.extension}",
+                                     frame[::step, ::step, :3].copy(), None)
+                    clip.remaining -= 1
+            clip.count += 1
+            if clip.remaining <= 0:
+                del self._clips[stream]
+
+    def _save_alerts(self, prefix: str, frame: np.ndarray, alerts: Sequence[Alert], record: Dict):
+        if self.crop:
+            for track_id, zone_id, bbox in alerts:
+                if not self._has_room():
+                    continue
+                image = crop_box(frame, bbox, self.margin)
+                if image.size:
+                    self._submit(f"{prefix}_{_safe(zone_id)}_t{track_id}{self.extension}", image,
+                                 dict(record, track=track_id, zone=zone_id, bbox=[float(v) for v in bbox]))
+                    self.captured += 1
+        elif self._has_room():
+            alerted = [{'track': track_id, 'zone': zone_id, 'bbox': [float(v) for v in bbox]}
+                       for track_id, zone_id, bbox in alerts]
+            self._submit(f"{prefix}_frame{self.extension}", frame[:, :, :3].copy(), dict(record, alerts=alerted))
+            self.captured += 1
+
+    def _run(self):
+        # Encoding yields the CPU to the streaming threads; Linux takes a
+        # thread id here and lowers the priority of just this thread
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), WORKER_NICENESS)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                self.store.write(job.name, self.encoder(job.image), job.record)
+                with self._counts_lock:
+                    self.written += 1
+            except Exception as e:
+                with self._counts_lock:
+                    self.errors += 1
+                    errors = self.errors
+                if self._error_limiter.allow('write'):
+                    log.warning("Unable to save evidence %s (%d errors so far): %s", job.name, errors, e)
+
+    def stop(self):
+        # Images already queued are still written
+        for thread in self._threads:
+            if thread.is_alive():
+                self._queue.put(None)
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join()
+        self.store.close()
+
+    def stats(self) -> Dict:
+        with self._counts_lock:
+            written, errors = self.written, self.errors
+        return {
+            'captured': self.captured,
+            'written': written,
+            'rate_limited': self.rate_limited,
+            'queue_full': self.queue_full,
+            'errors': errors,
+            'queued': self._queue.qsize(),
+            'bytes': self.store.bytes,
+            'removed': self.store.removed,
+        }
@@ -0,0 +1,118 @@
+from typing import Dict, List, Optional
+
+from common.log import get_logger
+from common.metrics import Histogram
+
+log = get_logger('health')
+
+# Buckets for the time a source was down before it delivered buffers again
+RECOVERY_BUCKETS = (1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+SOURCE_OK = 'ok'
+SOURCE_DOWN = 'down'                  # waiting for its next reconnect attempt
+SOURCE_RECONNECTING = 'reconnecting'  # rebuilt, waiting for the first buffer
+
+
+class Backoff:
+    def __init__(self, initial: float = 1.0, maximum: float = 60.0, factor: float = 2.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+
+    def delay(self, attempt: int) -> float:
+        return min(self.maximum, self.initial * self.factor ** attempt)
+
+
+class SourceHealth:
+    def __init__(self, index: int, now: float):
+        self.index = index
+        # Written by the streaming thread on every buffer, read by check()
+        self.last_buffer = 0.0
+        # A new source counts as reconnecting until its first buffer
+        self.status = SOURCE_RECONNECTING
+        self.attempt_time = now
+        self.attempts = 0
+        self.next_attempt = 0.0
+        self.down_since: Optional[float] = now
+        self.reconnects = 0
+        self.stalls = 0
+        self.errors = 0
+
+
+class SourceWatchdog:
+    """Stall detection and reconnect scheduling for live sources.
+
+    The streaming threads only stamp buffer arrival times; check() runs on
+    the main loop, notices sources without buffers for stall_timeout
+    seconds (or reported by error()), and returns the ones whose backoff
+    delay is over and that should be rebuilt now.
+    """
+
+    def __init__(self, stall_timeout: float = 10.0, startup_timeout: float = 30.0, backoff: Backoff = None):
+        self.stall_timeout = stall_timeout
+        # Connecting to a camera can take longer than a stall
+        self.startup_timeout = max(startup_timeout, stall_timeout)
+        self.backoff = backoff or Backoff()
+        self.sources: Dict[int, SourceHealth] = {}
+        self.recovery_time = Histogram(RECOVERY_BUCKETS)
+
+    def add(self, index: int, now: float):
+        self.sources[index] = SourceHealth(index, now)
+
+    def remove(self, index: int):
+        self.sources.pop(index, None)
+
+    def buffer(self, index: int, now: float):
+        source = self.sources.get(index)
+        if source is not None:
+            source.last_buffer = now
+
+    def error(self, index: int, now: float):
+        source = self.sources.get(index)
+        if source is None:
+            return
+        source.errors += 1
+        self._down(source, now)
+
+    def _down(self, source: SourceHealth, now: float):
+        if source.status == SOURCE_OK:
+            source.down_since = now
+        elif source.status == SOURCE_DOWN:
+            return
+        source.status = SOURCE_DOWN
+        source.next_attempt = now + self.backoff.delay(source.attempts)
+        log.warning("Source %d down, reconnect attempt %d in %.1fs", source.index, source.attempts + 1,
+                    source.next_attempt - now)
+
+    def check(self, now: float) -> List[int]:
+        due = []
+        for source in list(self.sources.values()):
+            if source.status == SOURCE_RECONNECTING:
+                if source.last_buffer > source.attempt_time:
+                    if source.reconnects:
+                        log.info("Source %d recovered after %.1fs", source.index, now - source.down_since)
+                        self.recovery_time.observe(now - source.down_since)
+                    source.status = SOURCE_OK
+                    source.attempts = 0
+                    source.down_since = None
+                elif now - source.attempt_time > self.startup_timeout:
+                    self._down(source, now)
+            elif source.status == SOURCE_OK and now - source.last_buffer > self.stall_timeout:
+                log.warning("Source %d stalled, no buffers for %.1fs", source.index, now - source.last_buffer)
+                source.stalls += 1
+                self._down(source, now)
+
+            if source.status == SOURCE_DOWN and now >= source.next_attempt:
+                source.status = SOURCE_RECONNECTING
+                source.attempt_time = now
+                source.attempts += 1
+                source.reconnects += 1
+                due.append(source.index)
+        return due
+
+    def snapshot(self) -> dict:
+        return {
+            'sources': {str(s.index): {'status': s.status, 'reconnects': s.reconnects, 'stalls': s.stalls,
+                                       'errors': s.errors} for s in list(self.sources.values())},
+            'recovery_seconds': self.recovery_time.snapshot(),
+        }
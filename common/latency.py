@@ -0,0 +1,118 @@
+"""End-to-end latency budget for live sources.
+
+Without queues every element of the pipeline runs on the thread that
+pushes into it, so one slow stage, e.g. a stalled probe, holds up the
+decoders and every frame behind it waits its turn: latency grows for as
+long as the stall lasts and only shrinks when the pipeline catches up.
+
+In latency budget mode Pipeline puts a leaky queue in front of nvinfer
+and small queues between the later stages, and LatencyBudget decides per
+stream, at the streammux sink pad, whether a frame still has a chance to
+reach the probe within the budget. Frames that do not are dropped before
+they cost any inference. Latency is taken from the buffer PTS against the
+pipeline's running time, which is what live sources timestamp with.
+"""
+import threading
+from typing import Dict, Optional
+
+from common.metrics import LATENCY_BUCKETS, Histogram
+
+
+class StreamLatency:
+    def __init__(self, index: int):
+        self.index = index
+        # PTS to probe, in seconds of running time
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.last: Optional[float] = None
+        # Smoothed time from the streammux sink pad to the probe
+        self.downstream = 0.0
+        # Admitted frames on their way to the probe: PTS -> admission time,
+        # in admission order
+        self.in_flight: Dict[int, float] = {}
+        self.admitted = 0
+        # Dropped by the budget before the muxer
+        self.dropped = 0
+        # Admitted but never seen by the probe, i.e. dropped by a leaky queue
+        self.lost = 0
+
+
+class LatencyBudget:
+    """Per-stream admission of frames into the muxer against a latency budget.
+
+    A frame is dropped if its age at the muxer plus the stream's recent
+    muxer-to-probe time is over the budget, unless none of the stream's
+    frames is in flight: then the pipeline has drained for the stream and
+    the frame goes through, so results keep coming and the estimate is
+    refreshed. admit() runs on the source's streaming thread and frame()
+    on the probe's; both take a lock held for a few dict operations.
+    """
+
+    def __init__(self, budget: float, smoothing: float = 0.2, lost_after: Optional[float] = None):
+        self.budget = budget
+        self.smoothing = smoothing
+        # Frames in flight for longer than this are taken as lost
+        self.lost_after = lost_after if lost_after is not None else max(4 * budget, 1.0)
+        self.streams: Dict[int, StreamLatency] = {}
+        # Batches the leaky queue in front of nvinfer dropped
+        self.queue_drops = 0
+        self._lock = threading.Lock()
+
+    def add_stream(self, index: int):
+        self.streams[index] = StreamLatency(index)
+
+    def remove_stream(self, index: int):
+        self.streams.pop(index, None)
+
+    def admit(self, stream: int, pts: int, now: float) -> bool:
+        """Whether a frame goes into the muxer; pts in nanoseconds, now in
+        seconds of running time."""
+        s = self.streams.get(stream)
+        if s is None:
+            return True
+        with self._lock:
+            in_flight = s.in_flight
+            while in_flight:
+                oldest = next(iter(in_flight))
+                if now - in_flight[oldest] <= self.lost_after:
+                    break
+                del in_flight[oldest]
+                s.lost += 1
+            if in_flight and now - pts * 1e-9 + s.downstream > self.budget:
+                s.dropped += 1
+                return False
+            in_flight[pts] = now
+            s.admitted += 1
+        return True
+
+    def frame(self, stream: int, pts: int, now: float):
+        """A frame reached the probe."""
+        s = self.streams.get(stream)
+        if s is None:
+            return
+        with self._lock:
+            admitted = s.in_flight.pop(pts, None)
+        if admitted is not None:
+            s.downstream += self.smoothing * (now - admitted - s.downstream)
+        latency = now - pts * 1e-9
+        # Ahead of the clock when a file source is not synced
+        if latency >= 0:
+            s.latency.observe(latency)
+            s.last = latency
+
+    def queue_overrun(self, queue=None):
+        # "overrun" signal of the leaky queue, emitted before it drops
+        self.queue_drops += 1
+
+    def snapshot(self) -> Dict:
+        return {
+            'budget': self.budget,
+            'queue_drops': self.queue_drops,
+            'streams': {
+                str(index): {
+                    'pts_latency_seconds': s.latency.snapshot(),
+                    'admitted': s.admitted,
+                    'dropped': s.dropped,
+                    'lost': s.lost,
+                } for index, s in list(self.streams.items())
+            },
+        }
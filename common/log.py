@@ -0,0 +1,61 @@
+import logging
+import sys
+import time
+from typing import Dict, Hashable
+
+LOGGER_NAME = 'deepstream'
+
+LEVELS = ('debug', 'info', 'warning', 'error')
+
+
+def get_logger(name: str = None) -> logging.Logger:
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+def setup_logging(level: str = 'info', stream=None):
+    """Configure the application logger once, at startup."""
+    logger = get_logger()
+    logger.setLevel(getattr(logging, level.upper()))
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream or sys.stdout)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        logger.addHandler(handler)
+    logger.propagate = False
+    return logger
+
+
+class RateLimiter:
+    """Lets a message through at most once per interval for each key.
+
+    Hot-path callers check allow() only after the cheaper level check, e.g.
+
+        if debug_enabled and limiter.allow(stream_id):
+            log.debug(...)
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._last: Dict[Hashable, float] = {}
+        self.suppressed = 0
+
+    def allow(self, key: Hashable = None) -> bool:
+        now = time.monotonic()
+        last = self._last.get(key)
+        if last is not None and now - last < self.interval:
+            self.suppressed += 1
+            return False
+        self._last[key] = now
+        return True
+
+
+class Sampler:
+    """Lets every n-th call through for each key."""
+
+    def __init__(self, every: int):
+        self.every = max(1, every)
+        self._count: Dict[Hashable, int] = {}
+
+    def allow(self, key: Hashable = None) -> bool:
+        count = self._count.get(key, 0)
+        self._count[key] = count + 1
+        return count % self.every == 0
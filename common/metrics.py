@@ -0,0 +1,414 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Hashable, Optional, Sequence
+
+from common.FPS import GETFPS, PERF_DATA
+from common.log import get_logger
+
+log = get_logger('metrics')
+
+# Histogram bucket upper bounds, in seconds
+PROBE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Histogram:
+    """Fixed-bucket histogram with a single writer.
+
+    Only one thread calls observe(), readers take a copy of the counts, so
+    no lock is taken on the streaming thread.
+    """
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        counts = list(self.counts)
+        cumulative = []
+        total = 0
+        for c in counts:
+            total += c
+            cumulative.append(total)
+        return {'buckets': dict(zip([*map(str, self.bounds), '+Inf'], cumulative)),
+                'sum': self.sum, 'count': total}
+
+
+class PendingTimes:
+    """Arrival times of buffers keyed by PTS, waiting for their departure.
+
+    Written from different streaming threads. Dropping the oldest entry
+    walks the dict, which fails if another thread changes it meanwhile, so
+    arrive() and depart() take a lock; it is never held for more than a
+    few dict operations. Entries whose buffer never comes out (dropped
+    frames) are discarded once more than maxlen are pending.
+    """
+
+    def __init__(self, maxlen: int = 1024):
+        self.maxlen = maxlen
+        self._times: Dict[Hashable, float] = {}
+        self._lock = threading.Lock()
+
+    def arrive(self, key: Hashable, now: float = None):
+        now = time.monotonic() if now is None else now
+        times = self._times
+        with self._lock:
+            times[key] = now
+            if len(times) > self.maxlen:
+                del times[next(iter(times))]
+
+    def get(self, key: Hashable) -> Optional[float]:
+        return self._times.get(key)
+
+    def depart(self, key: Hashable) -> Optional[float]:
+        with self._lock:
+            return self._times.pop(key, None)
+
+
+class PhaseTimer:
+    """Wall time of the startup phases, in the order they ran."""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self._start = time.monotonic()
+        self._current: Optional[str] = None
+        self._current_start = 0.0
+
+    def begin(self, name: str):
+        now = time.monotonic()
+        self.end(now)
+        self._current = name
+        self._current_start = now
+
+    def end(self, now: float = None):
+        if self._current is not None:
+            now = time.monotonic() if now is None else now
+            self.phases[self._current] = now - self._current_start
+            self._current = None
+
+    def total(self) -> float:
+        return time.monotonic() - self._start
+
+    def summary(self) -> str:
+        return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+
+
+class StreamMetrics:
+    def __init__(self, index: int, fps: GETFPS):
+        self.index = index
+        self.fps = fps
+        self.objects = 0
+        # Time from the streammux sink pad to the probe
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.arrivals = PendingTimes()
+
+
+class Metrics:
+    """Per-stream FPS/latency, probe time and per-element latency.
+
+    Counters are updated lock-free from the streaming threads and
+    aggregated by aggregate(), which MetricsExporter calls on a timer. Only
+    the pending arrival times, which two threads change, take a lock.
+    """
+
+    def __init__(self):
+        self.perf = PERF_DATA(0)
+        self.streams: Dict[int, StreamMetrics] = {}
+        self.probe_time = Histogram(PROBE_BUCKETS)
+        # Worker thread time per batch in decoupled mode, see common/snapshot.py
+        self.worker_time: Optional[Histogram] = None
+        self.elements: Dict[str, Histogram] = {}
+        self.element_pending: Dict[str, PendingTimes] = {}
+        self.started = time.time()
+        # Live source health (common.health.SourceWatchdog), if watched
+        self.watchdog = None
+        self.startup: Optional[PhaseTimer] = None
+        # AnalyticsEngine whose results are exported, if analytics run
+        self.analytics = None
+        # EvidenceRecorder whose counters are exported, if alerts are captured
+        self.evidence = None
+        # common.latency.LatencyBudget, in latency budget mode
+        self.latency_budget = None
+        self._snapshot = {}
+
+    def add_stream(self, index: int):
+        self.perf.add_stream(index)
+        self.streams[index] = StreamMetrics(index, self.perf.all_stream_fps["stream{0}".format(index)])
+
+    def remove_stream(self, index: int):
+        self.perf.remove_stream(index)
+        self.streams.pop(index, None)
+
+    def add_element(self, name: str):
+        self.elements[name] = Histogram(LATENCY_BUCKETS)
+        self.element_pending[name] = PendingTimes()
+
+    # Streaming thread side
+
+    def frame(self, stream: int, num_objects: int, pts: int, now: float):
+        stream_metrics = self.streams.get(stream)
+        if stream_metrics is None:
+            return
+        stream_metrics.fps.update_fps()
+        stream_metrics.objects += num_objects
+        arrived = stream_metrics.arrivals.depart(pts)
+        if arrived is not None:
+            stream_metrics.latency.observe(now - arrived)
+
+    def mux_out(self, stream: int, pts: int, now: float):
+        # streammux batches frames, so its latency is taken per frame from
+        # the stream's own arrival times
+        stream_metrics = self.streams.get(stream)
+        arrived = stream_metrics.arrivals.get(pts) if stream_metrics is not None else None
+        if arrived is not None:
+            self.elements['streammux'].observe(now - arrived)
+
+    def element_in(self, name: str, pts: int):
+        self.element_pending[name].arrive(pts)
+
+    def element_out(self, name: str, pts: int):
+        arrived = self.element_pending[name].depart(pts)
+        if arrived is not None:
+            self.elements[name].observe(time.monotonic() - arrived)
+
+    # Aggregation and export
+
+    def aggregate(self) -> dict:
+        fps = self.perf.update_perf_dict()
+        self._snapshot = {
+            'time': time.time(),
+            'uptime': time.time() - self.started,
+            'streams': {
+                str(index): {
+                    'fps': fps.get("stream{0}".format(index), 0.0),
+                    'frames': s.fps.frame_count,
+                    'objects': s.objects,
+                    'latency_seconds': s.latency.snapshot(),
+                } for index, s in list(self.streams.items())
+            },
+            'probe_seconds': self.probe_time.snapshot(),
+            'element_latency_seconds': {name: h.snapshot() for name, h in list(self.elements.items())},
+        }
+        if self.worker_time is not None:
+            self._snapshot['worker_seconds'] = self.worker_time.snapshot()
+        if self.watchdog is not None:
+            self._snapshot['source_health'] = self.watchdog.snapshot()
+        if self.startup is not None:
+            self._snapshot['startup_seconds'] = dict(self.startup.phases)
+        if self.analytics is not None:
+            self._snapshot['analytics'] = self.analytics.snapshot()
+        if self.evidence is not None:
+            self._snapshot['evidence'] = self.evidence.stats()
+        if self.latency_budget is not None:
+            budget = self.latency_budget.snapshot()
+            # Per-stream figures go with the stream's other metrics
+            for index, stream in budget.pop('streams').items():
+                if index in self._snapshot['streams']:
+                    self._snapshot['streams'][index].update(stream)
+            self._snapshot['latency_budget'] = budget
+        return self._snapshot
+
+    def snapshot(self) -> dict:
+        return self._snapshot or self.aggregate()
+
+    def prometheus_text(self) -> str:
+        return format_prometheus(self.snapshot())
+
+
+def format_prometheus(snap: dict) -> str:
+    # Prometheus text for a snapshot of Metrics, or of several merged by
+    # common.supervisor.Supervisor
+    lines = []
+
+    def metric(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def histogram(name, hist, labels=""):
+        sep = "," if labels else ""
+        for le, count in hist['buckets'].items():
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {count}')
+        braces = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{braces} {hist['sum']:.6f}")
+        lines.append(f"{name}_count{braces} {hist['count']}")
+
+    streams = snap['streams']
+    metric("ds_stream_fps", "gauge", "Frames per second per stream over the last interval")
+    lines.extend(f'ds_stream_fps{{stream="{i}"}} {s["fps"]}' for i, s in streams.items())
+    metric("ds_stream_frames_total", "counter", "Frames processed per stream")
+    lines.extend(f'ds_stream_frames_total{{stream="{i}"}} {s["frames"]}' for i, s in streams.items())
+    metric("ds_stream_objects_total", "counter", "Objects detected per stream")
+    lines.extend(f'ds_stream_objects_total{{stream="{i}"}} {s["objects"]}' for i, s in streams.items())
+    metric("ds_stream_latency_seconds", "histogram", "Time from streammux input to the metadata probe")
+    for i, s in streams.items():
+        histogram("ds_stream_latency_seconds", s['latency_seconds'], f'stream="{i}"')
+    metric("ds_probe_seconds", "histogram", "Metadata probe execution time per batch")
+    histogram("ds_probe_seconds", snap['probe_seconds'])
+    if 'worker_seconds' in snap:
+        metric("ds_worker_seconds", "histogram", "Decoupled metadata worker time per batch")
+        histogram("ds_worker_seconds", snap['worker_seconds'])
+    metric("ds_element_latency_seconds", "histogram", "Time a buffer spends in a pipeline element")
+    for name, hist in snap['element_latency_seconds'].items():
+        histogram("ds_element_latency_seconds", hist, f'element="{name}"')
+
+    startup = snap.get('startup_seconds')
+    if startup:
+        metric("ds_startup_phase_seconds", "gauge", "Duration of each startup phase")
+        lines.extend(f'ds_startup_phase_seconds{{phase="{name}"}} {seconds:.3f}' for name, seconds in startup.items())
+
+    health = snap.get('source_health')
+    if health is not None:
+        sources = health['sources']
+        metric("ds_source_up", "gauge", "1 while a live source delivers buffers")
+        lines.extend(f'ds_source_up{{stream="{i}"}} {int(s["status"] == "ok")}' for i, s in sources.items())
+        for key, help_text in (('reconnects', "Reconnect attempts per live source"),
+                               ('stalls', "Stalls detected per live source"),
+                               ('errors', "Errors reported by a live source")):
+            metric(f"ds_source_{key}_total", "counter", help_text)
+            lines.extend(f'ds_source_{key}_total{{stream="{i}"}} {s[key]}' for i, s in sources.items())
+        metric("ds_source_recovery_seconds", "histogram", "Time a live source was down before recovering")
+        histogram("ds_source_recovery_seconds", health['recovery_seconds'])
+
+    analytics = snap.get('analytics', {})
+    if 'class_counts' in analytics:
+        counts = analytics['class_counts']
+        metric("ds_class_objects", "gauge", "Objects per class in the latest frame")
+        lines.extend(f'ds_class_objects{{stream="{i}",class="{name}"}} {n}'
+                     for i, c in counts.items() for name, n in c['current'].items())
+        metric("ds_class_objects_total", "counter", "Objects per class summed over all frames")
+        lines.extend(f'ds_class_objects_total{{stream="{i}",class="{name}"}} {n}'
+                     for i, c in counts.items() for name, n in c['total'].items())
+    if 'occupancy' in analytics:
+        metric("ds_zone_occupancy", "gauge", "People inside a zone in the latest frame")
+        lines.extend(f'ds_zone_occupancy{{stream="{i}",zone="{zone}"}} {n}'
+                     for i, o in analytics['occupancy'].items() for zone, n in o['current'].items())
+    if 'line_crossing' in analytics:
+        metric("ds_line_crossings_total", "counter", "Tracks crossing a line, per direction")
+        lines.extend(f'ds_line_crossings_total{{stream="{i}",line="{line}",direction="{direction}"}} {n}'
+                     for i, c in analytics['line_crossing'].items() for line, d in c.items()
+                     for direction, n in d.items())
+
+    budget = snap.get('latency_budget')
+    if budget is not None:
+        metric("ds_latency_budget_seconds", "gauge", "End-to-end latency budget per frame")
+        lines.append(f"ds_latency_budget_seconds {budget['budget']}")
+        metric("ds_stream_pts_latency_seconds", "histogram", "Time from a frame's PTS to the metadata probe")
+        for i, s in streams.items():
+            if 'pts_latency_seconds' in s:
+                histogram("ds_stream_pts_latency_seconds", s['pts_latency_seconds'], f'stream="{i}"')
+        metric("ds_stream_frames_dropped_total", "counter",
+               "Frames dropped before inference, over the budget or by the leaky queue")
+        for reason, key in (('budget', 'dropped'), ('queue', 'lost')):
+            lines.extend(f'ds_stream_frames_dropped_total{{stream="{i}",reason="{reason}"}} {s[key]}'
+                         for i, s in streams.items() if key in s)
+        metric("ds_inference_queue_drops_total", "counter", "Batches dropped by the leaky queue before nvinfer")
+        lines.append(f"ds_inference_queue_drops_total {budget['queue_drops']}")
+
+    evidence = snap.get('evidence')
+    if evidence is not None:
+        metric("ds_evidence_images_total", "counter", "Alert evidence images queued for saving")
+        lines.append(f"ds_evidence_images_total {evidence['captured']}")
+        metric("ds_evidence_dropped_total", "counter", "Alert evidence images not taken, per reason")
+        lines.extend(f'ds_evidence_dropped_total{{reason="{reason}"}} {evidence[reason]}'
+                     for reason in ('rate_limited', 'queue_full', 'errors'))
+        metric("ds_evidence_bytes", "gauge", "Disk space used by evidence files")
+        lines.append(f"ds_evidence_bytes {evidence['bytes']}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """Aggregates Metrics every interval; serves them as Prometheus text
+    over HTTP (GET /metrics) and/or writes them to a JSON file, and hands
+    each snapshot to publish, if given."""
+
+    def __init__(self, metrics: Metrics, port: int = None, json_path: str = None, interval: float = 5.0,
+                 host: str = '127.0.0.1', publish: Callable[[dict], None] = None):
+        self.metrics = metrics
+        self.json_path = json_path
+        self.interval = interval
+        self.publish = publish
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics", daemon=True)
+        self._server = None
+        if port is not None:
+            self._server = ThreadingHTTPServer((host, port), self._handler())
+            self._server.daemon_threads = True
+
+    def _handler(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] == '/metrics':
+                    body, content_type = metrics.prometheus_text().encode(), "text/plain; version=0.0.4"
+                elif self.path.split('?')[0] == '/metrics.json':
+                    body, content_type = json.dumps(metrics.snapshot()).encode(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    @property
+    def port(self) -> Optional[int]:
+        return self._server.server_address[1] if self._server is not None else None
+
+    def start(self):
+        self.metrics.aggregate()
+        if self._server is not None:
+            threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+            log.info("Metrics at http://%s:%d/metrics", *self._server.server_address[:2])
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        self._publish(self.metrics.aggregate())
+        self._write_json()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            snap = self.metrics.aggregate()
+            self._publish(snap)
+            self._write_json()
+            log.info("**PERF: %s", {i: s['fps'] for i, s in snap['streams'].items()})
+
+    def _publish(self, snap: dict):
+        if self.publish is not None:
+            try:
+                self.publish(snap)
+            except OSError as e:
+                log.warning("Unable to publish metrics: %s", e)
+
+    def _write_json(self):
+        if not self.json_path:
+            return
+        tmp = self.json_path + ".tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self.metrics.snapshot(), f, indent=1)
+            os.replace(tmp, self.json_path)
+        except OSError as e:
+            log.warning("Unable to write metrics to %s: %s", self.json_path, e)
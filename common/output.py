@@ -0,0 +1,112 @@
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+from common.config import OUTPUT_MODES
+from common.is_aarch_64 import is_aarch64
+from common.log import get_logger
+
+log = get_logger('output')
+
+# Local UDP port the encoder streams to and the RTSP server reads from
+RTSP_UDP_PORT = 5400
+
+
+class OutputConfig:
+    def __init__(self, mode: str = 'display', osd: bool = True, path: str = 'out.mp4',
+                 bitrate: int = 4000000, rtsp_port: int = 8554, rtsp_path: str = '/ds-test'):
+        if mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode {mode!r}, expected one of {', '.join(OUTPUT_MODES)}")
+        self.mode = mode
+        # Without OSD nvvideoconvert/nvdsosd are left out and no overlay is drawn
+        self.osd = osd
+        self.path = path
+        self.bitrate = bitrate
+        self.rtsp_port = rtsp_port
+        self.rtsp_path = rtsp_path
+
+    @property
+    def renders(self) -> bool:
+        # Whether anyone gets to see the frames
+        return self.mode != 'fake'
+
+    @property
+    def needs_eos(self) -> bool:
+        # The MP4 muxer only writes a playable file once it sees EOS
+        return self.mode == 'file'
+
+
+def _make(factory, name):
+    element = Gst.ElementFactory.make(factory, name)
+    if not element:
+        log.error("Unable to create %s", factory)
+    return element
+
+
+def _make_encoder(config: OutputConfig):
+    encoder = _make("nvv4l2h264enc", "encoder")
+    if encoder:
+        encoder.set_property('bitrate', config.bitrate)
+        if is_aarch64():
+            encoder.set_property('preset-level', 1)
+            encoder.set_property('insert-sps-pps', 1)
+    return encoder
+
+
+def create_output_elements(config: OutputConfig):
+    """Elements after the OSD for the configured output mode, in link order."""
+    if config.mode == 'display':
+        return {'sink': _make("nv3dsink", "nv3d-sink")}
+
+    if config.mode == 'fake':
+        sink = _make("fakesink", "fake-sink")
+        if sink:
+            sink.set_property('sync', False)
+            sink.set_property('enable-last-sample', False)
+        return {'sink': sink}
+
+    # Encoded outputs: convert to I420 for the hardware encoder
+    elements = {'nvvidconv_postosd': _make("nvvideoconvert", "convertor-postosd")}
+    caps = _make("capsfilter", "filter")
+    if caps:
+        caps.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM), format=I420"))
+    elements['caps'] = caps
+    elements['encoder'] = _make_encoder(config)
+
+    if config.mode == 'file':
+        elements['parser'] = _make("h264parse", "h264-parser")
+        elements['mux'] = _make("qtmux", "mp4-mux")
+        sink = _make("filesink", "file-sink")
+        if sink:
+            sink.set_property('location', config.path)
+            sink.set_property('sync', False)
+            sink.set_property('async', False)
+        elements['sink'] = sink
+    else:
+        elements['rtppay'] = _make("rtph264pay", "rtp-payload")
+        sink = _make("udpsink", "udp-sink")
+        if sink:
+            sink.set_property('host', '224.224.255.255')
+            sink.set_property('port', RTSP_UDP_PORT)
+            sink.set_property('async', False)
+            sink.set_property('sync', 1)
+        elements['sink'] = sink
+    return elements
+
+
+def start_rtsp_server(config: OutputConfig):
+    """Serve the RTP stream sent to RTSP_UDP_PORT at rtsp://<host>:<rtsp_port><rtsp_path>."""
+    gi.require_version('GstRtspServer', '1.0')
+    from gi.repository import GstRtspServer
+
+    server = GstRtspServer.RTSPServer.new()
+    server.props.service = str(config.rtsp_port)
+    server.attach(None)
+
+    factory = GstRtspServer.RTSPMediaFactory.new()
+    factory.set_launch(
+        "( udpsrc name=pay0 port=%d buffer-size=524288 caps=\"application/x-rtp, media=video, "
+        "clock-rate=90000, encoding-name=(string)H264, payload=96 \" )" % RTSP_UDP_PORT)
+    factory.set_shared(True)
+    server.get_mount_points().add_factory(config.rtsp_path, factory)
+    log.info("RTSP output at rtsp://localhost:%d%s", config.rtsp_port, config.rtsp_path)
+    return server
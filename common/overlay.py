@@ -0,0 +1,136 @@
+from typing import List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+import pyds
+
+from common.zones import Zone
+
+# Max number of rects, lines and labels in one NvDsDisplayMeta
+MAX_DISPLAY_ELEMENTS = 16
+
+Color = Tuple[float, float, float, float]
+
+WHITE = (1.0, 1.0, 1.0, 1.0)
+BLACK = (0.0, 0.0, 0.0, 1.0)
+NO_COLOR = (0.0, 0.0, 0.0, 0.0)
+ZONE_COLOR = (0.0, 1.0, 0.0, 0.8)
+ZONE_ALERT_COLOR = (1.0, 0.0, 0.0, 0.8)
+BOX_COLOR = (0.0, 0.0, 1.0, 0.8)
+BOX_ALERT_COLOR = (1.0, 0.0, 0.0, 0.8)
+
+ALERT_MESSAGE = "⚠ ALERT: Person(s) in restricted area!"
+FRAME_INFO = "Frame Number={} Number of Objects={} Person_count={} Bag_count={} Face_count={}".format
+
+
+def object_label(object_id: int, label: str, alert: bool) -> str:
+    return f"ALERT! ID={object_id} {label}" if alert else f"ID={object_id} {label}"
+
+
+class TextStyle(NamedTuple):
+    font_name: str
+    font_size: int
+    font_color: Color
+    bg_color: Color
+
+
+FRAME_INFO_STYLE = TextStyle("Serif", 10, WHITE, BLACK)
+ALERT_STYLE = TextStyle("Serif", 20, (1.0, 0.0, 0.0, 1.0), (0.0, 0.0, 0.0, 0.8))
+ZONE_LABEL_STYLE = TextStyle("Serif", 15, (0.0, 1.0, 0.0, 1.0), BLACK)
+
+
+def set_text(text_params, text: str, x: int, y: int, style: TextStyle):
+    text_params.display_text = text
+    text_params.x_offset = x
+    text_params.y_offset = y
+    font_params = text_params.font_params
+    font_params.font_name = style.font_name
+    font_params.font_size = style.font_size
+    font_params.font_color.set(*style.font_color)
+    text_params.set_bg_clr = 1
+    text_params.text_bg_clr.set(*style.bg_color)
+
+
+class _MetaLayout(NamedTuple):
+    # Elements of one display meta; rects and lines carry their zone index
+    # so their color can follow the zone's alert state
+    rects: List[Tuple[int, float, float, float, float]]
+    labels: List[Tuple[str, int, int]]
+    lines: List[Tuple[int, int, int, int, int]]
+
+
+class StreamOverlay:
+    """Frame info, alert message and zone outlines of one stream.
+
+    Everything that does not change from frame to frame (geometry, label
+    text and offsets, the split over display metas) is computed once when
+    the stream's zones are set, so a frame only fills in precomputed values
+    plus the frame text and the zone colors.
+    """
+
+    # Labels 0 and 1 of the first display meta hold frame info and alert
+    RESERVED_LABELS = 2
+
+    def __init__(self, zones: Sequence[Zone]):
+        rects = []
+        labels = []
+        lines = []
+        for index, zone in enumerate(zones):
+            left, top, width, height = zone.bounds.tolist()
+            if zone.is_rect:
+                rects.append((index, left, top, width, height))
+            else:
+                points = zone.points.astype(np.int64)
+                for (x1, y1), (x2, y2) in zip(points.tolist(), np.roll(points, -1, axis=0).tolist()):
+                    lines.append((index, x1, y1, x2, y2))
+            labels.append((zone.zone_id, int(left), int(max(top - 10, 0))))
+
+        labels = [None] * self.RESERVED_LABELS + labels
+        n = MAX_DISPLAY_ELEMENTS
+        num_metas = max(-(-len(items) // n) for items in (rects, labels, lines))
+        self.layout = [_MetaLayout(rects[i * n:(i + 1) * n], labels[i * n:(i + 1) * n], lines[i * n:(i + 1) * n])
+                       for i in range(num_metas)]
+
+    def add_to_frame(self, batch_meta, frame_meta, frame_text: str, alert: bool, active_zones: np.ndarray):
+        colors = [ZONE_ALERT_COLOR if is_active else ZONE_COLOR for is_active in active_zones.tolist()]
+        for meta_index, (rects, labels, lines) in enumerate(self.layout):
+            display_meta = pyds.nvds_acquire_display_meta_from_pool(batch_meta)
+            display_meta.num_rects = len(rects)
+            display_meta.num_labels = len(labels)
+            display_meta.num_lines = len(lines)
+
+            first = 0
+            if meta_index == 0:
+                set_text(display_meta.text_params[0], frame_text, 10, 12, FRAME_INFO_STYLE)
+                alert_text_params = display_meta.text_params[1]
+                if alert:
+                    set_text(alert_text_params, ALERT_MESSAGE, 10, 50, ALERT_STYLE)
+                else:
+                    alert_text_params.display_text = ""
+                first = self.RESERVED_LABELS
+
+            for i, (zone_index, left, top, width, height) in enumerate(rects):
+                rect_params = display_meta.rect_params[i]
+                rect_params.left = left
+                rect_params.top = top
+                rect_params.width = width
+                rect_params.height = height
+                rect_params.border_width = 2
+                rect_params.border_color.set(*colors[zone_index])
+                rect_params.has_bg_color = 0
+                rect_params.bg_color.set(*NO_COLOR)
+
+            for i in range(first, len(labels)):
+                text, x, y = labels[i]
+                set_text(display_meta.text_params[i], text, x, y, ZONE_LABEL_STYLE)
+
+            for i, (zone_index, x1, y1, x2, y2) in enumerate(lines):
+                line_params = display_meta.line_params[i]
+                line_params.x1 = x1
+                line_params.y1 = y1
+                line_params.x2 = x2
+                line_params.y2 = y2
+                line_params.line_width = 2
+                line_params.line_color.set(*colors[zone_index])
+
+            pyds.nvds_add_display_meta_to_frame(frame_meta, display_meta)
+
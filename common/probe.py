@@ -0,0 +1,589 @@
+import functools
+import logging
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pyds
+
+from common.analytics import AnalyticsEngine
+from common.clock import FrameClock
+from common.events import EVENT_ALERT, EventDispatcher
+from common.evidence import EvidenceRecorder, FrameProvider
+from common.log import RateLimiter, Sampler, get_logger
+from common.metrics import PROBE_BUCKETS, Histogram, Metrics
+from common.overlay import BOX_ALERT_COLOR, BOX_COLOR, FRAME_INFO, StreamOverlay, object_label
+from common.replay import ReplayFrame, ReplayWriter
+from common.roi import DetectionBatch
+from common.scheduler import InferenceScheduler
+from common.snapshot import BatchSnapshot, FrameResult, SnapshotWorker
+from common.trajectory import FrameTimes, TrackHistory
+from common.zones import Zone, ZoneMonitor
+
+# Update class IDs according to PeopleNet labels
+PGIE_CLASS_ID_PERSON = 0
+PGIE_CLASS_ID_BAG = 1
+PGIE_CLASS_ID_FACE = 2
+
+log = get_logger('probe')
+
+
+class FrameProcessor:
+    """Per-batch metadata processing done by the pipeline's buffer probe.
+
+    Kept free of GStreamer so it can be driven from recorded or synthetic
+    metadata. Debug output is rate limited per stream and only formatted
+    when the debug level is enabled.
+    """
+
+    def __init__(self, roi_zone: Optional[Zone], stream_zones: Dict[int, List[Zone]] = None,
+                 clock: FrameClock = None, track_limits: Dict = None, events: EventDispatcher = None,
+                 frame_log_interval: float = 1.0, object_log_every: int = 30, annotate: bool = True,
+                 recorder: ReplayWriter = None, metrics: Metrics = None, scheduler: InferenceScheduler = None,
+                 track_history: int = 30, analytics: AnalyticsEngine = None, decoupled: bool = False,
+                 evidence: EvidenceRecorder = None):
+        # The ROI, if any, is the first zone of every stream
+        self.roi_zone = roi_zone
+        self.stream_zones = stream_zones or {}
+        # Zones per stream set by set_zones, swapped in on the next batch
+        self._pending_zones: Optional[Dict[int, List[Zone]]] = None
+        self.clock = clock or FrameClock()
+        # Expiry settings for per-track zone state, see DwellState
+        self.track_limits = track_limits or {}
+        # Zone enter/leave/alert events go to a background dispatcher, if any
+        self.events = events
+        # Set when nvtracker reports frames it tracked objects in shadow mode
+        self.past_tracking_meta = 0
+        # Recent trajectory per track and frame times per stream, the latter
+        # to place past-frame metadata in time
+        self.track_history = track_history
+        self.histories: Dict[int, TrackHistory] = {}
+        self.frame_times: Dict[int, FrameTimes] = {}
+        # Zone and alert state per stream, keyed by frame_meta.pad_index
+        self.zone_monitors: Dict[int, ZoneMonitor] = {}
+        # Precomputed OSD overlay per stream
+        self.overlays: Dict[int, StreamOverlay] = {}
+        # Without an OSD downstream nobody sees the overlay, so it is skipped
+        self.annotate = annotate
+        # Detections of every frame are written here for later replay, if set
+        self.recorder = recorder
+        # Per-stream FPS/latency and probe time, if metrics are collected
+        self.metrics = metrics
+        # Inference rate per stream from zone activity, if scheduled
+        self.scheduler = scheduler
+        # Line crossing, occupancy and class counts, fed once per frame
+        self.analytics = analytics
+        # Images of alerts, from the frames passed to process_batch
+        self.evidence = evidence
+        # Decoupled mode: alerts reported by the worker, captured with the
+        # stream's next frame
+        self._late_alerts: Dict[int, list] = {}
+        self.frame_log_limiter = RateLimiter(frame_log_interval)
+        self.object_log_sampler = Sampler(object_log_every)
+        # Decoupled mode: the probe copies the metadata into snapshots that a
+        # worker thread processes, and draws from the worker's latest results
+        self.worker: Optional[SnapshotWorker] = None
+        self.results: Dict[int, FrameResult] = {}
+        self._spare: Optional[BatchSnapshot] = None
+        if decoupled:
+            self._spare = BatchSnapshot()
+            if metrics is not None:
+                metrics.worker_time = Histogram(PROBE_BUCKETS)
+            self.worker = SnapshotWorker(self.process_snapshot)
+
+    def zones_for(self, index: int) -> List[Zone]:
+        roi = [self.roi_zone] if self.roi_zone is not None else []
+        return roi + self.stream_zones.get(index, [])
+
+    def add_stream(self, index: int) -> ZoneMonitor:
+        monitor = ZoneMonitor(self.zones_for(index), **self.track_limits)
+        self.zone_monitors[index] = monitor
+        self.overlays[index] = StreamOverlay(monitor.zones)
+        if self.track_history:
+            self.histories[index] = TrackHistory(self.track_history)
+        self.frame_times[index] = FrameTimes()
+        if self.metrics is not None:
+            self.metrics.add_stream(index)
+        if self.scheduler is not None:
+            self.scheduler.add_stream(index)
+        if self.analytics is not None:
+            self.analytics.add_stream(index)
+        return monitor
+
+    def remove_stream(self, index: int):
+        # Forget everything about a removed source, so a source added later
+        # under the same index starts with clean zone and clock state
+        self.zone_monitors.pop(index, None)
+        self.overlays.pop(index, None)
+        self.histories.pop(index, None)
+        self.frame_times.pop(index, None)
+        self.results.pop(index, None)
+        self.clock.reset(index)
+        if self.metrics is not None:
+            self.metrics.remove_stream(index)
+        if self.scheduler is not None:
+            self.scheduler.remove_stream(index)
+        if self.analytics is not None:
+            self.analytics.remove_stream(index)
+        if self.evidence is not None:
+            self.evidence.remove_stream(index)
+        self._late_alerts.pop(index, None)
+
+    def set_zones(self, roi_zone: Optional[Zone], stream_zones: Dict[int, List[Zone]]):
+        # Called on the main loop, e.g. on a config reload. The monitors are
+        # replaced by the streaming thread between batches, so a frame never
+        # sees half of the old and half of the new zones
+        self.roi_zone = roi_zone
+        self.stream_zones = stream_zones
+        self._pending_zones = {index: self.zones_for(index) for index in list(self.zone_monitors)}
+
+    def swap_zones(self, pending: Dict[int, List[Zone]]):
+        for index, zones in pending.items():
+            monitor = self.zone_monitors.get(index)
+            if monitor is None:
+                continue
+            # Zones that keep their id keep their dwell timers
+            self.overlays[index] = StreamOverlay(zones)
+            self.zone_monitors[index] = monitor.with_zones(zones)
+
+    def apply_pending_zones(self):
+        pending = self._pending_zones
+        if pending is not None:
+            self._pending_zones = None
+            self.swap_zones(pending)
+
+    def process_batch(self, batch_meta, frames: FrameProvider = None):
+        # frames gives access to the pixels, for evidence capture
+        if self.worker is not None:
+            self.snapshot_batch(batch_meta, frames)
+            return
+        self.apply_pending_zones()
+        # Checked once per batch so disabled debug output costs nothing per object
+        debug = log.isEnabledFor(logging.DEBUG)
+        # Shadow-tracked frames precede the frames of this batch
+        if self.past_tracking_meta == 1:
+            self.fold_past_frame_meta(batch_meta, debug)
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+            now = time.monotonic()
+
+        l_frame = batch_meta.frame_meta_list
+        while l_frame is not None:
+            try:
+                # Note that l_frame.data needs a cast to pyds.NvDsFrameMeta
+                # The casting is done by pyds.NvDsFrameMeta.cast()
+                # The casting also keeps ownership of the underlying memory
+                # in the C code, so the Python garbage collector will leave
+                # it alone.
+                frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
+            except StopIteration:
+                break
+
+            self.process_frame(batch_meta, frame_meta, debug, frames)
+            if metrics is not None:
+                metrics.frame(frame_meta.pad_index, frame_meta.num_obj_meta, frame_meta.buf_pts, now)
+
+            try:
+                l_frame=l_frame.next
+            except StopIteration:
+                break
+
+        if metrics is not None:
+            metrics.probe_time.observe(time.perf_counter() - start)
+
+    def process_frame(self, batch_meta, frame_meta, debug=False, frames: FrameProvider = None):
+        frame_number = frame_meta.frame_num
+        num_rects = frame_meta.num_obj_meta
+        stream_id = frame_meta.pad_index
+        zone_monitor = self.zone_monitors.get(stream_id)
+        overlay = self.overlays.get(stream_id)
+        if zone_monitor is None or overlay is None:
+            # Frame of a source that was removed while it was in flight
+            return
+        # One timestamp per frame drives the dwell time of all its objects
+        frame_time = self.clock.frame_time(stream_id, frame_meta.buf_pts, frame_meta.ntp_timestamp)
+        if self.past_tracking_meta == 1:
+            self.frame_times[stream_id].record(frame_number, frame_time)
+        l_obj = frame_meta.obj_meta_list
+        # Ids and box values of all objects, in the flat layout of
+        # DetectionBatch.from_lists; person metas are kept to draw on
+        ids = []
+        values = []
+        add_ids = ids.extend
+        add_values = values.extend
+        annotate = self.annotate
+        person_metas = [] if annotate else None
+        obj_labels = [] if self.recorder is not None else None
+        while l_obj is not None:
+            try:
+                # Casting l_obj.data to pyds.NvDsObjectMeta
+                obj_meta = pyds.NvDsObjectMeta.cast(l_obj.data)
+            except StopIteration:
+                break
+            rect = obj_meta.rect_params
+            class_id = obj_meta.class_id
+            add_ids((obj_meta.object_id, class_id))
+            add_values((rect.left, rect.top, rect.width, rect.height, obj_meta.confidence))
+            if annotate and class_id == PGIE_CLASS_ID_PERSON:
+                person_metas.append(obj_meta)
+            if obj_labels is not None:
+                obj_labels.append(obj_meta.obj_label)
+
+            try:
+                l_obj = l_obj.next
+            except StopIteration:
+                break
+
+        detections = DetectionBatch.from_lists(ids, values)
+        if obj_labels is not None:
+            self.recorder.write(ReplayFrame(
+                stream_id, frame_number, frame_meta.buf_pts, frame_meta.ntp_timestamp,
+                [(object_id, class_id, *box, confidence, label) for object_id, class_id, box, confidence, label
+                 in zip(detections.track_ids.tolist(), detections.class_ids.tolist(), detections.boxes.tolist(),
+                        detections.confidences.tolist(), obj_labels)]))
+
+        # Check all persons of the frame against the zones in one call
+        persons = detections.class_ids == PGIE_CLASS_ID_PERSON
+        track_ids = detections.track_ids[persons]
+        boxes = detections.boxes[persons]
+        zone_update = None
+        alerts = ()
+        if len(track_ids):
+            confidences = detections.confidences[persons] if stream_id in self.histories else None
+            zone_update, alerts = self.update_zones(stream_id, frame_number, frame_time, zone_monitor, track_ids,
+                                                    boxes, confidences, debug)
+
+            if annotate:
+                for obj_meta, is_alert in zip(person_metas, zone_update.alert.tolist()):
+                    # Red box for alerts, blue otherwise
+                    obj_meta.rect_params.border_color.set(*(BOX_ALERT_COLOR if is_alert else BOX_COLOR))
+                    obj_meta.text_params.display_text = object_label(obj_meta.object_id, obj_meta.obj_label, is_alert)
+
+        if frames is not None and self.evidence is not None and (alerts or self.evidence.recording(stream_id)):
+            self.evidence.capture(stream_id, frame_number, frame_time, alerts, functools.partial(frames.get, frame_meta))
+
+        if self.analytics is not None:
+            self.analytics.process(stream_id, frame_number, frame_time, detections.track_ids, detections.class_ids,
+                                   detections.boxes, persons, zone_monitor, zone_update)
+
+        if self.scheduler is not None:
+            active = zone_update is not None and zone_monitor.near(boxes, self.scheduler.margin)
+            self.scheduler.observe(stream_id, frame_time, active)
+
+        log_frame = debug and self.frame_log_limiter.allow(stream_id)
+        if not (annotate or log_frame):
+            return
+        class_counts = np.bincount(detections.class_ids, minlength=PGIE_CLASS_ID_FACE + 1)
+        frame_text = FRAME_INFO(frame_number, num_rects,
+                                class_counts[PGIE_CLASS_ID_PERSON],
+                                class_counts[PGIE_CLASS_ID_BAG],
+                                class_counts[PGIE_CLASS_ID_FACE])
+        if self.annotate:
+            # Frame info, alert message and zone outlines from the stream's overlay
+            overlay.add_to_frame(batch_meta, frame_meta, frame_text,
+                                  zone_monitor.has_active_alerts(), zone_monitor.active_zones())
+
+        if log_frame:
+            log.debug("Stream %d: %s", stream_id, frame_text)
+
+    def snapshot_batch(self, batch_meta, frames: FrameProvider = None):
+        # Decoupled mode, streaming thread side: copy the batch, wait for the
+        # worker to finish the previous one and hand this one over, then draw
+        # from the previous batch's results
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+            now = time.monotonic()
+        snapshot = self._spare
+        snapshot.clear()
+        if self.past_tracking_meta == 1:
+            snapshot.past = self.collect_past_frame_meta(batch_meta)
+        annotate = self.annotate
+        capture = frames is not None and self.evidence is not None
+        labels = snapshot.labels = [] if self.recorder is not None else None
+        frame_rows = []
+        ids = []
+        values = []
+        add_ids = ids.extend
+        add_values = values.extend
+        # Frame metas and their person metas, to draw on and capture from once
+        # the results are in
+        drawn = []
+
+        l_frame = batch_meta.frame_meta_list
+        while l_frame is not None:
+            try:
+                frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
+            except StopIteration:
+                break
+            first = len(ids) // 2
+            person_metas = [] if annotate else None
+            l_obj = frame_meta.obj_meta_list
+            while l_obj is not None:
+                try:
+                    obj_meta = pyds.NvDsObjectMeta.cast(l_obj.data)
+                except StopIteration:
+                    break
+                rect = obj_meta.rect_params
+                class_id = obj_meta.class_id
+                add_ids((obj_meta.object_id, class_id))
+                add_values((rect.left, rect.top, rect.width, rect.height, obj_meta.confidence))
+                if annotate and class_id == PGIE_CLASS_ID_PERSON:
+                    person_metas.append(obj_meta)
+                if labels is not None:
+                    labels.append(obj_meta.obj_label)
+                try:
+                    l_obj = l_obj.next
+                except StopIteration:
+                    break
+
+            frame_rows.append((frame_meta.pad_index, frame_meta.frame_num, frame_meta.buf_pts,
+                               frame_meta.ntp_timestamp, frame_meta.num_obj_meta, first, len(ids) // 2))
+            if annotate or capture:
+                drawn.append((frame_meta, person_metas))
+            if metrics is not None:
+                metrics.frame(frame_meta.pad_index, frame_meta.num_obj_meta, frame_meta.buf_pts, now)
+            try:
+                l_frame = l_frame.next
+            except StopIteration:
+                break
+
+        snapshot.fill(frame_rows, ids, values)
+        previous = self.worker.collect()
+        if previous is not None:
+            self.take_results(previous.results)
+        self.worker.submit(snapshot)
+        self._spare = previous if previous is not None else BatchSnapshot()
+
+        for (frame_meta, person_metas), frame in zip(drawn, snapshot.frames[:len(drawn)].tolist()):
+            if annotate:
+                self.draw_frame(batch_meta, frame_meta, person_metas, snapshot.objects[frame[5]:frame[6]])
+            if capture:
+                self.capture_late_evidence(frame_meta, frames)
+        if metrics is not None:
+            metrics.probe_time.observe(time.perf_counter() - start)
+
+    def take_results(self, results: Dict[int, FrameResult]):
+        self.results.update(results)
+        if self.evidence is not None:
+            for stream_id, result in results.items():
+                if result.alerts:
+                    self._late_alerts.setdefault(stream_id, []).extend(result.alerts)
+
+    def capture_late_evidence(self, frame_meta, frames: FrameProvider):
+        # Alerts the worker found in the stream's previous frame, captured
+        # from this frame with the boxes they had then
+        stream_id = frame_meta.pad_index
+        alerts = self._late_alerts.pop(stream_id, ())
+        if alerts or self.evidence.recording(stream_id):
+            result = self.results.get(stream_id)
+            frame_time = result.time if result is not None else 0.0
+            self.evidence.capture(stream_id, frame_meta.frame_num, frame_time, alerts,
+                                  functools.partial(frames.get, frame_meta))
+
+    def draw_frame(self, batch_meta, frame_meta, person_metas, objects):
+        # Boxes, labels and zone colors from the worker's result for the
+        # stream's previous frame; new tracks are drawn without alert
+        stream_id = frame_meta.pad_index
+        result = self.results.get(stream_id)
+        if result is not None:
+            overlay, alert, active_zones = result.overlay, result.alert, result.active_zones
+        else:
+            overlay = self.overlays.get(stream_id)
+            zone_monitor = self.zone_monitors.get(stream_id)
+            if overlay is None or zone_monitor is None:
+                return
+            alert, active_zones = False, np.zeros(len(zone_monitor.zones), dtype=bool)
+        class_ids = objects['class_id']
+        if person_metas:
+            if result is not None and len(result.alert_ids):
+                alerts = np.isin(objects['object_id'][class_ids == PGIE_CLASS_ID_PERSON], result.alert_ids).tolist()
+            else:
+                alerts = [False] * len(person_metas)
+            for obj_meta, is_alert in zip(person_metas, alerts):
+                obj_meta.rect_params.border_color.set(*(BOX_ALERT_COLOR if is_alert else BOX_COLOR))
+                obj_meta.text_params.display_text = object_label(obj_meta.object_id, obj_meta.obj_label, is_alert)
+        class_counts = np.bincount(class_ids, minlength=PGIE_CLASS_ID_FACE + 1)
+        frame_text = FRAME_INFO(frame_meta.frame_num, frame_meta.num_obj_meta, class_counts[PGIE_CLASS_ID_PERSON],
+                                class_counts[PGIE_CLASS_ID_BAG], class_counts[PGIE_CLASS_ID_FACE])
+        overlay.add_to_frame(batch_meta, frame_meta, frame_text, alert, active_zones)
+
+    def process_snapshot(self, snapshot: BatchSnapshot):
+        # Decoupled mode, worker thread side: everything process_batch does
+        # except drawing, on the copied arrays
+        if self.metrics is not None:
+            start = time.perf_counter()
+        self.apply_pending_zones()
+        debug = log.isEnabledFor(logging.DEBUG)
+        if snapshot.past:
+            self.fold_collected_past_frames(snapshot.past, debug)
+        objects = snapshot.objects
+        for stream_id, frame_number, pts, ntp, num_rects, first, end in snapshot.frames[:snapshot.num_frames].tolist():
+            zone_monitor = self.zone_monitors.get(stream_id)
+            if zone_monitor is None:
+                continue
+            frame_time = self.clock.frame_time(stream_id, pts, ntp)
+            if self.past_tracking_meta == 1:
+                self.frame_times[stream_id].record(frame_number, frame_time)
+            detections = DetectionBatch.from_records(objects[first:end])
+            track_ids = detections.track_ids
+            class_ids = detections.class_ids
+            boxes = detections.boxes
+            if snapshot.labels is not None:
+                self.recorder.write(ReplayFrame(
+                    stream_id, frame_number, pts, ntp,
+                    [(object_id, class_id, *box, confidence, label) for object_id, class_id, box, confidence, label
+                     in zip(track_ids.tolist(), class_ids.tolist(), boxes.tolist(), detections.confidences.tolist(),
+                            snapshot.labels[first:end])]))
+
+            persons = class_ids == PGIE_CLASS_ID_PERSON
+            person_ids = track_ids[persons]
+            person_boxes = boxes[persons]
+            zone_update = None
+            alerts = ()
+            if len(person_ids):
+                confidences = detections.confidences[persons] if stream_id in self.histories else None
+                zone_update, alerts = self.update_zones(stream_id, frame_number, frame_time, zone_monitor,
+                                                        person_ids, person_boxes, confidences, debug)
+            if self.analytics is not None:
+                self.analytics.process(stream_id, frame_number, frame_time, track_ids, class_ids, boxes, persons,
+                                       zone_monitor, zone_update)
+            if self.scheduler is not None:
+                active = zone_update is not None and zone_monitor.near(person_boxes, self.scheduler.margin)
+                self.scheduler.observe(stream_id, frame_time, active)
+
+            overlay = self.overlays.get(stream_id)
+            if (self.annotate or self.evidence is not None) and overlay is not None:
+                # Without persons person_ids is empty
+                alert_ids = person_ids[zone_update.alert] if zone_update is not None else person_ids
+                snapshot.results[stream_id] = FrameResult(frame_number, frame_time, list(alerts), overlay,
+                                                          alert_ids, zone_monitor.has_active_alerts(),
+                                                          zone_monitor.active_zones())
+            if debug and self.frame_log_limiter.allow(stream_id):
+                class_counts = np.bincount(class_ids, minlength=PGIE_CLASS_ID_FACE + 1)
+                log.debug("Stream %d: %s", stream_id,
+                          FRAME_INFO(frame_number, num_rects, class_counts[PGIE_CLASS_ID_PERSON],
+                                     class_counts[PGIE_CLASS_ID_BAG], class_counts[PGIE_CLASS_ID_FACE]))
+        if self.metrics is not None:
+            self.metrics.worker_time.observe(time.perf_counter() - start)
+
+    def stop(self):
+        # Finish the batch the worker is on; the pipeline is stopped by then
+        if self.worker is not None:
+            last = self.worker.stop()
+            if last is not None:
+                self.take_results(last.results)
+
+    def update_zones(self, stream_id, frame_number, frame_time, zone_monitor, track_ids, boxes, confidences,
+                     debug=False):
+        # Track history, zone state, events and sampled debug output for the
+        # persons of one frame. Returns the zone update and, with evidence
+        # capture, the (track id, zone id, bbox) of the alerts that fired
+        history = self.histories.get(stream_id)
+        if history is not None:
+            history.append(track_ids, frame_number, boxes, confidences)
+        zone_update = zone_monitor.update(track_ids, boxes, frame_time)
+        alerts = ()
+        if self.events is not None or self.evidence is not None:
+            transitions = zone_monitor.transitions(zone_update, track_ids)
+            if self.events is not None:
+                self.push_zone_events(stream_id, frame_number, transitions, frame_time)
+            if self.evidence is not None:
+                alerts = [(track_id, zone_id, boxes[detection].tolist())
+                          for event_type, zone_id, track_id, detection in transitions if event_type == EVENT_ALERT]
+        if debug and self.object_log_sampler.allow(stream_id):
+            log.debug("Stream %d frame %d: %s", stream_id, frame_number,
+                      ", ".join(f"track {track_ids[d]} in {zone_monitor.zones[z].zone_id} ratio={r:.2f}"
+                                for d, z, r in zip(zone_update.detection.tolist(), zone_update.zone.tolist(),
+                                                   zone_update.pairs.ratio.tolist())))
+        return zone_update, alerts
+
+    def push_zone_events(self, stream_id, frame_number, transitions, frame_time):
+        # frame_number and frame_time are arrays indexed by the transitions'
+        # detection index for detections from several (past) frames
+        if not transitions:
+            return
+        wall_time = time.time()
+        per_detection = np.ndim(frame_time) > 0
+        for event_type, zone_id, track_id, detection in transitions:
+            self.events.push({
+                'type': event_type,
+                'stream': stream_id,
+                'frame': int(frame_number[detection]) if per_detection else frame_number,
+                'zone': zone_id,
+                'track': track_id,
+                'time': float(frame_time[detection]) if per_detection else frame_time,
+                'wall_time': wall_time,
+            })
+
+    def fold_past_frame_meta(self, batch_meta, debug=False):
+        # nvtracker reports the frames in which it followed objects without
+        # reporting them (shadow mode) once they are reported again. Those
+        # frames go into the track histories and the zone state, so time
+        # spent in a zone while in shadow mode counts toward dwell.
+        self.fold_collected_past_frames(self.collect_past_frame_meta(batch_meta), debug)
+
+    def collect_past_frame_meta(self, batch_meta) -> Dict:
+        # Person track ids and (frame, left, top, width, height, confidence)
+        # rows of the shadow-tracked frames, per stream
+        past = {}
+        l_user = batch_meta.batch_user_meta_list
+        while l_user is not None:
+            try:
+                user_meta = pyds.NvDsUserMeta.cast(l_user.data)
+            except StopIteration:
+                break
+            if user_meta and user_meta.base_meta.meta_type == pyds.NvDsMetaType.NVDS_TRACKER_PAST_FRAME_META:
+                try:
+                    past_batch = pyds.NvDsPastFrameObjBatch.cast(user_meta.user_meta_data)
+                except StopIteration:
+                    break
+                for past_stream in pyds.NvDsPastFrameObjBatch.list(past_batch):
+                    ids, rows = past.setdefault(past_stream.streamID, ([], []))
+                    for past_track in pyds.NvDsPastFrameObjStream.list(past_stream):
+                        if past_track.classId != PGIE_CLASS_ID_PERSON:
+                            continue
+                        track_id = past_track.uniqueId
+                        for past_obj in pyds.NvDsPastFrameObjList.list(past_track):
+                            box = past_obj.tBbox
+                            ids.append(track_id)
+                            rows.append((past_obj.frameNum, box.left, box.top, box.width, box.height,
+                                         past_obj.confidence))
+            try:
+                l_user = l_user.next
+            except StopIteration:
+                break
+        return past
+
+    def fold_collected_past_frames(self, past: Dict, debug=False):
+        for stream_id, (ids, rows) in past.items():
+            if not ids:
+                continue
+            rows = np.array(rows, dtype=np.float64)
+            self.fold_past_frames(stream_id, np.array(ids, dtype=np.uint64), rows[:, 0].astype(np.int64),
+                                  rows[:, 1:5], rows[:, 5])
+            if debug and self.frame_log_limiter.allow(('past-frame', stream_id)):
+                log.debug("Stream %d: %d shadow-tracked frames of %d tracks", stream_id, len(ids), len(set(ids)))
+
+    def fold_past_frames(self, stream_id, track_ids, frames, boxes, confidences):
+        zone_monitor = self.zone_monitors.get(stream_id)
+        if zone_monitor is None:
+            return
+        # Oldest first, so the entries of a track are stored and applied in order
+        order = np.argsort(frames, kind='stable')
+        track_ids, frames, boxes, confidences = track_ids[order], frames[order], boxes[order], confidences[order]
+        history = self.histories.get(stream_id)
+        if history is not None:
+            history.append(track_ids, frames, boxes, confidences)
+
+        # Each detection on its own frame's time; frames too old to have a
+        # known time are left out
+        times = self.frame_times[stream_id].lookup(frames)
+        known = ~np.isnan(times)
+        if not known.all():
+            track_ids, frames, boxes, times = track_ids[known], frames[known], boxes[known], times[known]
+        for rows, zone_update in zone_monitor.replay(track_ids, boxes, times):
+            if self.events is not None:
+                self.push_zone_events(stream_id, frames[rows], zone_monitor.transitions(zone_update, track_ids[rows]),
+                                      times[rows])
@@ -0,0 +1,126 @@
+"""Recorded detection metadata, for driving the probe without a GPU.
+
+A replay file is JSON lines: a header line, then one line per frame
+
+    {"format": "ds-meta-replay", "version": 1, "fps": 30.0}
+    {"s": 0, "f": 0, "pts": 0, "ntp": 0, "o": [[object_id, class_id, left, top, width, height, confidence, label], ...]}
+
+Frames of all streams are interleaved in the order they were batched.
+"""
+import json
+import time
+from typing import IO, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+REPLAY_FORMAT = 'ds-meta-replay'
+REPLAY_VERSION = 1
+
+NSEC_PER_SEC = 1_000_000_000
+
+# object_id, class_id, left, top, width, height, confidence, label
+ReplayObject = Tuple[int, int, float, float, float, float, float, str]
+
+
+class ReplayFrame(NamedTuple):
+    stream: int
+    frame_num: int
+    pts: int
+    ntp: int
+    objects: List[ReplayObject]
+
+
+class ReplayWriter:
+    """Appends frames to a replay file, e.g. from the live probe."""
+
+    def __init__(self, path: str, fps: float = 30.0):
+        self.path = path
+        self._file: Optional[IO] = open(path, 'w')
+        self._file.write(json.dumps({'format': REPLAY_FORMAT, 'version': REPLAY_VERSION, 'fps': fps}) + "\n")
+        self.frames = 0
+
+    def write(self, frame: ReplayFrame):
+        self._file.write(json.dumps({'s': frame.stream, 'f': frame.frame_num, 'pts': frame.pts,
+                                     'ntp': frame.ntp, 'o': frame.objects}, separators=(',', ':')) + "\n")
+        self.frames += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_replay(path: str) -> Tuple[dict, List[ReplayFrame]]:
+    with open(path) as f:
+        header = json.loads(f.readline())
+        if header.get('format') != REPLAY_FORMAT:
+            raise ValueError(f"{path}: not a {REPLAY_FORMAT} file")
+        if header.get('version', 0) > REPLAY_VERSION:
+            raise ValueError(f"{path}: unsupported replay version {header['version']}")
+        frames = []
+        for line in f:
+            if not line.strip():
+                continue
+            d = json.loads(line)
+            frames.append(ReplayFrame(d['s'], d['f'], d['pts'], d.get('ntp', 0),
+                                      [tuple(o) for o in d['o']]))
+    return header, frames
+
+
+def synthetic_frames(num_objects: int, num_frames: int, num_streams: int = 1, fps: float = 30.0,
+                     turnover: float = 0.0, seed: int = 0) -> List[ReplayFrame]:
+    """People random-walking over 1920x1080 frames of each stream.
+
+    turnover is the fraction of tracks replaced by new IDs per second, so
+    long replays also exercise track creation and expiry.
+    """
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform([0, 0], [1800, 900], size=(num_streams, num_objects, 2))
+    size = rng.uniform([40, 80], [120, 240], size=(num_streams, num_objects, 2))
+    ids = np.arange(num_streams * num_objects, dtype=np.int64).reshape(num_streams, num_objects)
+    next_id = ids.size
+    frame_ns = int(NSEC_PER_SEC / fps)
+    frames = []
+    for frame_num in range(num_frames):
+        pos += rng.normal(0.0, 15.0, size=pos.shape)
+        np.clip(pos, 0, [1800, 900], out=pos)
+        if turnover:
+            replaced = rng.random(ids.shape) < turnover / fps
+            count = int(replaced.sum())
+            ids[replaced] = np.arange(next_id, next_id + count)
+            next_id += count
+        for stream in range(num_streams):
+            boxes = np.hstack((pos[stream], size[stream])).tolist()
+            objects = [(track_id, 0, *box, 1.0, "Person") for track_id, box in zip(ids[stream].tolist(), boxes)]
+            frames.append(ReplayFrame(stream, frame_num, frame_num * frame_ns, 0, objects))
+    return frames
+
+
+def batch_frames(frames: Iterable[ReplayFrame]) -> Iterator[List[ReplayFrame]]:
+    """Group frames into batches the way nvstreammux does: at most one frame per stream."""
+    batch = []
+    streams = set()
+    for frame in frames:
+        if frame.stream in streams:
+            yield batch
+            batch = []
+            streams = set()
+        batch.append(frame)
+        streams.add(frame.stream)
+    if batch:
+        yield batch
+
+
+def paced(batches: Iterable[Sequence[ReplayFrame]], rate: float = 0.0) -> Iterator[Sequence[ReplayFrame]]:
+    """Yield batches at `rate` batches per second, or as fast as possible when 0."""
+    if rate <= 0:
+        yield from batches
+        return
+    interval = 1.0 / rate
+    next_time = time.monotonic()
+    for batch in batches:
+        delay = next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        next_time += interval
+        yield batch
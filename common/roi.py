@@ -0,0 +1,416 @@
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from common.log import get_logger
+
+log = get_logger('roi')
+
+# object_id of objects the tracker has not (yet) given an id, pyds.UNTRACKED_OBJECT_ID.
+# Object ids are unsigned 64-bit; with useUniqueID they go past 2^63.
+UNTRACKED_OBJECT_ID = 2 ** 64 - 1
+
+
+class BBox:
+    # Slots keep single boxes small and free of a per-instance __dict__;
+    # frames of detections go through DetectionBatch instead
+    __slots__ = ('left', 'top', 'width', 'height')
+
+    def __init__(self, left: float, top: float, width: float, height: float):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+
+    def __repr__(self) -> str:
+        return f"BBox({self.left}, {self.top}, {self.width}, {self.height})"
+
+    def get_area(self) -> float:
+        return self.width * self.height
+
+    def get_intersection(self, other: 'BBox') -> float:
+        x1 = max(self.left, other.left)
+        y1 = max(self.top, other.top)
+        x2 = min(self.left + self.width, other.left + other.width)
+        y2 = min(self.top + self.height, other.top + other.height)
+
+        if x1 >= x2 or y1 >= y2:
+            return 0.0
+
+        intersection_area = (x2 - x1) * (y2 - y1)
+        return intersection_area
+
+
+class ROIInspector:
+    def __init__(self, roi_coords: List[float], timeout: float):
+        self.roi = BBox(roi_coords[0], roi_coords[1], roi_coords[2], roi_coords[3])
+        # The ROI does not move, so its far edges are added up once
+        self._roi_edges = (self.roi.left, self.roi.top, self.roi.left + self.roi.width, self.roi.top + self.roi.height)
+        self.roi_array = np.asarray(roi_coords[:4], dtype=np.float64)
+        self.timeout = timeout
+        self.track_timestamps: Dict[int, float] = {}  # track_id -> first_detection_time
+        self.alerted_tracks: set = set()
+        self.active_alerts: set = set()  # Currently active alerts (still in ROI)
+
+    def check_intersection(self, bbox: BBox) -> float:
+        # Same as bbox.get_intersection(self.roi) / bbox.get_area()
+        left, top, right, bottom = self._roi_edges
+        x1 = max(bbox.left, left)
+        y1 = max(bbox.top, top)
+        x2 = min(bbox.left + bbox.width, right)
+        y2 = min(bbox.top + bbox.height, bottom)
+        if x1 >= x2 or y1 >= y2:
+            return 0.0
+        return (x2 - x1) * (y2 - y1) / (bbox.width * bbox.height)
+
+    def update(self, track_id: int, bbox: BBox, current_time: Optional[float] = None) -> bool:
+        intersection_ratio = self.check_intersection(bbox)
+        return self._update(track_id, intersection_ratio, current_time)
+
+    def update_batch(self, detections: 'DetectionBatch', current_time: Optional[float] = None) -> List[bool]:
+        """update() for every detection of a frame, without a BBox per object."""
+        if current_time is None:
+            current_time = time.time()
+        ratios = detections.intersection_ratios(self.roi_array).tolist()
+        return [self._update(track_id, ratio, current_time)
+                for track_id, ratio in zip(detections.track_ids.tolist(), ratios)]
+
+    def _update(self, track_id: int, intersection_ratio: float, current_time: Optional[float]) -> bool:
+        if current_time is None:
+            current_time = time.time()
+
+        log.debug("Track %s: intersection ratio = %s", track_id, intersection_ratio)
+
+        if intersection_ratio > 0.5:
+            if track_id not in self.track_timestamps:
+                log.debug("Track %s: entered ROI", track_id)
+                self.track_timestamps[track_id] = current_time
+
+            # If already alerted, keep the alert active
+            if track_id in self.alerted_tracks:
+                self.active_alerts.add(track_id)
+                return True
+
+            elif track_id not in self.alerted_tracks:
+                time_in_roi = current_time - self.track_timestamps[track_id]
+                log.debug("Track %s: time in ROI = %.2fs", track_id, time_in_roi)
+                if time_in_roi >= self.timeout:
+                    log.info("Track %s: ALERT!", track_id)
+                    self.alerted_tracks.add(track_id)
+                    self.active_alerts.add(track_id)
+                    return True
+        else:
+            if track_id in self.track_timestamps:
+                log.debug("Track %s: left ROI", track_id)
+                del self.track_timestamps[track_id]
+            self.active_alerts.discard(track_id)  # Remove from active alerts when outside ROI
+
+        return False
+
+    def has_active_alerts(self) -> bool:
+        return len(self.active_alerts) > 0
+
+
+class ROIUpdate(NamedTuple):
+    # All masks are aligned with the track_ids passed to update()
+    alert: np.ndarray      # track is in alert state this frame
+    entered: np.ndarray    # track entered the ROI this frame
+    left: np.ndarray       # track left the ROI this frame
+    alerted: np.ndarray    # track crossed the timeout this frame
+    ratio: np.ndarray      # intersection ratio with the ROI
+    inside: np.ndarray     # track counts as inside, after hysteresis and grace
+
+
+def intersection_ratios(boxes: np.ndarray, roi: np.ndarray) -> np.ndarray:
+    # boxes is an (N, 4) array of left, top, width, height; roi is a 4-vector
+    # in the same layout. Returns intersection area / box area per row.
+    left = boxes[:, 0]
+    top = boxes[:, 1]
+    x1 = np.maximum(left, roi[0])
+    y1 = np.maximum(top, roi[1])
+    x2 = np.minimum(left + boxes[:, 2], roi[0] + roi[2])
+    y2 = np.minimum(top + boxes[:, 3], roi[1] + roi[3])
+    inter = np.clip(x2 - x1, 0.0, None) * np.clip(y2 - y1, 0.0, None)
+    area = boxes[:, 2] * boxes[:, 3]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = inter / area
+    ratio[~np.isfinite(ratio)] = 0.0
+    return ratio
+
+
+class DetectionBatch:
+    """The detections of a frame as parallel arrays instead of BBox objects.
+
+    The probe collects object ids and box values into two flat lists while
+    it walks the metadata, in the layout BatchSnapshot.fill takes, and one
+    conversion per list turns them into arrays. A frame then costs the same
+    few allocations whatever the number of objects, and zone checks,
+    analytics and history all work on the arrays.
+    """
+
+    __slots__ = ('track_ids', 'class_ids', 'boxes', 'confidences')
+
+    def __init__(self, track_ids: np.ndarray, class_ids: np.ndarray, boxes: np.ndarray, confidences: np.ndarray):
+        self.track_ids = track_ids        # uint64
+        self.class_ids = class_ids        # int64
+        self.boxes = boxes                # (N, 4) float64 left, top, width, height
+        self.confidences = confidences    # float32
+
+    @classmethod
+    def from_lists(cls, ids: List[int], values: List[float]) -> 'DetectionBatch':
+        """ids: object id and class id per object; values: left, top, width,
+        height and confidence per object. Class ids are never negative, so
+        both go through one uint64 conversion."""
+        if not ids:
+            return cls.empty()
+        ids = np.array(ids, dtype=np.uint64).reshape(-1, 2)
+        values = np.array(values, dtype=np.float64).reshape(-1, 5)
+        return cls(ids[:, 0], ids[:, 1].astype(np.int64), values[:, :4], values[:, 4].astype(np.float32))
+
+    @classmethod
+    def from_records(cls, rows: np.ndarray) -> 'DetectionBatch':
+        # Rows of BatchSnapshot.objects
+        return cls(rows['object_id'], rows['class_id'].astype(np.int64), rows['bbox'].astype(np.float64),
+                   rows['confidence'])
+
+    @classmethod
+    def empty(cls) -> 'DetectionBatch':
+        return cls(np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64), np.empty((0, 4), dtype=np.float64),
+                   np.empty(0, dtype=np.float32))
+
+    def __len__(self) -> int:
+        return len(self.track_ids)
+
+    def select(self, mask: np.ndarray) -> 'DetectionBatch':
+        return DetectionBatch(self.track_ids[mask], self.class_ids[mask], self.boxes[mask], self.confidences[mask])
+
+    def bbox(self, index: int) -> BBox:
+        return BBox(*self.boxes[index].tolist())
+
+    def intersection_ratios(self, roi: np.ndarray) -> np.ndarray:
+        return intersection_ratios(self.boxes, roi)
+
+
+class DwellState:
+    """Per-track dwell bookkeeping for one zone, with ROIInspector semantics.
+
+    Track state lives in parallel arrays sorted by track id, so a whole frame
+    (or batch) of detections is resolved with a handful of NumPy operations
+    instead of one Python call per object.
+
+    Tracks that are not seen for max_age seconds or max_age_frames updates
+    are forgotten, and max_tracks caps the number of distinct tracks by
+    evicting the least recently seen ones; with (zone, track) keys a track
+    inside several zones counts once. This covers tracks that vanish inside a zone, which
+    ROIInspector would keep forever.
+
+    update() can also debounce the inside test, which ROIInspector does
+    not: with exit_inside a track that is inside stays inside down to a
+    lower exit threshold, and with grace/grace_frames one that drops out
+    still counts as inside for that many seconds or updates.
+    """
+
+    # Parallel per-track arrays and the value new rows start with
+    _COLUMNS = (('_entered', np.float64, np.nan),  # NaN while outside the zone
+                ('_alerted', bool, False),
+                ('_active', bool, False),
+                ('_last_seen', np.float64, np.nan),
+                ('_last_frame', np.int64, 0),
+                # When and for how many updates a track inside was last seen
+                # outside, while its grace period runs
+                ('_outside_since', np.float64, np.nan),
+                ('_outside_frames', np.int64, 0))
+
+    def __init__(self, timeout: float, key_dtype=np.uint64, max_age: Optional[float] = None,
+                 max_age_frames: Optional[int] = None, max_tracks: Optional[int] = None):
+        self.timeout = timeout
+        self.max_age = max_age
+        self.max_age_frames = max_age_frames
+        self.max_tracks = max_tracks
+        self.evicted = 0  # total number of tracks dropped by expiry or the cap
+        self._frame = 0
+        self._ids = np.empty(0, dtype=key_dtype)
+        for name, dtype, _ in self._COLUMNS:
+            setattr(self, name, np.empty(0, dtype=dtype))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _lookup(self, track_ids: np.ndarray) -> np.ndarray:
+        found = self.contains(track_ids)
+        if found.all():
+            return np.searchsorted(self._ids, track_ids)
+
+        new_ids = np.unique(track_ids[~found])
+        ids = np.concatenate((self._ids, new_ids))
+        order = np.argsort(ids, kind='stable')
+        self._ids = ids[order]
+        for name, dtype, initial in self._COLUMNS:
+            column = np.concatenate((getattr(self, name), np.full(len(new_ids), initial, dtype=dtype)))
+            setattr(self, name, column[order])
+        return np.searchsorted(self._ids, track_ids)
+
+    def _compact(self, keep: np.ndarray):
+        self._ids = self._ids[keep]
+        for name, _, _ in self._COLUMNS:
+            setattr(self, name, getattr(self, name)[keep])
+
+    def take_rows(self, other: 'DwellState', keep: np.ndarray, ids: np.ndarray):
+        """Replace the state with the rows of other selected by keep, stored under new ids."""
+        order = np.argsort(ids, kind='stable')
+        self._ids = ids[order]
+        for name, _, _ in self._COLUMNS:
+            setattr(self, name, getattr(other, name)[keep][order])
+        self._frame = other._frame
+        self.evicted = other.evicted
+
+    def relabel(self, rows: np.ndarray, ids: np.ndarray):
+        """Store the rows selected by the mask under new ids, with their
+        state, in place of any rows already stored under those ids."""
+        keep = np.ones(len(self._ids), dtype=bool)
+        keep[np.searchsorted(self._ids, ids)[self.contains(ids)]] = False
+        keep |= rows
+        new_ids = self._ids.copy()
+        new_ids[rows] = ids
+        new_ids = new_ids[keep]
+        order = np.argsort(new_ids, kind='stable')
+        self._ids = new_ids[order]
+        for name, _, _ in self._COLUMNS:
+            setattr(self, name, getattr(self, name)[keep][order])
+
+    def contains(self, track_ids: np.ndarray) -> np.ndarray:
+        idx = np.searchsorted(self._ids, track_ids)
+        found = idx < len(self._ids)
+        found[found] = self._ids[idx[found]] == track_ids[found]
+        return found
+
+    def expire(self, current_time: float) -> int:
+        """Drop tracks that are too old or over the cap, returns how many."""
+        if len(self._ids) == 0:
+            return 0
+        keep = np.ones(len(self._ids), dtype=bool)
+        if self.max_age is not None:
+            keep &= self._last_seen >= current_time - self.max_age
+        if self.max_age_frames is not None:
+            keep &= self._last_frame >= self._frame - self.max_age_frames
+        if self.max_tracks is not None and keep.sum() > self.max_tracks:
+            # Least recently seen tracks go first, with all of their rows
+            tracks = self._ids['track'] if self._ids.dtype.names else self._ids
+            unique, inverse = np.unique(tracks, return_inverse=True)
+            last_frame = np.full(len(unique), -1, dtype=np.int64)
+            np.maximum.at(last_frame, inverse, np.where(keep, self._last_frame, -1))
+            if np.count_nonzero(last_frame >= 0) > self.max_tracks:
+                newest = np.zeros(len(unique), dtype=bool)
+                newest[np.argpartition(last_frame, len(last_frame) - self.max_tracks)[-self.max_tracks:]] = True
+                keep &= newest[inverse]
+        if keep.all():
+            return 0
+        # Tracks, not (zone, track) rows, that lost all or part of their state
+        tracks = self._ids['track'] if self._ids.dtype.names else self._ids
+        dropped = len(np.unique(tracks[~keep]))
+        self._compact(keep)
+        self.evicted += dropped
+        return dropped
+
+    def update(self, track_ids: np.ndarray, inside: np.ndarray, current_time: float,
+               ratio: Optional[np.ndarray] = None, timeout=None, exit_inside: Optional[np.ndarray] = None,
+               grace=None, grace_frames=None) -> 'ROIUpdate':
+        # timeout may be an array aligned with track_ids to give rows their own
+        # timeout, and current_time one to give rows from several frames their
+        # own time. exit_inside is the inside test of tracks already inside;
+        # grace and grace_frames (scalars or arrays, 0 for none) go together.
+        if timeout is None:
+            timeout = self.timeout
+        self._frame += 1
+        idx = self._lookup(track_ids)
+        self._last_seen[idx] = current_time
+        self._last_frame[idx] = self._frame
+
+        entered_at = self._entered[idx]
+        was_inside = ~np.isnan(entered_at)
+        if exit_inside is not None:
+            inside = np.where(was_inside, exit_inside, inside)
+        if grace is not None:
+            inside = self._hold(idx, inside, was_inside, current_time, grace, grace_frames)
+        entered = inside & ~was_inside
+        left = ~inside & was_inside
+        entered_at = np.where(entered, current_time, entered_at)
+        entered_at[~inside] = np.nan
+        self._entered[idx] = entered_at
+
+        prev_alerted = self._alerted[idx]
+        alerted = inside & ~prev_alerted & (current_time - entered_at >= timeout)
+        self._alerted[idx[alerted]] = True
+
+        alert = inside & (prev_alerted | alerted)
+        self._active[idx] = alert
+
+        # Forget tracks that are outside the zone and never alerted, which is
+        # exactly the state ROIInspector keeps no record of.
+        if not inside.all():
+            keep = ~np.isnan(self._entered) | self._alerted
+            if not keep.all():
+                self._compact(keep)
+        if self.max_age is not None or self.max_age_frames is not None or self.max_tracks is not None:
+            self.expire(np.max(current_time))
+
+        if ratio is None:
+            ratio = inside.astype(np.float64)
+        return ROIUpdate(alert, entered, left, alerted, ratio, inside)
+
+    def _hold(self, idx, inside, was_inside, current_time, grace, grace_frames) -> np.ndarray:
+        # A track that drops out of the zone still counts as inside for grace
+        # seconds or grace_frames updates, whichever is longer, so a box that
+        # flickers out for a frame neither leaves nor restarts its dwell time
+        if grace_frames is None:
+            grace_frames = 0
+        outside = was_inside & ~inside
+        since = np.where(outside, np.fmin(self._outside_since[idx], current_time), np.nan)
+        frames = np.where(outside, self._outside_frames[idx] + 1, 0)
+        with np.errstate(invalid='ignore'):
+            held = outside & ((current_time - since < grace) | (frames <= grace_frames))
+        self._outside_since[idx] = np.where(held, since, np.nan)
+        self._outside_frames[idx] = np.where(held, frames, 0)
+        return inside | held
+
+    def has_active_alerts(self) -> bool:
+        return bool(self._active.any())
+
+    @property
+    def track_timestamps(self) -> Dict[int, float]:
+        inside = ~np.isnan(self._entered)
+        return dict(zip(self._ids[inside].tolist(), self._entered[inside].tolist()))
+
+    @property
+    def alerted_tracks(self) -> set:
+        return set(self._ids[self._alerted].tolist())
+
+    @property
+    def active_alerts(self) -> set:
+        return set(self._ids[self._active].tolist())
+
+
+class BatchROIEngine(DwellState):
+    """Vectorized equivalent of ROIInspector for a single rectangular ROI.
+
+    The alert semantics match ROIInspector.update exactly for a given
+    timestamp, except that untracked objects (UNTRACKED_OBJECT_ID) never
+    count as inside: they all share that id, so ROIInspector would run
+    one dwell timer for all of them.
+    """
+
+    def __init__(self, roi_coords: List[float], timeout: float, **limits):
+        super().__init__(timeout, **limits)
+        self.roi = BBox(roi_coords[0], roi_coords[1], roi_coords[2], roi_coords[3])
+        self.roi_array = np.asarray(roi_coords[:4], dtype=np.float64)
+
+    def update(self, track_ids, boxes, current_time: Optional[float] = None) -> ROIUpdate:
+        track_ids = np.asarray(track_ids, dtype=np.uint64)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if current_time is None:
+            current_time = time.time()
+
+        ratio = intersection_ratios(boxes, self.roi_array)
+        inside = (ratio > 0.5) & (track_ids != UNTRACKED_OBJECT_ID)
+        return super().update(track_ids, inside, current_time, ratio)
@@ -0,0 +1,70 @@
+from typing import Dict
+
+from common.log import get_logger
+
+log = get_logger('scheduler')
+
+# interval: set nvinfer's interval property, which applies to all streams,
+#           from the most active stream
+# drop:     drop frames of idle streams before nvstreammux
+SCHEDULE_MODES = ('interval', 'drop')
+
+
+class InferenceScheduler:
+    """Runs inference at full rate only where something is going on.
+
+    A stream is active while people are inside or within margin pixels of
+    one of its zones, and for idle_after seconds (frame time) after that.
+    Idle streams get idle_interval: nvinfer skips that many frames between
+    inferences and the tracker carries known objects over the gaps. A new
+    stream starts active.
+    """
+
+    def __init__(self, idle_interval: int = 4, idle_after: float = 2.0, margin: float = 100.0):
+        self.idle_interval = idle_interval
+        self.idle_after = idle_after
+        self.margin = margin
+        self._last_active: Dict[int, float] = {}
+        self._interval: Dict[int, int] = {}
+        # Frames seen and admitted per stream in drop mode
+        self._frames: Dict[int, int] = {}
+        self.admitted: Dict[int, int] = {}
+        self.dropped: Dict[int, int] = {}
+
+    def add_stream(self, stream: int):
+        self._interval[stream] = 0
+        self._frames[stream] = 0
+        self.admitted[stream] = 0
+        self.dropped[stream] = 0
+
+    def remove_stream(self, stream: int):
+        for table in (self._last_active, self._interval, self._frames, self.admitted, self.dropped):
+            table.pop(stream, None)
+
+    def observe(self, stream: int, frame_time: float, active: bool) -> int:
+        """Record the activity of a processed frame, return the stream's interval."""
+        last = self._last_active.get(stream)
+        if active or last is None:
+            self._last_active[stream] = last = frame_time
+        interval = 0 if frame_time - last < self.idle_after else self.idle_interval
+        if interval != self._interval.get(stream):
+            log.debug("Stream %d %s, inference interval %d", stream, "active" if interval == 0 else "idle", interval)
+            self._interval[stream] = interval
+        return interval
+
+    def interval(self, stream: int) -> int:
+        return self._interval.get(stream, 0)
+
+    def pipeline_interval(self) -> int:
+        # One nvinfer serves all streams, so the most active one decides
+        return min(self._interval.values(), default=0)
+
+    def admit(self, stream: int) -> bool:
+        """Drop mode: whether the next frame of the stream goes to inference."""
+        count = self._frames.get(stream, 0)
+        self._frames[stream] = count + 1
+        if count % (self._interval.get(stream, 0) + 1) == 0:
+            self.admitted[stream] = self.admitted.get(stream, 0) + 1
+            return True
+        self.dropped[stream] = self.dropped.get(stream, 0) + 1
+        return False
@@ -0,0 +1,154 @@
+"""Decoupled metadata processing.
+
+In decoupled mode the buffer probe copies the few fields the analysis needs
+(stream, frame, object id, class, bbox, confidence) into a BatchSnapshot of
+preallocated structured arrays and hands it to a SnapshotWorker thread,
+which runs zone state, events, analytics and recording on it. The probe
+then draws boxes and alerts, and captures alert evidence, from the results
+of the previous batch, so both lag the metadata by at most one frame per
+stream.
+
+Two snapshots take turns: the probe fills one while the worker processes
+the other, and the probe waits for the previous batch before handing over
+the next, so the worker never falls more than one batch behind.
+"""
+import queue
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from common.log import get_logger
+
+log = get_logger('snapshot')
+
+FRAME_DTYPE = np.dtype([
+    ('stream', np.int32),
+    ('frame_num', np.int64),
+    ('pts', np.uint64),
+    ('ntp', np.uint64),
+    ('num_obj_meta', np.int32),
+    # Rows of the frame's objects in BatchSnapshot.objects
+    ('start', np.int64),
+    ('end', np.int64),
+])
+
+OBJECT_DTYPE = np.dtype([
+    ('object_id', np.uint64),     # unsigned, past 2^63 with unique tracker ids
+    ('class_id', np.int32),
+    # left, top, width, height; float64 as in inline mode, so zone checks
+    # give the same results for boxes on a zone's edge
+    ('bbox', np.float64, (4,)),
+    ('confidence', np.float32),
+])
+
+
+class FrameResult(NamedTuple):
+    # What the probe needs from the worker for a stream's next frame
+    frame_num: int
+    time: float
+    alerts: list                # (track id, zone id, bbox) of alerts that fired, for evidence capture
+    overlay: object             # StreamOverlay of the zones the result was computed with
+    alert_ids: np.ndarray       # tracks in alert
+    alert: bool                 # any zone in alert
+    active_zones: np.ndarray    # per zone, whether it is in alert
+
+
+class BatchSnapshot:
+    """The fields of one batch's metadata, in arrays that are reused.
+
+    The probe collects a batch into flat lists and fill() converts them in
+    a few NumPy calls; the arrays only grow, so a steady stream of batches
+    allocates nothing beyond those lists.
+    """
+
+    def __init__(self, max_frames: int = 16, max_objects: int = 1024):
+        self.frames = np.zeros(max_frames, dtype=FRAME_DTYPE)
+        self.objects = np.zeros(max_objects, dtype=OBJECT_DTYPE)
+        self.num_frames = 0
+        self.num_objects = 0
+        # Object labels in row order, only collected while recording
+        self.labels: Optional[List[str]] = None
+        # Shadow-tracked frames per stream, see FrameProcessor.collect_past_frame_meta
+        self.past: Dict = {}
+        # Filled in by the worker, per stream
+        self.results: Dict[int, FrameResult] = {}
+
+    def clear(self):
+        self.num_frames = 0
+        self.num_objects = 0
+        self.labels = None
+        self.past = {}
+        self.results = {}
+
+    def fill(self, frames: List, ids: List[int], values: List[float]):
+        """frames: FRAME_DTYPE tuples; ids: object id and class id per
+        object; values: left, top, width, height and confidence per object.
+        Class ids are never negative, so both go through one uint64 conversion."""
+        num_frames = len(frames)
+        num_objects = len(ids) // 2
+        if num_frames > len(self.frames):
+            self.frames = np.zeros(max(num_frames, 2 * len(self.frames)), dtype=FRAME_DTYPE)
+        if num_objects > len(self.objects):
+            self.objects = np.zeros(max(num_objects, 2 * len(self.objects)), dtype=OBJECT_DTYPE)
+        self.frames[:num_frames] = frames
+        if num_objects:
+            ids = np.array(ids, dtype=np.uint64).reshape(-1, 2)
+            values = np.array(values, dtype=np.float64).reshape(-1, 5)
+            objects = self.objects[:num_objects]
+            objects['object_id'] = ids[:, 0]
+            objects['class_id'] = ids[:, 1]
+            objects['bbox'] = values[:, :4]
+            objects['confidence'] = values[:, 4]
+        self.num_frames = num_frames
+        self.num_objects = num_objects
+
+
+class SnapshotWorker:
+    """Runs process(snapshot) on a background thread, one batch at a time.
+
+    submit() hands a snapshot over and collect() waits for the one before
+    it, which keeps exactly one batch in flight. Errors in process() are
+    logged and counted; the snapshot is still returned so the probe never
+    waits for a batch that will not come.
+    """
+
+    def __init__(self, process: Callable[[BatchSnapshot], None], name: str = 'snapshot-worker'):
+        self.process = process
+        self.errors = 0
+        self._todo = queue.Queue(maxsize=1)
+        self._done = queue.Queue(maxsize=1)
+        self._in_flight = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, snapshot: BatchSnapshot):
+        self._todo.put(snapshot)
+        self._in_flight = True
+
+    def collect(self) -> Optional[BatchSnapshot]:
+        """The processed snapshot of the last submit(), None if nothing is in flight."""
+        if not self._in_flight:
+            return None
+        self._in_flight = False
+        return self._done.get()
+
+    def _run(self):
+        while True:
+            snapshot = self._todo.get()
+            if snapshot is None:
+                return
+            try:
+                self.process(snapshot)
+            except Exception:
+                self.errors += 1
+                log.exception("Processing a metadata snapshot failed")
+            self._done.put(snapshot)
+
+    def stop(self) -> Optional[BatchSnapshot]:
+        """Finish the batch in flight, if any, and return it; then end the thread."""
+        last = self.collect()
+        if self._thread.is_alive():
+            self._todo.put(None)
+            self._thread.join()
+        return last
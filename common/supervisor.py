@@ -0,0 +1,441 @@
+"""Running a large camera list as several worker processes.
+
+A pipeline process runs all of its probe work under one GIL, and an error
+outside a source bin stops every stream it has. The supervisor splits the
+sources into contiguous shards and runs one worker process per shard, each a
+multi-stream pipeline on its GPU. Workers that fail are restarted with a
+growing delay. Their events and metrics come back over a Unix socket, one
+JSON object per line:
+
+    {"type": "hello", "worker": 1, "pid": 4242}
+    {"type": "event", "event": {"type": "alert", "stream": 0, ...}}
+    {"type": "metrics", "snapshot": {"streams": {"0": ...}, ...}}
+
+Workers number their streams from 0; the supervisor maps them back to
+indexes into the full source list, so events and metrics read as if one
+pipeline ran every camera.
+
+Nothing here touches GStreamer; benchmarks/bench_supervisor.py runs it with
+fake workers.
+"""
+import json
+import os
+import selectors
+import signal
+import socket
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, TypeVar
+
+from common.events import EventSink
+from common.health import Backoff
+from common.log import get_logger
+from common.metrics import format_prometheus
+
+log = get_logger('supervisor')
+
+WORKER_STARTING = 'starting'
+WORKER_RUNNING = 'running'
+# Exited with an error, restarted once its backoff delay has passed
+WORKER_BACKOFF = 'backoff'
+# Exited cleanly, e.g. all of its files ended
+WORKER_FINISHED = 'finished'
+WORKER_STOPPED = 'stopped'
+
+T = TypeVar('T')
+
+
+class Shard(NamedTuple):
+    index: int
+    gpu_id: Optional[int]    # None: the gpu-id of the nvinfer config
+    streams: List[int]       # indexes into the full source list
+    sources: List[str]
+
+
+def plan_shards(sources: List[str], workers: int, gpu_ids: List[int] = None) -> List[Shard]:
+    """Contiguous, evenly sized shards, at most one per source, with GPUs
+    assigned round robin. Workers compute their own shard the same way."""
+    workers = max(1, min(workers, len(sources)))
+    size, extra = divmod(len(sources), workers)
+    shards = []
+    start = 0
+    for index in range(workers):
+        end = start + size + (1 if index < extra else 0)
+        gpu_id = gpu_ids[index % len(gpu_ids)] if gpu_ids else None
+        shards.append(Shard(index, gpu_id, list(range(start, end)), sources[start:end]))
+        start = end
+    return shards
+
+
+def localize(per_stream: Dict[int, T], shard: Shard) -> Dict[int, T]:
+    # Per-stream settings (zones, lines) keyed by the worker's stream indexes
+    return {local: per_stream[stream] for local, stream in enumerate(shard.streams) if stream in per_stream}
+
+
+class SupervisorLink(EventSink):
+    """Worker end of the socket: an event sink for the EventDispatcher, and
+    publish() for MetricsExporter's snapshots.
+
+    Like SocketSink it connects on first use and again after an error; a
+    batch that fails while the supervisor is unreachable is counted as a
+    sink error and not resent.
+    """
+
+    def __init__(self, path: str, worker: int):
+        super().__init__()
+        self.path = path
+        self.worker = worker
+        self._sock = None
+        # Events come from the dispatcher thread, metrics from the exporter's
+        self._lock = threading.Lock()
+
+    def _send(self, messages: List[Dict]):
+        with self._lock:
+            if self._sock is None:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(5.0)
+                try:
+                    sock.connect(self.path)
+                except OSError:
+                    sock.close()
+                    raise
+                self._sock = sock
+                messages = [{'type': 'hello', 'worker': self.worker, 'pid': os.getpid()}] + messages
+            try:
+                self._sock.sendall(''.join(json.dumps(m) + '\n' for m in messages).encode())
+            except OSError:
+                self._close()
+                raise
+
+    def write_batch(self, events: List[Dict]):
+        self._send([{'type': 'event', 'event': e} for e in events])
+
+    def publish(self, snapshot: Dict):
+        self._send([{'type': 'metrics', 'snapshot': snapshot}])
+
+    def _close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def __repr__(self):
+        return f"SupervisorLink(unix:{self.path})"
+
+
+class Worker:
+    def __init__(self, shard: Shard):
+        self.shard = shard
+        self.process: Optional[subprocess.Popen] = None
+        self.status = WORKER_STARTING
+        self.started = 0.0
+        # Failures in a row, reset once the worker stays up for stable_after
+        self.attempts = 0
+        self.restarts = 0
+        self.next_start = 0.0
+        self.exit_code: Optional[int] = None
+        # Latest metrics snapshot and when it arrived
+        self.metrics: Dict = {}
+        self.metrics_time: Optional[float] = None
+
+
+class Supervisor:
+    """Starts a worker process per shard, restarts those that fail and
+    collects what they send.
+
+    command(shard, socket_path) returns the worker's argv. The main loop
+    calls poll() about once a second; a reader thread takes the workers'
+    messages, forwards their events to events (e.g. an EventDispatcher) and
+    keeps their latest metrics. aggregate(), snapshot() and
+    prometheus_text() merge those, so a MetricsExporter can serve them.
+    """
+
+    def __init__(self, shards: List[Shard], command: Callable[[Shard, str], List[str]], socket_path: str,
+                 events=None, backoff: Backoff = None, stable_after: float = 60.0, stop_timeout: float = 15.0,
+                 env: Dict[str, str] = None):
+        self.workers = [Worker(shard) for shard in shards]
+        self.command = command
+        self.socket_path = socket_path
+        self.events = events
+        self.backoff = backoff or Backoff()
+        self.stable_after = stable_after
+        self.stop_timeout = stop_timeout
+        self.env = env
+        self.started = time.time()
+        self.messages = 0
+        self.bad_messages = 0
+        self._listener = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._read, name="supervisor-ipc", daemon=True)
+        self._snapshot = {}
+
+    @property
+    def finished(self) -> bool:
+        return all(worker.status == WORKER_FINISHED for worker in self.workers)
+
+    def start(self, now: float):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.socket_path)
+        self._listener.listen(len(self.workers) * 2)
+        self._thread.start()
+        for worker in self.workers:
+            self._spawn(worker, now)
+
+    def _spawn(self, worker: Worker, now: float):
+        argv = self.command(worker.shard, self.socket_path)
+        try:
+            worker.process = subprocess.Popen(argv, env=self.env)
+        except OSError as e:
+            log.error("Unable to start worker %d: %s", worker.shard.index, e)
+            self._failed(worker, now)
+            return
+        worker.status = WORKER_STARTING
+        worker.started = now
+        worker.exit_code = None
+        log.info("Worker %d (pid %d, gpu %s): streams %d-%d", worker.shard.index, worker.process.pid,
+                 worker.shard.gpu_id if worker.shard.gpu_id is not None else "default",
+                 worker.shard.streams[0], worker.shard.streams[-1])
+
+    def _failed(self, worker: Worker, now: float):
+        if worker.started and now - worker.started >= self.stable_after:
+            worker.attempts = 0
+        worker.status = WORKER_BACKOFF
+        worker.next_start = now + self.backoff.delay(worker.attempts)
+        worker.attempts += 1
+        log.warning("Worker %d restarting in %.1fs (attempt %d)", worker.shard.index, worker.next_start - now,
+                    worker.attempts)
+
+    def poll(self, now: float):
+        """Notice workers that exited and restart those whose delay passed."""
+        for worker in self.workers:
+            if worker.process is not None and worker.status in (WORKER_STARTING, WORKER_RUNNING):
+                code = worker.process.poll()
+                if code is None:
+                    continue
+                worker.exit_code = code
+                worker.process = None
+                if code == 0:
+                    log.info("Worker %d finished", worker.shard.index)
+                    worker.status = WORKER_FINISHED
+                else:
+                    log.error("Worker %d exited with %s after %.1fs", worker.shard.index,
+                              f"signal {-code}" if code < 0 else f"code {code}", now - worker.started)
+                    self._failed(worker, now)
+            if worker.status == WORKER_BACKOFF and now >= worker.next_start:
+                worker.restarts += 1
+                self._spawn(worker, now)
+
+    def signal(self, signum: int):
+        # e.g. SIGHUP, so every worker reloads its zones
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.send_signal(signum)
+
+    def stop(self):
+        # SIGINT is the pipeline's Ctrl-C: outputs are finalized and the
+        # queues drained before it exits
+        self.signal(signal.SIGINT)
+        deadline = time.monotonic() + self.stop_timeout
+        for worker in self.workers:
+            if worker.process is not None:
+                try:
+                    worker.process.wait(max(0.0, deadline - time.monotonic()))
+                except subprocess.TimeoutExpired:
+                    log.warning("Worker %d did not stop, killing it", worker.shard.index)
+                    worker.process.kill()
+                    worker.process.wait()
+                worker.exit_code = worker.process.returncode
+                worker.process = None
+            if worker.status != WORKER_FINISHED:
+                worker.status = WORKER_STOPPED
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    # IPC
+
+    def _read(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._listener, selectors.EVENT_READ)
+        # Unparsed bytes and worker index per connection
+        pending: Dict[socket.socket, bytes] = {}
+        senders: Dict[socket.socket, Worker] = {}
+        while True:
+            ready = selector.select(timeout=0.2)
+            # Once stopping, whatever the workers sent before they exited is
+            # read to the end
+            if not ready and self._stop.is_set():
+                break
+            for key, _ in ready:
+                sock = key.fileobj
+                if sock is self._listener:
+                    conn, _ = sock.accept()
+                    conn.setblocking(False)
+                    selector.register(conn, selectors.EVENT_READ)
+                    pending[conn] = b''
+                    continue
+                try:
+                    data = sock.recv(65536)
+                except OSError:
+                    data = b''
+                if not data:
+                    selector.unregister(sock)
+                    sock.close()
+                    pending.pop(sock, None)
+                    senders.pop(sock, None)
+                    continue
+                *lines, pending[sock] = (pending[sock] + data).split(b'\n')
+                for line in lines:
+                    self._message(sock, line, senders)
+        for sock in list(pending):
+            sock.close()
+        selector.close()
+
+    def _message(self, sock, line: bytes, senders: Dict):
+        try:
+            message = json.loads(line)
+            kind = message['type']
+        except (ValueError, KeyError, TypeError):
+            self.bad_messages += 1
+            return
+        self.messages += 1
+        if kind == 'hello':
+            index = message.get('worker')
+            if isinstance(index, int) and 0 <= index < len(self.workers):
+                worker = self.workers[index]
+                senders[sock] = worker
+                if worker.status == WORKER_STARTING:
+                    worker.status = WORKER_RUNNING
+            else:
+                self.bad_messages += 1
+            return
+        worker = senders.get(sock)
+        if worker is None:
+            # Nothing is accepted before the hello
+            self.bad_messages += 1
+        elif kind == 'event':
+            if self.events is not None:
+                self.events.push(self._global_event(worker.shard, message['event']))
+        elif kind == 'metrics':
+            worker.metrics = message['snapshot']
+            worker.metrics_time = time.time()
+            if worker.status == WORKER_STARTING:
+                worker.status = WORKER_RUNNING
+
+    @staticmethod
+    def _global_event(shard: Shard, event: Dict) -> Dict:
+        event = dict(event)
+        local = event.get('stream')
+        if isinstance(local, int) and 0 <= local < len(shard.streams):
+            event['stream'] = shard.streams[local]
+        event['worker'] = shard.index
+        return event
+
+    # Merged metrics, in the layout of common.metrics.Metrics
+
+    def aggregate(self) -> Dict:
+        now = time.time()
+        workers = [(worker, worker.metrics) for worker in self.workers]
+        snaps = [snap for _, snap in workers if snap]
+        snapshot = {
+            'time': now,
+            'uptime': now - self.started,
+            'streams': {},
+            'probe_seconds': _merge_histograms(snap.get('probe_seconds') for snap in snaps),
+            'element_latency_seconds': {},
+            'workers': {},
+        }
+        for worker, snap in workers:
+            shard = worker.shard
+            snapshot['streams'].update(_global_streams(snap.get('streams', {}), shard))
+            for name, hist in snap.get('element_latency_seconds', {}).items():
+                snapshot['element_latency_seconds'].setdefault(name, []).append(hist)
+            if 'source_health' in snap:
+                health = snapshot.setdefault('source_health', {'sources': {}, 'recovery_seconds': []})
+                health['sources'].update(_global_streams(snap['source_health']['sources'], shard))
+                health['recovery_seconds'].append(snap['source_health']['recovery_seconds'])
+            for kind, per_stream in snap.get('analytics', {}).items():
+                snapshot.setdefault('analytics', {}).setdefault(kind, {}).update(_global_streams(per_stream, shard))
+            if 'latency_budget' in snap:
+                budget = snapshot.setdefault('latency_budget', {'budget': snap['latency_budget']['budget'],
+                                                                'queue_drops': 0})
+                budget['queue_drops'] += snap['latency_budget']['queue_drops']
+            if 'evidence' in snap:
+                evidence = snapshot.setdefault('evidence', {})
+                for key, value in snap['evidence'].items():
+                    if isinstance(value, (int, float)):
+                        evidence[key] = evidence.get(key, 0) + value
+            snapshot['workers'][str(shard.index)] = {
+                'status': worker.status,
+                'pid': worker.process.pid if worker.process is not None else None,
+                'gpu_id': shard.gpu_id,
+                'streams': shard.streams,
+                'restarts': worker.restarts,
+                'exit_code': worker.exit_code,
+                'metrics_age': now - worker.metrics_time if worker.metrics_time is not None else None,
+            }
+        snapshot['element_latency_seconds'] = {name: _merge_histograms(hists) for name, hists in
+                                               snapshot['element_latency_seconds'].items()}
+        if 'source_health' in snapshot:
+            health = snapshot['source_health']
+            health['recovery_seconds'] = _merge_histograms(health['recovery_seconds'])
+        worker_seconds = [snap['worker_seconds'] for snap in snaps if 'worker_seconds' in snap]
+        if worker_seconds:
+            snapshot['worker_seconds'] = _merge_histograms(worker_seconds)
+        self._snapshot = snapshot
+        return snapshot
+
+    def snapshot(self) -> Dict:
+        return self._snapshot or self.aggregate()
+
+    def prometheus_text(self) -> str:
+        snap = self.snapshot()
+        workers = snap['workers']
+        lines = [
+            "# HELP ds_worker_up 1 while a worker process runs",
+            "# TYPE ds_worker_up gauge",
+            *(f'ds_worker_up{{worker="{i}"}} {int(w["status"] == WORKER_RUNNING)}' for i, w in workers.items()),
+            "# HELP ds_worker_restarts_total Restarts of a worker process after it failed",
+            "# TYPE ds_worker_restarts_total counter",
+            *(f'ds_worker_restarts_total{{worker="{i}"}} {w["restarts"]}' for i, w in workers.items()),
+        ]
+        return format_prometheus(snap) + "\n".join(lines) + "\n"
+
+    def stats(self) -> Dict:
+        return {'workers': {worker.shard.index: {'status': worker.status, 'restarts': worker.restarts,
+                                                 'exit_code': worker.exit_code} for worker in self.workers},
+                'messages': self.messages, 'bad_messages': self.bad_messages}
+
+
+def _global_streams(per_stream: Dict[str, T], shard: Shard) -> Dict[str, T]:
+    # Snapshot keys are stream indexes as strings
+    result = {}
+    for key, value in per_stream.items():
+        local = int(key)
+        if 0 <= local < len(shard.streams):
+            result[str(shard.streams[local])] = value
+    return result
+
+
+def _merge_histograms(hists) -> Dict:
+    # Histogram snapshots with the same bounds: cumulative counts add up
+    merged = {'buckets': {}, 'sum': 0.0, 'count': 0}
+    for hist in hists:
+        if not hist:
+            continue
+        for le, count in hist['buckets'].items():
+            merged['buckets'][le] = merged['buckets'].get(le, 0) + count
+        merged['sum'] += hist['sum']
+        merged['count'] += hist['count']
+    return merged
@@ -0,0 +1,55 @@
+import configparser
+import os
+from typing import Dict, Mapping, Optional, Union
+
+# Key in the [tracker] section -> nvtracker property
+TRACKER_PROPERTIES = {
+    'tracker-width': 'tracker-width',
+    'tracker-height': 'tracker-height',
+    'gpu-id': 'gpu_id',
+    'll-lib-file': 'll-lib-file',
+    'll-config-file': 'll-config-file',
+    'enable-batch-process': 'enable_batch_process',
+    'enable-past-frame': 'enable_past_frame',
+}
+
+STRING_PROPERTIES = ('ll-lib-file', 'll-config-file')
+
+
+def tracker_properties(values: Mapping[str, Union[int, str]], base_dir: str) -> Dict[str, Union[int, str]]:
+    """nvtracker properties from config keys, with paths made absolute against base_dir."""
+    properties = {}
+    for key, value in values.items():
+        if key not in TRACKER_PROPERTIES:
+            raise ValueError(f"Unknown tracker key {key!r}, expected one of {', '.join(TRACKER_PROPERTIES)}")
+        if key in STRING_PROPERTIES:
+            value = str(value)
+            if not os.path.isabs(value):
+                value = os.path.normpath(os.path.join(base_dir, value))
+        elif isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError(f"Tracker key {key!r}: expected an integer, got {value!r}")
+        properties[TRACKER_PROPERTIES[key]] = value
+    return properties
+
+
+def read_tracker_config(path: str, overrides: Optional[Mapping[str, Union[int, str]]] = None,
+                        base_dir: Optional[str] = None) -> Dict[str, Union[int, str]]:
+    """nvtracker properties from the [tracker] section of a DeepStream config file.
+
+    Relative library and config paths are resolved against the file, not the
+    working directory. overrides use the same keys and are resolved against
+    base_dir.
+    """
+    config = configparser.ConfigParser()
+    if not config.read(path):
+        raise OSError(f"Unable to read tracker config {path}")
+    if 'tracker' not in config:
+        raise ValueError(f"{path}: missing [tracker] section")
+
+    section = config['tracker']
+    values = {key: section.get(key) if key in STRING_PROPERTIES else section.getint(key)
+              for key in TRACKER_PROPERTIES if key in section}
+    properties = tracker_properties(values, os.path.dirname(os.path.abspath(path)))
+    if overrides:
+        properties.update(tracker_properties(overrides, base_dir or os.getcwd()))
+    return properties
@@ -0,0 +1,168 @@
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from common.roi import UNTRACKED_OBJECT_ID
+
+
+class Trajectory(NamedTuple):
+    frame: np.ndarray       # frame numbers, oldest first
+    bbox: np.ndarray        # (n, 4) left, top, width, height
+    confidence: np.ndarray
+
+
+class FrameTimes:
+    """Frame time of the last `window` frames of one stream by frame number,
+    to put the tracker's past-frame metadata on the stream's clock."""
+
+    def __init__(self, window: int = 128):
+        self.window = window
+        self._frame = np.full(window, -1, dtype=np.int64)
+        self._time = np.zeros(window, dtype=np.float64)
+
+    def record(self, frame_num: int, frame_time: float):
+        i = frame_num % self.window
+        self._frame[i] = frame_num
+        self._time[i] = frame_time
+
+    def lookup(self, frame_nums: np.ndarray) -> np.ndarray:
+        """Frame times, NaN for frames that are no longer (or never were) known."""
+        i = frame_nums % self.window
+        return np.where(self._frame[i] == frame_nums, self._time[i], np.nan)
+
+
+class TrackHistory:
+    """Recent trajectory of every track of one stream in fixed-size rings.
+
+    All tracks share preallocated (slots, length) arrays of frame number,
+    bbox and confidence, so appending a frame of detections is a few NumPy
+    operations and no per-track allocation. A track takes a slot when first
+    seen and gives it back after max_idle appends without an entry for it;
+    beyond max_tracks the least recently updated tracks are dropped, which
+    bounds memory to about max_tracks * length entries. Track ids are
+    DeepStream's unsigned 64-bit object ids; untracked objects all share
+    one id and are not recorded.
+    """
+
+    def __init__(self, length: int = 30, max_idle: int = 300, max_tracks: int = 1024, capacity: int = 64):
+        self.length = length
+        self.max_idle = max_idle
+        self.max_tracks = max_tracks
+        self.evicted = 0  # total number of tracks dropped by idleness or the cap
+        self._tick = 0
+        # Sorted track ids and the slot each of them holds
+        self._ids = np.empty(0, dtype=np.uint64)
+        self._id_slots = np.empty(0, dtype=np.int64)
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        self.frame = np.full((capacity, self.length), -1, dtype=np.int64)
+        self.bbox = np.zeros((capacity, self.length, 4), dtype=np.float32)
+        self.confidence = np.zeros((capacity, self.length), dtype=np.float32)
+        # Entries written per slot; the ring position is head % length
+        self.head = np.zeros(capacity, dtype=np.int64)
+        self.last_tick = np.zeros(capacity, dtype=np.int64)
+        self.used = np.zeros(capacity, dtype=bool)
+
+    def _grow(self, needed: int):
+        old = (self.frame, self.bbox, self.confidence, self.head, self.last_tick, self.used)
+        capacity = len(self.used)
+        self._allocate(max(2 * capacity, capacity + needed))
+        for new, values in zip((self.frame, self.bbox, self.confidence, self.head, self.last_tick, self.used), old):
+            new[:capacity] = values
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.frame.nbytes + self.bbox.nbytes + self.confidence.nbytes
+
+    def _find(self, track_ids: np.ndarray):
+        idx = np.searchsorted(self._ids, track_ids)
+        found = idx < len(self._ids)
+        found[found] = self._ids[idx[found]] == track_ids[found]
+        return idx, found
+
+    def _slots(self, track_ids: np.ndarray) -> np.ndarray:
+        # Slot per (unique) track id, taking free slots for new tracks
+        idx, found = self._find(track_ids)
+        slots = np.empty(len(track_ids), dtype=np.int64)
+        slots[found] = self._id_slots[idx[found]]
+        new = ~found
+        if new.any():
+            free = np.flatnonzero(~self.used)
+            num_new = int(new.sum())
+            if len(free) < num_new:
+                self._grow(num_new - len(free))
+                free = np.flatnonzero(~self.used)
+            new_slots = free[:num_new]
+            self.used[new_slots] = True
+            self.head[new_slots] = 0
+            self.frame[new_slots] = -1
+            slots[new] = new_slots
+            ids = np.concatenate((self._ids, track_ids[new]))
+            id_slots = np.concatenate((self._id_slots, new_slots))
+            order = np.argsort(ids, kind='stable')
+            self._ids, self._id_slots = ids[order], id_slots[order]
+        return slots
+
+    def append(self, track_ids, frames, boxes, confidences):
+        """Add one entry per row. A track may have several rows, e.g. its
+        past frames; they are stored in the given order, oldest first."""
+        track_ids = np.asarray(track_ids, dtype=np.uint64)
+        tracked = track_ids != UNTRACKED_OBJECT_ID
+        if not tracked.all():
+            # frames is one frame number for all rows or one per row
+            track_ids, boxes, confidences = track_ids[tracked], boxes[tracked], confidences[tracked]
+            if np.ndim(frames):
+                frames = frames[tracked]
+        if len(track_ids) == 0:
+            return
+        self._tick += 1
+        unique, inverse, counts = np.unique(track_ids, return_inverse=True, return_counts=True)
+        unique_slots = self._slots(unique)
+        slots = unique_slots[inverse]
+        if len(unique) == len(track_ids):
+            rank = 0
+        else:
+            # Position of each row among the rows of its track
+            order = np.argsort(inverse, kind='stable')
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order)) - np.repeat(np.cumsum(counts) - counts, counts)
+        pos = (self.head[slots] + rank) % self.length
+        self.frame[slots, pos] = frames
+        self.bbox[slots, pos] = boxes
+        self.confidence[slots, pos] = confidences
+        self.head[unique_slots] += counts
+        self.last_tick[unique_slots] = self._tick
+        self.expire()
+
+    def expire(self) -> int:
+        """Free the slots of idle tracks and of the tracks over the cap, returns how many."""
+        if len(self._ids) == 0:
+            return 0
+        last_tick = self.last_tick[self._id_slots]
+        keep = last_tick >= self._tick - self.max_idle
+        if keep.sum() > self.max_tracks:
+            # Least recently updated tracks go first
+            newest = np.argsort(np.where(keep, last_tick, -1), kind='stable')[-self.max_tracks:]
+            keep[:] = False
+            keep[newest] = True
+        dropped = len(keep) - int(keep.sum())
+        if dropped:
+            self.used[self._id_slots[~keep]] = False
+            self._ids = self._ids[keep]
+            self._id_slots = self._id_slots[keep]
+            self.evicted += dropped
+        return dropped
+
+    def trajectory(self, track_id: int) -> Optional[Trajectory]:
+        idx, found = self._find(np.array([track_id], dtype=np.uint64))
+        if not found[0]:
+            return None
+        slot = self._id_slots[idx[0]]
+        head = int(self.head[slot])
+        positions = np.arange(max(0, head - self.length), head) % self.length
+        return Trajectory(self.frame[slot, positions], self.bbox[slot, positions].astype(np.float64),
+                          self.confidence[slot, positions].astype(np.float64))
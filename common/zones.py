@@ -0,0 +1,586 @@
+import json
+import math
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from common.events import EVENT_ALERT, EVENT_ENTER, EVENT_LEAVE
+from common.log import get_logger
+from common.roi import UNTRACKED_OBJECT_ID, DwellState, ROIUpdate
+
+log = get_logger('zones')
+
+# Id of the ROI given on the command line or in a config, the first zone of every stream
+ROI_ZONE_ID = "ROI"
+
+
+class Zone:
+    """A restricted area, either an axis-aligned rectangle or a polygon.
+
+    Every zone carries its own timeout; its dwell/alert state is kept by the
+    ZoneMonitor the zone is registered with. A box enters the zone above
+    min_overlap and, once inside, leaves below exit_overlap (by default the
+    same) after staying out for more than grace seconds and grace_frames
+    frames.
+    """
+
+    def __init__(self, zone_id: str, points: Sequence[Tuple[float, float]], timeout: float,
+                 is_rect: bool = False, min_overlap: float = 0.5, exit_overlap: Optional[float] = None,
+                 grace: float = 0.0, grace_frames: int = 0):
+        self.zone_id = zone_id
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(self.points) < 3:
+            raise ValueError(f"Zone {zone_id}: a polygon needs at least 3 points")
+        self.is_rect = is_rect
+        if timeout < 0:
+            raise ValueError(f"Zone {zone_id}: timeout must not be negative")
+        self.timeout = timeout
+        self.min_overlap = min_overlap
+        self.exit_overlap = min_overlap if exit_overlap is None else exit_overlap
+        if self.exit_overlap > min_overlap:
+            raise ValueError(f"Zone {zone_id}: exit_overlap must not be above min_overlap")
+        if grace < 0 or grace_frames < 0:
+            raise ValueError(f"Zone {zone_id}: grace must not be negative")
+        self.grace = grace
+        self.grace_frames = grace_frames
+        left, top = self.points.min(axis=0)
+        right, bottom = self.points.max(axis=0)
+        self.bounds = np.array([left, top, right - left, bottom - top], dtype=np.float64)
+
+    @classmethod
+    def from_rect(cls, zone_id: str, rect: Sequence[float], timeout: float, min_overlap: float = 0.5,
+                  **debounce) -> 'Zone':
+        # debounce: exit_overlap, grace, grace_frames
+        left, top, width, height = rect
+        if width <= 0 or height <= 0:
+            raise ValueError(f"Zone {zone_id}: width and height must be positive, got {list(rect)!r}")
+        points = [(left, top), (left + width, top), (left + width, top + height), (left, top + height)]
+        return cls(zone_id, points, timeout, is_rect=True, min_overlap=min_overlap, **debounce)
+
+    @property
+    def debounced(self) -> bool:
+        return self.exit_overlap < self.min_overlap or self.grace > 0 or self.grace_frames > 0
+
+
+def _clip_polygon(points: List[Tuple[float, float]], axis: int, value: float, keep_greater: bool):
+    # One Sutherland-Hodgman pass against an axis-aligned half plane
+    out = []
+    n = len(points)
+    for i in range(n):
+        cur = points[i]
+        prev = points[i - 1]
+        cur_in = cur[axis] >= value if keep_greater else cur[axis] <= value
+        prev_in = prev[axis] >= value if keep_greater else prev[axis] <= value
+        if cur_in != prev_in:
+            t = (value - prev[axis]) / (cur[axis] - prev[axis])
+            if axis == 0:
+                out.append((value, prev[1] + t * (cur[1] - prev[1])))
+            else:
+                out.append((prev[0] + t * (cur[0] - prev[0]), value))
+        if cur_in:
+            out.append(cur)
+    return out
+
+
+def polygon_overlap_ratio(points: np.ndarray, box: Sequence[float]) -> float:
+    # Fraction of the box (left, top, width, height) covered by the polygon
+    left, top, width, height = box
+    area = width * height
+    if area <= 0:
+        return 0.0
+    poly = [tuple(p) for p in points.tolist()]
+    for axis, value, keep_greater in ((0, left, True), (0, left + width, False),
+                                      (1, top, True), (1, top + height, False)):
+        poly = _clip_polygon(poly, axis, value, keep_greater)
+        if not poly:
+            return 0.0
+    xs = np.array([p[0] for p in poly])
+    ys = np.array([p[1] for p in poly])
+    inter = 0.5 * abs(np.dot(xs, np.roll(ys, -1)) - np.dot(ys, np.roll(xs, -1)))
+    return inter / area
+
+
+# Dwell state is keyed by (zone index, track id) pairs; track ids are
+# DeepStream's unsigned 64-bit object ids
+ZONE_TRACK_KEY = np.dtype([('zone', np.int64), ('track', np.uint64)])
+
+
+class ZoneUpdate(NamedTuple):
+    alert: np.ndarray       # per detection, True if it is in alert state in any zone
+    detection: np.ndarray   # per (zone, detection) pair, index of the detection
+    zone: np.ndarray        # per pair, index of the zone in ZoneMonitor.zones
+    inside: np.ndarray      # per pair, True if the detection counts as inside the zone
+    pairs: ROIUpdate        # per pair dwell transitions
+
+
+class LostTracks:
+    """Tracks that vanished from a frame while inside a zone, in a grid of
+    max_distance cells over their last box centers.
+
+    nvtracker gives a person a new id when it loses them for a moment, e.g.
+    behind an occlusion. A new id that shows up within max_distance pixels
+    of such a track and max_gap seconds of losing it can take over its zone
+    state. Only a handful of tracks are lost at a time, so the grid is a
+    dict of cells and a lookup scans the 3x3 cells around a point.
+    """
+
+    def __init__(self, max_gap: float, max_distance: float):
+        self.max_gap = max_gap
+        self.max_distance = max_distance
+        # track id -> (x, y, time lost)
+        self.tracks: Dict[int, Tuple[float, float, float]] = {}
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        self.reassociated = 0
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return int(x // self.max_distance), int(y // self.max_distance)
+
+    def add(self, track_id: int, x: float, y: float, now: float):
+        self.discard(track_id)
+        self.tracks[track_id] = (x, y, now)
+        self._cells.setdefault(self._cell(x, y), []).append(track_id)
+
+    def discard(self, track_id: int):
+        entry = self.tracks.pop(track_id, None)
+        if entry is None:
+            return
+        cell = self._cell(entry[0], entry[1])
+        members = self._cells[cell]
+        members.remove(track_id)
+        if not members:
+            del self._cells[cell]
+
+    def expire(self, now: float):
+        for track_id, (_, _, lost) in list(self.tracks.items()):
+            if now - lost > self.max_gap:
+                self.discard(track_id)
+
+    def near(self, x: float, y: float) -> List[int]:
+        """Lost tracks within max_distance of a point, nearest first."""
+        cx, cy = self._cell(x, y)
+        found = []
+        for gx in (cx - 1, cx, cx + 1):
+            for gy in (cy - 1, cy, cy + 1):
+                for track_id in self._cells.get((gx, gy), ()):
+                    tx, ty, _ = self.tracks[track_id]
+                    distance = math.hypot(tx - x, ty - y)
+                    if distance <= self.max_distance:
+                        found.append((distance, track_id))
+        return [track_id for _, track_id in sorted(found)]
+
+
+class ZoneMonitor:
+    """Dwell monitoring over many zones, accelerated by a uniform grid.
+
+    Each zone is registered in every grid cell its bounding box covers, so a
+    detection is only tested against zones that share a cell with it. Pairs
+    that already hold state for a visible track are updated as well, so
+    tracks that walk away from a zone are seen leaving it. All zones share
+    one DwellState table, so a frame costs a fixed number of NumPy calls no
+    matter how many zones it touches. Objects the tracker has not given an
+    id (UNTRACKED_OBJECT_ID) are left out of the zone state.
+
+    With reassociate_gap and reassociate_distance set, a track id seen for
+    the first time inside a zone takes over the dwell state of a track lost
+    inside the same zone nearby, see LostTracks.
+    """
+
+    def __init__(self, zones: List[Zone], cell_size: float = 128.0, reassociate_gap: float = 0.0,
+                 reassociate_distance: float = 0.0, **limits):
+        # limits (max_age, max_age_frames, max_tracks) bound the dwell state,
+        # see DwellState
+        self.zones = zones
+        self.cell_size = float(cell_size)
+        self.reassociate_gap = reassociate_gap
+        self.reassociate_distance = reassociate_distance
+        self.limits = limits
+        self.state = DwellState(0.0, key_dtype=ZONE_TRACK_KEY, **limits)
+        self.lost = None
+        if reassociate_gap > 0 and reassociate_distance > 0:
+            self.lost = LostTracks(reassociate_gap, reassociate_distance)
+        # Tracks of the last frame that were inside a zone, and their box centers
+        self._inside_ids = np.empty(0, dtype=np.uint64)
+        self._inside_centers = np.empty((0, 2), dtype=np.float64)
+        self._build_index()
+
+    def with_zones(self, zones: List[Zone]) -> 'ZoneMonitor':
+        """A monitor over new zones that keeps the dwell state of every zone
+        whose id is unchanged, so a reload does not reset running timers."""
+        monitor = ZoneMonitor(zones, self.cell_size, self.reassociate_gap, self.reassociate_distance, **self.limits)
+        new_index = {zone.zone_id: index for index, zone in enumerate(zones)}
+        remap = np.array([new_index.get(zone.zone_id, -1) for zone in self.zones], dtype=np.int64)
+        if len(self.state) and len(remap):
+            ids = self.state._ids.copy()
+            ids['zone'] = remap[ids['zone']]
+            keep = ids['zone'] >= 0
+            monitor.state.take_rows(self.state, keep, ids[keep])
+        if self.lost is not None:
+            monitor.lost = self.lost
+            monitor._inside_ids, monitor._inside_centers = self._inside_ids, self._inside_centers
+        return monitor
+
+    def _build_index(self):
+        num_zones = len(self.zones)
+        self._bounds = np.array([z.bounds for z in self.zones], dtype=np.float64).reshape(-1, 4)
+        self._is_rect = np.array([z.is_rect for z in self.zones], dtype=bool)
+        self._min_overlap = np.array([z.min_overlap for z in self.zones], dtype=np.float64)
+        self._timeouts = np.array([z.timeout for z in self.zones], dtype=np.float64)
+        # Hysteresis and grace are only applied if a zone has them
+        self._debounced = any(z.debounced for z in self.zones)
+        self._exit_overlap = np.array([z.exit_overlap for z in self.zones], dtype=np.float64)
+        self._grace = np.array([z.grace for z in self.zones], dtype=np.float64)
+        self._grace_frames = np.array([z.grace_frames for z in self.zones], dtype=np.int64)
+        if num_zones == 0:
+            self._origin = np.zeros(2)
+            self._nx = self._ny = 1
+            self._cell_ptr = np.zeros(2, dtype=np.int64)
+            self._cell_zones = np.empty(0, dtype=np.int64)
+            return
+
+        self._origin = self._bounds[:, :2].min(axis=0)
+        extent = (self._bounds[:, :2] + self._bounds[:, 2:]).max(axis=0) - self._origin
+        self._nx = max(1, int(np.ceil(extent[0] / self.cell_size)))
+        self._ny = max(1, int(np.ceil(extent[1] / self.cell_size)))
+
+        cx0, cy0, cx1, cy1 = self._cell_ranges(self._bounds)
+        cells, owners = self._expand(cx0, cy0, cx1, cy1)
+        order = np.argsort(cells, kind='stable')
+        self._cell_zones = owners[order]
+        counts = np.bincount(cells, minlength=self._nx * self._ny)
+        self._cell_ptr = np.concatenate(([0], np.cumsum(counts)))
+
+    def _cell_ranges(self, boxes: np.ndarray):
+        lo = np.floor((boxes[:, :2] - self._origin) / self.cell_size).astype(np.int64)
+        hi = np.floor((boxes[:, :2] + boxes[:, 2:] - self._origin) / self.cell_size).astype(np.int64)
+        cx0 = np.clip(lo[:, 0], 0, self._nx - 1)
+        cy0 = np.clip(lo[:, 1], 0, self._ny - 1)
+        cx1 = np.clip(hi[:, 0], 0, self._nx - 1)
+        cy1 = np.clip(hi[:, 1], 0, self._ny - 1)
+        return cx0, cy0, cx1, cy1
+
+    def _expand(self, cx0, cy0, cx1, cy1):
+        # Enumerate every (cell, row) pair covered by the given cell ranges
+        span_x = cx1 - cx0 + 1
+        counts = span_x * (cy1 - cy0 + 1)
+        rows = np.repeat(np.arange(len(counts)), counts)
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = cx0[rows] + k % span_x[rows]
+        cy = cy0[rows] + k // span_x[rows]
+        return cy * self._nx + cx, rows
+
+    def candidates(self, boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (detection index, zone index) pairs whose bounding boxes overlap."""
+        if len(boxes) == 0 or len(self.zones) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+        cells, box_idx = self._expand(*self._cell_ranges(boxes))
+        counts = self._cell_ptr[cells + 1] - self._cell_ptr[cells]
+        box_idx = np.repeat(box_idx, counts)
+        starts = np.repeat(self._cell_ptr[cells], counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        zone_idx = self._cell_zones[starts + offsets]
+
+        # A zone spanning several cells shared with a box shows up once per cell
+        keys = np.unique(box_idx * len(self.zones) + zone_idx)
+        box_idx, zone_idx = np.divmod(keys, len(self.zones))
+
+        zb = self._bounds[zone_idx]
+        bb = boxes[box_idx]
+        overlap = ((bb[:, 0] < zb[:, 0] + zb[:, 2]) & (zb[:, 0] < bb[:, 0] + bb[:, 2]) &
+                   (bb[:, 1] < zb[:, 1] + zb[:, 3]) & (zb[:, 1] < bb[:, 1] + bb[:, 3]))
+        return box_idx[overlap], zone_idx[overlap]
+
+    def near(self, boxes: np.ndarray, margin: float = 0.0) -> bool:
+        """True if any box comes within margin pixels of a zone's bounding box."""
+        if len(boxes) == 0 or len(self.zones) == 0:
+            return False
+        grown = boxes + np.array([-margin, -margin, 2 * margin, 2 * margin])
+        return len(self.candidates(grown)[0]) > 0
+
+    def overlap_ratios(self, boxes: np.ndarray, box_idx: np.ndarray, zone_idx: np.ndarray) -> np.ndarray:
+        ratio = np.zeros(len(box_idx), dtype=np.float64)
+        rect = self._is_rect[zone_idx]
+        if rect.any():
+            bb = boxes[box_idx[rect]]
+            zb = self._bounds[zone_idx[rect]]
+            w = np.minimum(bb[:, 0] + bb[:, 2], zb[:, 0] + zb[:, 2]) - np.maximum(bb[:, 0], zb[:, 0])
+            h = np.minimum(bb[:, 1] + bb[:, 3], zb[:, 1] + zb[:, 3]) - np.maximum(bb[:, 1], zb[:, 1])
+            area = bb[:, 2] * bb[:, 3]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                r = np.clip(w, 0.0, None) * np.clip(h, 0.0, None) / area
+            r[~np.isfinite(r)] = 0.0
+            ratio[rect] = r
+        for i in np.flatnonzero(~rect).tolist():
+            ratio[i] = polygon_overlap_ratio(self.zones[zone_idx[i]].points, boxes[box_idx[i]].tolist())
+        return ratio
+
+    def update(self, track_ids, boxes, current_time) -> ZoneUpdate:
+        # current_time is the frame time, or an array of times aligned with
+        # track_ids for detections from several frames
+        track_ids = np.asarray(track_ids, dtype=np.uint64)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+        box_idx, zone_idx = self.candidates(boxes)
+        # Untracked objects all share one id, so they get no zone state
+        untracked = track_ids[box_idx] == UNTRACKED_OBJECT_ID
+        if untracked.any():
+            box_idx, zone_idx = box_idx[~untracked], zone_idx[~untracked]
+        ratio = self.overlap_ratios(boxes, box_idx, zone_idx)
+        # Only for live frames, not past frames applied by replay()
+        reassociate = self.lost is not None and np.ndim(current_time) == 0
+        if reassociate:
+            self._reassociate(track_ids, boxes, box_idx, zone_idx, ratio > self._min_overlap[zone_idx],
+                              current_time)
+
+        # Add pairs the state already knows for tracks visible in this frame
+        if len(self.state):
+            known = self.state._ids[np.isin(self.state._ids['track'], track_ids)]
+            if len(known):
+                order = np.argsort(track_ids, kind='stable')
+                det = order[np.searchsorted(track_ids, known['track'], sorter=order)]
+                box_idx = np.concatenate((box_idx, det))
+                zone_idx = np.concatenate((zone_idx, known['zone']))
+                ratio = np.concatenate((ratio, np.zeros(len(known))))
+                # Keep the candidate entry (listed first) when a pair occurs twice
+                _, first = np.unique(box_idx * max(len(self.zones), 1) + zone_idx, return_index=True)
+                box_idx, zone_idx, ratio = box_idx[first], zone_idx[first], ratio[first]
+
+        keys = np.empty(len(box_idx), dtype=ZONE_TRACK_KEY)
+        keys['zone'] = zone_idx
+        keys['track'] = track_ids[box_idx]
+        inside = ratio > self._min_overlap[zone_idx]
+        if np.ndim(current_time):
+            current_time = np.asarray(current_time, dtype=np.float64)[box_idx]
+        if self._debounced:
+            pairs = self.state.update(keys, inside, current_time, ratio, self._timeouts[zone_idx],
+                                      ratio > self._exit_overlap[zone_idx], self._grace[zone_idx],
+                                      self._grace_frames[zone_idx])
+        else:
+            pairs = self.state.update(keys, inside, current_time, ratio, self._timeouts[zone_idx])
+        if reassociate:
+            held = np.unique(box_idx[pairs.inside])
+            self._inside_ids = track_ids[held]
+            self._inside_centers = boxes[held, :2] + boxes[held, 2:] / 2
+
+        alert = np.zeros(len(track_ids), dtype=bool)
+        alert[box_idx[pairs.alert]] = True
+        return ZoneUpdate(alert, box_idx, zone_idx, pairs.inside, pairs)
+
+    def _reassociate(self, track_ids, boxes, box_idx, zone_idx, inside, now):
+        # Tracks inside a zone last frame and missing from this one are lost
+        lost = self.lost
+        present = set(track_ids.tolist())
+        previous = self._inside_ids.tolist()
+        for track_id, (x, y) in zip(previous, self._inside_centers.tolist()):
+            if track_id not in present:
+                lost.add(track_id, x, y, now)
+        if not len(lost):
+            return
+        lost.expire(now)
+        for track_id in present.intersection(lost.tracks):
+            # Back under its own id
+            lost.discard(track_id)
+        if not len(lost):
+            return
+
+        # Detections inside a zone whose track was not inside one last frame,
+        # and is not held inside one either
+        previous = set(previous)
+        new = [d for d in np.unique(box_idx[inside]).tolist() if track_ids[d] not in previous]
+        if not new:
+            return
+        ids = self.state._ids
+        held = set(ids['track'][~np.isnan(self.state._entered)].tolist())
+        for detection in new:
+            track_id = int(track_ids[detection])
+            if track_id in held:
+                continue
+            zones = set(zone_idx[inside & (box_idx == detection)].tolist())
+            left, top, width, height = boxes[detection].tolist()
+            for candidate in lost.near(left + width / 2, top + height / 2):
+                ids = self.state._ids
+                rows = ids['track'] == candidate
+                if not zones & set(ids['zone'][rows & ~np.isnan(self.state._entered)].tolist()):
+                    continue
+                new_ids = ids[rows].copy()
+                new_ids['track'] = track_id
+                self.state.relabel(rows, new_ids)
+                lost.discard(candidate)
+                lost.reassociated += 1
+                log.debug("Track %d continues lost track %d", track_id, candidate)
+                break
+
+    def replay(self, track_ids, boxes, times) -> List[Tuple[np.ndarray, ZoneUpdate]]:
+        """Apply detections from several past frames, given oldest first.
+
+        Without hysteresis or grace, a track's detections between two changes
+        of the set of zones it is in only move its last-seen time, except for
+        the one where it has been in a zone for longer than the zone's
+        timeout. So only its first and last detection, those where the set
+        changes, the last one before each change and the first one past each
+        timeout are applied, each at its own time. That takes as many updates
+        as the most such detections of a single track, instead of one per
+        frame. Returns (detection indexes, update) per update.
+        """
+        track_ids = np.asarray(track_ids, dtype=np.uint64)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        times = np.asarray(times, dtype=np.float64)
+        if len(track_ids) == 0:
+            return []
+        box_idx, zone_idx = self.candidates(boxes)
+        inside = self.overlap_ratios(boxes, box_idx, zone_idx) > self._min_overlap[zone_idx]
+
+        order = np.argsort(track_ids, kind='stable')
+        tracks = track_ids[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = tracks[1:] != tracks[:-1]
+        # (position in order, zone) of every detection inside a zone
+        position = np.empty(len(order), dtype=np.int64)
+        position[order] = np.arange(len(order))
+        pos, zone = position[box_idx[inside]], zone_idx[inside]
+        # A detection's set of zones differs from the previous one's if it
+        # has another size or holds a zone the previous one is not in
+        changed = first.copy()
+        counts = np.bincount(pos, minlength=len(order))
+        changed[1:] |= counts[1:] != counts[:-1]
+        num_zones = max(len(self.zones), 1)
+        keys = pos * num_zones + zone
+        changed[pos[~np.isin(keys - num_zones, keys)]] = True
+        if self._debounced:
+            # Whether a track stays inside depends on its previous detections
+            # and the time since it dropped out, so every detection counts
+            changed[:] = True
+        else:
+            # The last detection before a change, or of the track, carries
+            # its last-seen time
+            changed[:-1] |= changed[1:]
+            changed[-1] = True
+            changed[self._timeout_crossings(track_ids, times, order, first, pos, zone)] = True
+        rows = order[changed]
+        # n-th applied detection of each track goes into the n-th update
+        starts = first[changed]
+        positions = np.arange(len(rows))
+        rank = positions - np.maximum.accumulate(np.where(starts, positions, 0))
+        updates = []
+        for n in range(int(rank.max()) + 1):
+            selected = rows[rank == n]
+            updates.append((selected, self.update(track_ids[selected], boxes[selected], times[selected])))
+        return updates
+
+    def _timeout_crossings(self, track_ids, times, order, first, pos, zone) -> np.ndarray:
+        # Positions in order of the first detection of every run of a track
+        # inside a zone at which it has been inside for the zone's timeout;
+        # pos and zone are the (position in order, zone) pairs inside
+        if len(pos) == 0:
+            return np.empty(0, dtype=np.int64)
+        # (zone, position) order groups the pairs by zone and track, oldest first
+        pair_order = np.lexsort((pos, zone))
+        pos, zone = pos[pair_order], zone[pair_order]
+        start = first[pos]
+        start[0] = True
+        start[1:] |= (zone[1:] != zone[:-1]) | (pos[1:] != pos[:-1] + 1)
+        pair_times = times[order[pos]]
+        entered = pair_times.copy()
+        if len(self.state):
+            # A run from a track's first detection continues a stay the state already holds
+            keys = np.empty(len(pos), dtype=ZONE_TRACK_KEY)
+            keys['zone'] = zone
+            keys['track'] = track_ids[order[pos]]
+            carried = np.flatnonzero(start & first[pos])
+            carried = carried[self.state.contains(keys[carried])]
+            held = self.state._entered[np.searchsorted(self.state._ids, keys[carried])]
+            entered[carried] = np.where(np.isnan(held), entered[carried], held)
+        indexes = np.arange(len(pos))
+        entered = entered[np.maximum.accumulate(np.where(start, indexes, 0))]
+        due = pair_times - entered >= self._timeouts[zone]
+        due[1:] &= start[1:] | ~due[:-1]
+        return pos[due]
+
+    def transitions(self, update: ZoneUpdate, track_ids) -> List[Tuple[str, str, int, int]]:
+        """List the (event type, zone id, track id, detection index) transitions of an update."""
+        pairs = update.pairs
+        changed = np.flatnonzero(pairs.entered | pairs.left | pairs.alerted)
+        events = []
+        for i in changed.tolist():
+            zone_id = self.zones[update.zone[i]].zone_id
+            detection = int(update.detection[i])
+            track_id = int(track_ids[detection])
+            if pairs.entered[i]:
+                events.append((EVENT_ENTER, zone_id, track_id, detection))
+            if pairs.alerted[i]:
+                events.append((EVENT_ALERT, zone_id, track_id, detection))
+            if pairs.left[i]:
+                events.append((EVENT_LEAVE, zone_id, track_id, detection))
+        return events
+
+    def active_zones(self) -> np.ndarray:
+        """Boolean mask over zones that currently hold an active alert."""
+        active = np.zeros(len(self.zones), dtype=bool)
+        active[self.state._ids['zone'][self.state._active]] = True
+        return active
+
+    def has_active_alerts(self) -> bool:
+        return self.state.has_active_alerts()
+
+
+def parse_zone(spec: Dict, default_timeout: Optional[float] = None, debounce: Dict = None) -> Zone:
+    # debounce holds defaults for exit_overlap, grace and grace_frames
+    debounce = debounce or {}
+    zone_id = str(spec['id'])
+    timeout = float(spec.get('timeout', default_timeout if default_timeout is not None else 0.0))
+    min_overlap = float(spec.get('min_overlap', 0.5))
+    exit_overlap = spec.get('exit_overlap', debounce.get('exit_overlap'))
+    grace_frames = spec.get('grace_frames', debounce.get('grace_frames', 0))
+    if isinstance(grace_frames, bool) or not float(grace_frames).is_integer():
+        raise ValueError(f"Zone {zone_id}: grace_frames must be a whole number, got {grace_frames!r}")
+    settings = {'exit_overlap': float(exit_overlap) if exit_overlap is not None else None,
+                'grace': float(spec.get('grace', debounce.get('grace', 0.0))),
+                'grace_frames': int(float(grace_frames))}
+    if 'exit_overlap' not in spec and settings['exit_overlap'] is not None:
+        # A default exit threshold never goes above the zone's own entry threshold
+        settings['exit_overlap'] = min(settings['exit_overlap'], min_overlap)
+    if 'rect' in spec:
+        return Zone.from_rect(zone_id, [float(v) for v in spec['rect']], timeout, min_overlap, **settings)
+    if 'polygon' in spec:
+        return Zone(zone_id, [(float(x), float(y)) for x, y in spec['polygon']], timeout,
+                    min_overlap=min_overlap, **settings)
+    raise ValueError(f"Zone {zone_id}: expected a 'rect' or 'polygon' entry")
+
+
+def parse_zones(data, default_timeout: Optional[float] = None, debounce: Dict = None) -> Dict[int, List[Zone]]:
+    """Zones per stream from either a list of zone objects (applied to
+    stream 0) or a mapping of stream index to such a list. Each zone object
+    has an "id", either "rect": [left, top, width, height] or
+    "polygon": [[x, y], ...], and optionally "timeout", "min_overlap",
+    "exit_overlap", "grace" (seconds) and "grace_frames"; debounce holds
+    defaults for the last three. Zone ids are unique within a stream and
+    "ROI" is reserved.
+    """
+    if isinstance(data, list):
+        data = {'0': data}
+    if not isinstance(data, dict):
+        raise ValueError("Expected a list of zones or a mapping of stream index to zones")
+    zones = {}
+    for stream, specs in data.items():
+        try:
+            stream_zones = [parse_zone(spec, default_timeout, debounce) for spec in specs]
+        except ValueError as e:
+            raise ValueError(f"stream {stream}: {e}") from e
+        # Dwell state is carried over a reload by zone id, so ids must not repeat
+        seen = {ROI_ZONE_ID}
+        for zone in stream_zones:
+            if zone.zone_id in seen:
+                reason = "is reserved" if zone.zone_id == ROI_ZONE_ID else "is used twice"
+                raise ValueError(f"stream {stream}: zone id {zone.zone_id!r} {reason}")
+            seen.add(zone.zone_id)
+        zones[int(stream)] = stream_zones
+    return zones
+
+
+def load_zones(path: str, default_timeout: Optional[float] = None, debounce: Dict = None) -> Dict[int, List[Zone]]:
+    """Load zones from a JSON file, see parse_zones for the format."""
+    with open(path) as f:
+        return parse_zones(json.load(f), default_timeout, debounce)
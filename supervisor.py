@@ -0,0 +1,106 @@
+import sys
+sys.path.append('../')
+import argparse
+import os
+import signal
+import tempfile
+import time
+from common.config import ConfigError, load_config
+from common.events import EventDispatcher, EventQueue, create_sink
+from common.health import Backoff
+from common.log import get_logger, setup_logging
+from common.metrics import MetricsExporter
+from common.supervisor import Supervisor, plan_shards
+
+log = get_logger('supervisor')
+
+PIPELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test.py')
+
+
+def worker_command(config_path, count):
+    # Every worker reads the same config and takes its shard of the sources
+    def command(shard, socket_path):
+        argv = [sys.executable, PIPELINE, '--config', config_path, '--shard', f"{shard.index}/{count}",
+                '--supervisor', socket_path]
+        if shard.gpu_id is not None:
+            argv += ['--gpu-id', str(shard.gpu_id)]
+        return argv
+    return command
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        prog=args[0], description="Split the sources of a pipeline config across worker processes, restart those "
+                                  "that fail and collect their events and metrics",
+        epilog="SIGHUP is passed on to the workers, which reload their zones.")
+    parser.add_argument("--config", required=True, help="pipeline config, see config/pipeline_example.yaml")
+    parser.add_argument("--workers", type=int, help="worker processes (default: supervisor.workers of the config)")
+    parser.add_argument("--gpus", help="comma separated GPU ids, assigned to the workers round robin "
+                                       "(default: supervisor.gpus of the config)")
+    opts = parser.parse_args(args[1:])
+    try:
+        config = load_config(opts.config)
+        if config.archive is not None:
+            raise ConfigError("archive: scans run in one pipeline, use test.py")
+        gpus = [int(gpu) for gpu in opts.gpus.split(',')] if opts.gpus else config.supervisor['gpus']
+    except (ConfigError, ValueError) as e:
+        parser.error(str(e))
+    if opts.workers is not None and opts.workers < 1:
+        parser.error("--workers: must be at least 1")
+    setup_logging(config.log_level)
+    settings = config.supervisor
+    shards = plan_shards(config.sources, opts.workers or settings['workers'], gpus)
+
+    events = None
+    if config.events:
+        try:
+            sinks = [create_sink(spec) for spec in config.events]
+        except (OSError, ValueError) as e:
+            log.error(f"Unable to create event sink: {e}")
+            return 1
+        events = EventDispatcher(sinks, EventQueue(config.event_queue_size))
+        events.start()
+
+    socket_dir = None
+    socket_path = settings['socket']
+    if socket_path is None:
+        socket_dir = tempfile.mkdtemp(prefix='deepstream-supervisor-')
+        socket_path = os.path.join(socket_dir, 'ipc.sock')
+    supervisor = Supervisor(shards, worker_command(os.path.abspath(opts.config), len(shards)), socket_path, events,
+                            Backoff(maximum=settings['restart_max_delay']), settings['stable_after'])
+    metrics = None
+    if config.metrics_port is not None or config.metrics_file:
+        try:
+            metrics = MetricsExporter(supervisor, config.metrics_port, config.metrics_file, config.metrics_interval)
+        except OSError as e:
+            log.error(f"Unable to serve metrics on port {config.metrics_port}: {e}")
+            return 1
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGHUP, lambda signum, frame: supervisor.signal(signal.SIGHUP))
+    log.info("Supervising %d workers for %d sources", len(shards), len(config.sources))
+    supervisor.start(time.monotonic())
+    if metrics is not None:
+        metrics.start()
+    try:
+        while not stopping and not supervisor.finished:
+            supervisor.poll(time.monotonic())
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+
+    supervisor.stop()
+    if socket_dir is not None:
+        os.rmdir(socket_dir)
+    if metrics is not None:
+        metrics.stop()
+    if events is not None:
+        events.stop()
+        log.info("Events: %s", events.stats())
+    log.info("Supervisor: %s", supervisor.stats())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -1,106 +1,128 @@
 import sys
 sys.path.append('../')
 import os
+import signal
 import gi
 gi.require_version('Gst', '1.0')
 from gi.repository import GLib, Gst
+from common.analytics import AnalyticsEngine, ClassCounts, LineCrossing, ZoneOccupancy
+from common.archive import ArchiveReport, ArchiveScheduler, find_files
 from common.bus_call import bus_call
+from common.clock import CLOCK_SOURCES, FrameClock
+from common.config import (DEFAULT_INFER_CONFIG, DEFAULT_TRACKER_CONFIG, ConfigError, PipelineConfig, load_config,
+                           parse_config)
+from common.control import ControlServer, SourceControl
+from common.engine import EngineCache
+from common.events import EventDispatcher, EventQueue, create_sink
+from common.evidence import EVIDENCE_FORMATS, EvidenceRecorder, EvidenceStore, SurfaceFrames, make_encoder
+from common.health import Backoff, SourceWatchdog
+from common.is_aarch_64 import is_aarch64
+from common.latency import LatencyBudget
+from common.log import LEVELS, get_logger, setup_logging
+from common.metrics import Metrics, MetricsExporter, PhaseTimer
+from common.output import OUTPUT_MODES, OutputConfig, create_output_elements, start_rtsp_server
+from common.probe import FrameProcessor
+from common.replay import ReplayWriter
+from common.scheduler import SCHEDULE_MODES, InferenceScheduler
+from common.supervisor import SupervisorLink, localize, plan_shards
+from common.tracker import read_tracker_config
+from common.zones import Zone
 import pyds
-import configparser
-from typing import Tuple, List, Dict
+import argparse
+from typing import Callable, Tuple, List, Dict, Optional
+import functools
+import math
+import threading
 import time
 
-# Update class IDs according to PeopleNet labels
-PGIE_CLASS_ID_PERSON = 0
-PGIE_CLASS_ID_BAG = 1
-PGIE_CLASS_ID_FACE = 2
+log = get_logger('pipeline')
 
-class BBox:
-    def __init__(self, left: float, top: float, width: float, height: float):
-        self.left = left
-        self.top = top
-        self.width = width
-        self.height = height
+TILED_OUTPUT_WIDTH = 1280
+TILED_OUTPUT_HEIGHT = 720
 
-    def get_area(self) -> float:
-        return self.width * self.height
-
-    def get_intersection(self, other: 'BBox') -> float:
-        x1 = max(self.left, other.left)
-        y1 = max(self.top, other.top)
-        x2 = min(self.left + self.width, other.left + other.width)
-        y2 = min(self.top + self.height, other.top + other.height)
-
-        if x1 >= x2 or y1 >= y2:
-            return 0.0
-
-        intersection_area = (x2 - x1) * (y2 - y1)
-        return intersection_area
-
-class ROIInspector:
-    def __init__(self, roi_coords: List[float], timeout: float):
-        self.roi = BBox(roi_coords[0], roi_coords[1], roi_coords[2], roi_coords[3])
-        self.timeout = timeout
-        self.track_timestamps: Dict[int, float] = {}  # track_id -> first_detection_time
-        self.alerted_tracks: set = set()
-        self.active_alerts: set = set()  # Currently active alerts (still in ROI)
-
-    def check_intersection(self, bbox: BBox) -> float:
-        intersection_area = bbox.get_intersection(self.roi)
-        return intersection_area / bbox.get_area()
-
-    def update(self, track_id: int, bbox: BBox) -> bool:
-        intersection_ratio = self.check_intersection(bbox)
-        current_time = time.time()
-
-        print(f"Track {track_id}: intersection ratio = {intersection_ratio}")
-
-        if intersection_ratio > 0.5:
-            if track_id not in self.track_timestamps:
-                print(f"Track {track_id}: entered ROI")
-                self.track_timestamps[track_id] = current_time
-            
-            # If already alerted, keep the alert active
-            if track_id in self.alerted_tracks:
-                self.active_alerts.add(track_id)
-                return True
-                
-            elif track_id not in self.alerted_tracks:
-                time_in_roi = current_time - self.track_timestamps[track_id]
-                print(f"Track {track_id}: time in ROI = {time_in_roi:.2f}s")
-                if time_in_roi >= self.timeout:
-                    print(f"Track {track_id}: ALERT!")
-                    self.alerted_tracks.add(track_id)
-                    self.active_alerts.add(track_id)
-                    return True
-        else:
-            if track_id in self.track_timestamps:
-                print(f"Track {track_id}: left ROI")
-                del self.track_timestamps[track_id]
-            self.active_alerts.discard(track_id)  # Remove from active alerts when outside ROI
-
-        return False
-
-    def has_active_alerts(self) -> bool:
-        return len(self.active_alerts) > 0
+# Files scanned at once by --archive without --max-sources
+DEFAULT_ARCHIVE_SLOTS = 4
 
 class Pipeline:
-    def __init__(self, roi_coords: List[float], timeout: float):
+    def __init__(self, roi_zone: Optional[Zone], zones: Dict[int, List[Zone]] = None,
+                 clock_source: str = 'pts', track_limits: Dict = None, events: EventDispatcher = None,
+                 output: OutputConfig = None, recorder: ReplayWriter = None, metrics: MetricsExporter = None,
+                 max_sources: int = 0, watchdog: SourceWatchdog = None, engine_cache: EngineCache = None,
+                 startup: PhaseTimer = None, scheduler: InferenceScheduler = None, schedule_mode: str = 'interval',
+                 infer_config: str = DEFAULT_INFER_CONFIG, tracker: Dict = None,
+                 reload_config: Callable[[], PipelineConfig] = None, track_history: int = 30,
+                 analytics: AnalyticsEngine = None, decoupled: bool = False, evidence: EvidenceRecorder = None,
+                 archive: ArchiveScheduler = None, gpu_id: Optional[int] = None,
+                 latency_budget: LatencyBudget = None, queue_size: int = 2):
         self.pipeline = None
         self.loop = None
-        self.past_tracking_meta = [0]
-        self.roi_inspector = ROIInspector(roi_coords, timeout)
-        
+        self.streammux = None
+        # Batch size; sources can be added at runtime up to this number
+        self.num_sources = 0
+        self.max_sources = max_sources
+        # Source bin and URI per streammux sink pad index
+        self.sources: Dict[int, Tuple[Gst.Bin, str]] = {}
+        self.events = events
+        self.output = output or OutputConfig()
+        self.rtsp_server = None
+        self.recorder = recorder
+        self.metrics = metrics
+        self.control = None
+        # Stall detection and reconnects for live sources, if enabled
+        self.watchdog = watchdog
+        # nvinfer config generated for the batch size, see common/engine.py
+        self.engine_cache = engine_cache or EngineCache()
+        self.infer_config = infer_config
+        # nvtracker properties, validated with the rest of the config
+        self.tracker = tracker if tracker is not None else read_tracker_config(DEFAULT_TRACKER_CONFIG)
+        # Re-reads the config on SIGHUP to swap in new zones, if set
+        self.reload_config = reload_config
+        self.startup = startup or PhaseTimer()
+        self.first_frame = True
+        # Error that stopped the pipeline, if any, so the exit status shows it
+        self.error = None
+        # Alert images, from RGBA frames converted after the tracker
+        self.evidence = evidence
+        # Archive scan: files are handed to the batch slots as others end,
+        # and the alerts go into its report before reaching the event sinks
+        self.archive = archive
+        # GPU of every element that has a gpu-id, None leaves the defaults
+        self.gpu_id = gpu_id
+        # Latency budget mode: queues between the stages, a leaky one in
+        # front of nvinfer, and frames over the budget dropped per stream
+        # before the muxer
+        self.latency_budget = latency_budget
+        self.queue_size = queue_size
+        # Activity-driven inference rate, applied as nvinfer interval or by
+        # dropping idle streams' frames before the muxer
+        self.scheduler = scheduler
+        self.schedule_mode = schedule_mode
+        self.pgie = None
+        self.pgie_interval = 0
+        if metrics is not None:
+            metrics.metrics.watchdog = watchdog
+            metrics.metrics.startup = self.startup
+            metrics.metrics.analytics = analytics
+            metrics.metrics.evidence = evidence
+            metrics.metrics.latency_budget = latency_budget
+        self.processor = FrameProcessor(roi_zone, zones,
+                                        FrameClock(clock_source), track_limits,
+                                        archive if archive is not None else events,
+                                        annotate=self.output.osd, recorder=recorder,
+                                        metrics=metrics.metrics if metrics is not None else None,
+                                        scheduler=scheduler, track_history=track_history, analytics=analytics,
+                                        decoupled=decoupled, evidence=evidence)
+
     def create_source_bin(self, index, uri):
-        print("Creating source bin")
+        log.info("Creating source bin %d for %s", index, uri)
         bin_name = "source-bin-%02d" % index
         nbin = Gst.Bin.new(bin_name)
         if not nbin:
-            sys.stderr.write(" Unable to create source bin \n")
+            log.error("Unable to create source bin")
 
         uri_decode_bin = Gst.ElementFactory.make("uridecodebin", "uri-decode-bin")
         if not uri_decode_bin:
-            sys.stderr.write(" Unable to create uri decode bin \n")
+            log.error("Unable to create uri decode bin")
 
         uri_decode_bin.set_property("uri", uri)
         uri_decode_bin.connect("pad-added", self.cb_newpad, nbin)
@@ -109,12 +131,11 @@ class Pipeline:
         Gst.Bin.add(nbin, uri_decode_bin)
         bin_pad = nbin.add_pad(Gst.GhostPad.new_no_target("src", Gst.PadDirection.SRC))
         if not bin_pad:
-            sys.stderr.write(" Failed to add ghost pad in source bin \n")
+            log.error("Failed to add ghost pad in source bin")
             return None
         return nbin
 
     def cb_newpad(self, decodebin, decoder_src_pad, data):
-        print("In cb_newpad\n")
         caps = decoder_src_pad.get_current_caps()
         if not caps:
             caps = decoder_src_pad.query_caps()
@@ -123,20 +144,23 @@ class Pipeline:
         source_bin = data
         features = caps.get_features(0)
 
-        print("gstname=", gstname)
+        log.debug("New decoder pad: gstname=%s", gstname)
         if(gstname.find("video")!=-1):
-            print("features=", features)
+            log.debug("features=%s", features)
             if features.contains("memory:NVMM"):
                 bin_ghost_pad = source_bin.get_static_pad("src")
                 if not bin_ghost_pad.set_target(decoder_src_pad):
-                    sys.stderr.write("Failed to link decoder src pad to source bin ghost pad\n")
+                    log.error("Failed to link decoder src pad to source bin ghost pad")
             else:
-                sys.stderr.write(" Error: Decodebin did not pick nvidia decoder plugin.\n")
+                log.error("Decodebin did not pick nvidia decoder plugin.")
 
     def decodebin_child_added(self, child_proxy, Object, name, user_data):
-        print("Decodebin child added:", name, "\n")
+        log.debug("Decodebin child added: %s", name)
         if(name.find("decodebin") != -1):
             Object.connect("child-added", self.decodebin_child_added, user_data)
+        # The hardware decoder, on the pipeline's GPU
+        if self.gpu_id is not None and Object.find_property('gpu-id') is not None:
+            Object.set_property('gpu-id', self.gpu_id)
         
         if "source" in name:
             source_element = child_proxy.get_by_name("source")
@@ -144,337 +168,929 @@ class Pipeline:
                 Object.set_property("drop-on-latency", True)
 
     def osd_sink_pad_buffer_probe(self, pad, info, u_data):
-        frame_number=0
-        num_rects=0
-
         gst_buffer = info.get_buffer()
         if not gst_buffer:
-            print("Unable to get GstBuffer ")
-            return
+            log.warning("Unable to get GstBuffer")
+            return Gst.PadProbeReturn.OK
+        if self.first_frame:
+            self.first_frame = False
+            self.startup.end()
+            log.info("Startup: %s, total %.2fs", self.startup.summary(), self.startup.total())
 
         # Retrieve batch metadata from the gst_buffer
         # Note that pyds.gst_buffer_get_nvds_batch_meta() expects the
         # C address of gst_buffer as input, which is obtained with hash(gst_buffer)
         batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
+        frames = SurfaceFrames(hash(gst_buffer)) if self.evidence is not None else None
+        self.processor.process_batch(batch_meta, frames)
+        if frames is not None:
+            frames.release()
+        if self.archive is not None:
+            self.archive.frames([index for index, _ in self.batch_frames(batch_meta)], time.monotonic())
+        if self.latency_budget is not None:
+            now = self.running_time()
+            for index, pts in self.batch_frames(batch_meta):
+                self.latency_budget.frame(index, pts, now)
+        return Gst.PadProbeReturn.OK
+
+    def batch_frames(self, batch_meta):
+        # Pad index and PTS of the frames of a batch
+        frames = []
         l_frame = batch_meta.frame_meta_list
         while l_frame is not None:
             try:
-                # Note that l_frame.data needs a cast to pyds.NvDsFrameMeta
-                # The casting is done by pyds.NvDsFrameMeta.cast()
-                # The casting also keeps ownership of the underlying memory
-                # in the C code, so the Python garbage collector will leave
-                # it alone.
                 frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
             except StopIteration:
                 break
-
-            # Initialize object counter with PeopleNet classes
-            obj_counter = {
-                PGIE_CLASS_ID_PERSON: 0,
-                PGIE_CLASS_ID_BAG: 0,
-                PGIE_CLASS_ID_FACE: 0
-            }
-            frame_number=frame_meta.frame_num
-            num_rects = frame_meta.num_obj_meta
-            l_obj=frame_meta.obj_meta_list
-            while l_obj is not None:
-                try:
-                    # Casting l_obj.data to pyds.NvDsObjectMeta
-                    obj_meta=pyds.NvDsObjectMeta.cast(l_obj.data)
-                except StopIteration:
-                    break
-                obj_counter[obj_meta.class_id] += 1
-
-                # Only process PERSON class
-                if obj_meta.class_id == PGIE_CLASS_ID_PERSON:
-                    bbox = BBox(
-                        obj_meta.rect_params.left,
-                        obj_meta.rect_params.top,
-                        obj_meta.rect_params.width,
-                        obj_meta.rect_params.height
-                    )
-
-                    # Check if person is in ROI for too long
-                    is_alert = self.roi_inspector.update(obj_meta.object_id, bbox)
-                    
-                    if is_alert:
-                        # Set red color for alert
-                        obj_meta.rect_params.border_color.set(1.0, 0.0, 0.0, 0.8)
-                        obj_meta.text_params.display_text = f"ALERT! ID={obj_meta.object_id} {obj_meta.obj_label}"
-                    else:
-                        # Set default blue color
-                        obj_meta.rect_params.border_color.set(0.0, 0.0, 1.0, 0.8)
-                        obj_meta.text_params.display_text = f"ID={obj_meta.object_id} {obj_meta.obj_label}"
-
-                try: 
-                    l_obj=l_obj.next
-                except StopIteration:
-                    break
-
-            # Acquiring a display meta object
-            display_meta = pyds.nvds_acquire_display_meta_from_pool(batch_meta)
-            display_meta.num_labels = 3  # Changed to 3 for ROI label and alert message
-            py_nvosd_text_params = display_meta.text_params[0]
-
-            # Setting display text to be shown on screen
-            py_nvosd_text_params.display_text = "Frame Number={} Number of Objects={} Person_count={} Bag_count={} Face_count={}".format(
-                frame_number, num_rects, 
-                obj_counter[PGIE_CLASS_ID_PERSON],
-                obj_counter[PGIE_CLASS_ID_BAG],
-                obj_counter[PGIE_CLASS_ID_FACE]
-            )
-            # Now set the offsets where the string should appear
-            py_nvosd_text_params.x_offset = 10
-            py_nvosd_text_params.y_offset = 12
-
-            # Font , font-color and font-size
-            py_nvosd_text_params.font_params.font_name = "Serif"
-            py_nvosd_text_params.font_params.font_size = 10
-            # set(red, green, blue, alpha); set to White
-            py_nvosd_text_params.font_params.font_color.set(1.0, 1.0, 1.0, 1.0)
-
-            # Text background color
-            py_nvosd_text_params.set_bg_clr = 1
-            # set(red, green, blue, alpha); set to Black
-            py_nvosd_text_params.text_bg_clr.set(0.0, 0.0, 0.0, 1.0)
-
-            # Add ROI rectangle display
-            display_meta.num_rects = 1
-            roi_rect_params = display_meta.rect_params[0]
-            roi_rect_params.left = self.roi_inspector.roi.left
-            roi_rect_params.top = self.roi_inspector.roi.top
-            roi_rect_params.width = self.roi_inspector.roi.width
-            roi_rect_params.height = self.roi_inspector.roi.height
-            roi_rect_params.border_width = 2
-            
-            # Change ROI color to red if there are active alerts
-            if self.roi_inspector.has_active_alerts():
-                roi_rect_params.border_color.set(1.0, 0.0, 0.0, 0.8)  # Red color for active alert
-            else:
-                roi_rect_params.border_color.set(0.0, 1.0, 0.0, 0.8)  # Green color for normal state
-            
-            roi_rect_params.has_bg_color = 0
-            roi_rect_params.bg_color.set(0.0, 0.0, 0.0, 0.0)
-
-            # Add ROI label
-            roi_text_params = display_meta.text_params[1]
-            roi_text_params.display_text = "ROI"
-            roi_text_params.x_offset = int(self.roi_inspector.roi.left)
-            roi_text_params.y_offset = int(self.roi_inspector.roi.top - 10)
-            roi_text_params.font_params.font_name = "Serif"
-            roi_text_params.font_params.font_size = 15
-            roi_text_params.font_params.font_color.set(0.0, 1.0, 0.0, 1.0)
-            roi_text_params.set_bg_clr = 1
-            roi_text_params.text_bg_clr.set(0.0, 0.0, 0.0, 1.0)
-
-            # Add Alert Message if there are active alerts
-            alert_text_params = display_meta.text_params[2]
-            if self.roi_inspector.has_active_alerts():
-                alert_text_params.display_text = "⚠ ALERT: Person(s) in restricted area!"
-                alert_text_params.x_offset = 10
-                alert_text_params.y_offset = 50  # Below the frame info
-                alert_text_params.font_params.font_name = "Serif"
-                alert_text_params.font_params.font_size = 20
-                alert_text_params.font_params.font_color.set(1.0, 0.0, 0.0, 1.0)  # Red color
-                alert_text_params.set_bg_clr = 1
-                alert_text_params.text_bg_clr.set(0.0, 0.0, 0.0, 0.8)  # Semi-transparent black background
-            else:
-                alert_text_params.display_text = ""  # No alert message when no active alerts
-
-            # Using pyds.get_string() to get display_text as string
-            print(pyds.get_string(py_nvosd_text_params.display_text))
-            pyds.nvds_add_display_meta_to_frame(frame_meta, display_meta)
-
+            frames.append((frame_meta.pad_index, frame_meta.buf_pts))
             try:
-                l_frame=l_frame.next
+                l_frame = l_frame.next
             except StopIteration:
                 break
-            
-        # Add past tracking meta data processing
-        if(self.past_tracking_meta[0]==1):
-            l_user=batch_meta.batch_user_meta_list
-            while l_user is not None:
-                try:
-                    user_meta=pyds.NvDsUserMeta.cast(l_user.data)
-                except StopIteration:
-                    break
-                if(user_meta and user_meta.base_meta.meta_type==pyds.NvDsMetaType.NVDS_TRACKER_PAST_FRAME_META):
-                    try:
-                        pPastFrameObjBatch = pyds.NvDsPastFrameObjBatch.cast(user_meta.user_meta_data)
-                    except StopIteration:
-                        break
-                    for trackobj in pyds.NvDsPastFrameObjBatch.list(pPastFrameObjBatch):
-                        print("streamId=",trackobj.streamID)
-                        print("surfaceStreamID=",trackobj.surfaceStreamID)
-                        for pastframeobj in pyds.NvDsPastFrameObjStream.list(trackobj):
-                            print("numobj=",pastframeobj.numObj)
-                            print("uniqueId=",pastframeobj.uniqueId)
-                            print("classId=",pastframeobj.classId)
-                            print("objLabel=",pastframeobj.objLabel)
-                            for objlist in pyds.NvDsPastFrameObjList.list(pastframeobj):
-                                print('frameNum:', objlist.frameNum)
-                                print('tBbox.left:', objlist.tBbox.left)
-                                print('tBbox.width:', objlist.tBbox.width)
-                                print('tBbox.top:', objlist.tBbox.top)
-                                print('tBbox.right:', objlist.tBbox.height)
-                                print('confidence:', objlist.confidence)
-                                print('age:', objlist.age)
-                try:
-                    l_user=l_user.next
-                except StopIteration:
-                    break
-            
-        return Gst.PadProbeReturn.OK    
+        return frames
+
+    def running_time(self) -> float:
+        # Seconds on the pipeline clock since it started playing, the time
+        # base of live sources' PTS
+        clock = self.pipeline.get_clock()
+        if clock is None:
+            return 0.0
+        return (clock.get_time() - self.pipeline.get_base_time()) / Gst.SECOND
 
-    def create_pipeline(self, video_path):
+    def create_pipeline(self, uris):
         # Standard GStreamer initialization
         Gst.init(None)
 
+        # Point nvinfer at an engine built for this batch size, so it does
+        # not rebuild one at startup
+        self.num_sources = max(len(uris), self.max_sources)
+        self.startup.begin('engine cache')
+        base_config = self.infer_config
+        try:
+            self.infer_config = self.engine_cache.resolve(base_config, self.num_sources, self.gpu_id).config_path
+        except (OSError, ValueError) as e:
+            log.warning("Unable to generate nvinfer config, using %s: %s", base_config, e)
+        self.startup.begin('build pipeline')
+
         # Create Pipeline
-        print("Creating Pipeline \n ")
+        log.info("Creating Pipeline")
         self.pipeline = Gst.Pipeline()
         if not self.pipeline:
-            sys.stderr.write(" Unable to create Pipeline \n")
+            log.error("Unable to create Pipeline")
 
         # Create elements
         streammux = Gst.ElementFactory.make("nvstreammux", "Stream-muxer")
         if not streammux:
-            sys.stderr.write(" Unable to create NvStreamMux \n")
+            log.error("Unable to create NvStreamMux")
 
         self.pipeline.add(streammux)
+        self.streammux = streammux
 
-        # Create and add source bin
-        uri_name = "file://" + os.path.abspath(video_path)
-        source_bin = self.create_source_bin(0, uri_name)
-        if not source_bin:
-            sys.stderr.write("Unable to create source bin \n")
-        self.pipeline.add(source_bin)
+        # Create and add one source bin per input
+        source_bins = []
+        for index, uri in enumerate(uris):
+            source_bin = self.create_source_bin(index, uri)
+            if not source_bin:
+                log.error("Unable to create source bin")
+            self.pipeline.add(source_bin)
+            source_bins.append(source_bin)
+            self.sources[index] = (source_bin, uri)
+            self.watch_source(index, uri, source_bin)
+            self.processor.add_stream(index)
+            if self.latency_budget is not None:
+                self.latency_budget.add_stream(index)
+        is_live = any(not uri.startswith("file://") for uri in uris)
 
         # Create and link elements
         elements = self.create_elements()
         if not all(elements.values()):
-            sys.stderr.write("Failed to create elements\n")
+            log.error("Failed to create elements")
             return False
 
         # Configure elements
-        self.configure_elements(streammux, elements['pgie'], elements['tracker'])
+        self.configure_elements(streammux, elements, is_live)
 
         # Link elements
-        self.link_elements(streammux, source_bin, elements)
+        self.link_elements(streammux, source_bins, elements)
 
-        # Set up probe
-        osdsinkpad = elements['nvosd'].get_static_pad("sink")
-        if not osdsinkpad:
-            sys.stderr.write(" Unable to get sink pad of nvosd \n")
-        osdsinkpad.add_probe(Gst.PadProbeType.BUFFER, self.osd_sink_pad_buffer_probe, 0)
+        # Set up probe. With several sources the metadata is handled before
+        # the tiler composites the batch into a single frame; without OSD it
+        # is handled right after the tracker.
+        if 'tiler' in elements:
+            probe_pad = elements['tiler'].get_static_pad("sink")
+        elif 'nvosd' in elements:
+            probe_pad = elements['nvosd'].get_static_pad("sink")
+        elif 'evidence_caps' in elements:
+            probe_pad = elements['evidence_caps'].get_static_pad("src")
+        else:
+            # After the queue behind the tracker, if any, so the two run in parallel
+            probe_pad = elements.get('post_queue', elements['tracker']).get_static_pad("src")
+        if not probe_pad:
+            log.error("Unable to get probe pad")
+        probe_pad.add_probe(Gst.PadProbeType.BUFFER, self.osd_sink_pad_buffer_probe, 0)
+
+        if self.metrics is not None:
+            self.add_latency_probes(streammux, elements)
 
         return True
 
     def create_elements(self):
-        elements = {
-            'pgie': Gst.ElementFactory.make("nvinfer", "primary-inference"),
-            'tracker': Gst.ElementFactory.make("nvtracker", "tracker"),
-            'nvvidconv': Gst.ElementFactory.make("nvvideoconvert", "convertor"),
-            'nvosd': Gst.ElementFactory.make("nvdsosd", "onscreendisplay"),
-            'sink': Gst.ElementFactory.make("nv3dsink", "nv3d-sink")
-        }
+        elements = {}
+        if self.latency_budget is not None:
+            # Each stage gets its own streaming thread. The queues after
+            # nvinfer block when full, so a slow stage backs up into the
+            # leaky queue in front of nvinfer, which drops the oldest batch
+            # rather than holding up the muxer and the sources.
+            elements['infer_queue'] = self.make_queue("infer-queue", leaky=True)
+        elements['pgie'] = Gst.ElementFactory.make("nvinfer", "primary-inference")
+        if self.latency_budget is not None:
+            elements['tracker_queue'] = self.make_queue("tracker-queue")
+        elements['tracker'] = Gst.ElementFactory.make("nvtracker", "tracker")
+        if self.latency_budget is not None:
+            elements['post_queue'] = self.make_queue("post-queue")
+        # Evidence capture reads the frames on the CPU, which needs RGBA
+        if self.evidence is not None:
+            elements.update({
+                'evidence_conv': Gst.ElementFactory.make("nvvideoconvert", "evidence-convertor"),
+                'evidence_caps': Gst.ElementFactory.make("capsfilter", "evidence-caps"),
+            })
+        # Compositing is only worth it when the frames are looked at
+        if self.num_sources > 1 and self.output.renders:
+            elements['tiler'] = Gst.ElementFactory.make("nvmultistreamtiler", "nvtiler")
+        if self.output.osd:
+            elements.update({
+                'nvvidconv': Gst.ElementFactory.make("nvvideoconvert", "convertor"),
+                'nvosd': Gst.ElementFactory.make("nvdsosd", "onscreendisplay"),
+            })
+        elements.update(create_output_elements(self.output))
         
         for name, element in elements.items():
             if not element:
-                sys.stderr.write(f" Unable to create {name}\n")
+                log.error(f"Unable to create {name}")
             else:
                 self.pipeline.add(element)
                 
         return elements
 
-    def configure_elements(self, streammux, pgie, tracker):
-        # Configure streammux
+    def make_queue(self, name, leaky=False):
+        queue = Gst.ElementFactory.make("queue", name)
+        if not queue:
+            return None
+        queue.set_property("max-size-buffers", self.queue_size)
+        queue.set_property("max-size-bytes", 0)
+        queue.set_property("max-size-time", 0)
+        if leaky:
+            # 2: downstream, drop the oldest buffer
+            queue.set_property("leaky", 2)
+            queue.connect("overrun", self.latency_budget.queue_overrun)
+        return queue
+
+    def configure_elements(self, streammux, elements, is_live=False):
+        # Configure streammux, one batch slot per source
         if os.environ.get('USE_NEW_NVSTREAMMUX') != 'yes':
             streammux.set_property('width', 1920)
             streammux.set_property('height', 1080)
             streammux.set_property('batched-push-timeout', 4000000)
-        streammux.set_property('batch-size', 1)
+        streammux.set_property('batch-size', self.num_sources)
+        if is_live:
+            streammux.set_property('live-source', 1)
 
         # Configure pgie
-        pgie.set_property('config-file-path', "config/config_infer_peoplenet.txt")
+        pgie = elements['pgie']
+        self.pgie = pgie
+        pgie.set_property('config-file-path', self.infer_config)
+        pgie_batch_size = pgie.get_property("batch-size")
+        if pgie_batch_size != self.num_sources:
+            log.warning("Overriding infer-config batch-size %d with number of sources %d",
+                        pgie_batch_size, self.num_sources)
+            pgie.set_property("batch-size", self.num_sources)
+
+        # Configure tiler to show all sources in a grid
+        if 'tiler' in elements:
+            tiler_rows = int(math.sqrt(self.num_sources))
+            tiler_columns = int(math.ceil(self.num_sources / tiler_rows))
+            elements['tiler'].set_property("rows", tiler_rows)
+            elements['tiler'].set_property("columns", tiler_columns)
+            elements['tiler'].set_property("width", TILED_OUTPUT_WIDTH)
+            elements['tiler'].set_property("height", TILED_OUTPUT_HEIGHT)
+
+        if self.evidence is not None:
+            elements['evidence_caps'].set_property(
+                "caps", Gst.Caps.from_string("video/x-raw(memory:NVMM), format=RGBA"))
+            if not is_aarch64():
+                # dGPU buffers must be in unified memory to be mapped on the CPU
+                mem_type = int(pyds.NVBUF_MEM_CUDA_UNIFIED)
+                streammux.set_property("nvbuf-memory-type", mem_type)
+                elements['evidence_conv'].set_property("nvbuf-memory-type", mem_type)
+                if 'tiler' in elements:
+                    elements['tiler'].set_property("nvbuf-memory-type", mem_type)
 
         # Configure tracker
-        self.configure_tracker(tracker)
+        self.configure_tracker(elements['tracker'])
+
+        if self.gpu_id is not None:
+            for element in [streammux, *elements.values()]:
+                if element.find_property('gpu-id') is not None:
+                    element.set_property('gpu-id', self.gpu_id)
 
     def configure_tracker(self, tracker):
-        config = configparser.ConfigParser()
-        config.read('config/config_tracker.txt')
-
-        tracker_properties = {
-            'tracker-width': ('tracker-width', 'tracker-width'),
-            'tracker-height': ('tracker-height', 'tracker-height'),
-            'gpu-id': ('gpu_id', 'gpu-id'),
-            'll-lib-file': ('ll-lib-file', 'll-lib-file'),
-            'll-config-file': ('ll-config-file', 'll-config-file'),
-            'enable-batch-process': ('enable_batch_process', 'enable-batch-process'),
-            'enable-past-frame': ('enable_past_frame', 'enable-past-frame')
-        }
-
-        for key, (prop_name, config_name) in tracker_properties.items():
-            if key in config['tracker']:
-                value = config.getint('tracker', key) if key not in ['ll-lib-file', 'll-config-file'] else config.get('tracker', key)
-                tracker.set_property(prop_name, value)
-                if key == 'enable-past-frame':
-                    self.past_tracking_meta[0] = value
-
-    def link_elements(self, streammux, source_bin, elements):
-        # Link source_bin to streammux
-        padname = "sink_0"
+        for prop_name, value in self.tracker.items():
+            tracker.set_property(prop_name, value)
+            if prop_name == 'enable_past_frame':
+                self.processor.past_tracking_meta = value
+
+    def link_source(self, streammux, index, source_bin):
+        # Link a source bin to its own streammux sink pad
+        padname = "sink_%u" % index
         sinkpad = streammux.get_request_pad(padname)
         if not sinkpad:
-            sys.stderr.write("Unable to create sink pad bin \n")
+            log.error("Unable to create sink pad bin")
+            return False
         srcpad = source_bin.get_static_pad("src")
         if not srcpad:
-            sys.stderr.write("Unable to create src pad bin \n")
+            log.error("Unable to create src pad bin")
+            return False
         srcpad.link(sinkpad)
+        if self.scheduler is not None and self.schedule_mode == 'drop':
+            sinkpad.add_probe(Gst.PadProbeType.BUFFER, self.schedule_drop_probe, index)
+        if self.latency_budget is not None:
+            sinkpad.add_probe(Gst.PadProbeType.BUFFER, self.latency_drop_probe, index)
+        if self.metrics is not None:
+            sinkpad.add_probe(Gst.PadProbeType.BUFFER, self.mux_sink_probe, index)
+        return True
+
+    def link_elements(self, streammux, source_bins, elements):
+        for index, source_bin in enumerate(source_bins):
+            self.link_source(streammux, index, source_bin)
+
+        # Link the elements in insertion order
+        chain = list(elements.values())
+        streammux.link(chain[0])
+        for upstream, downstream in zip(chain, chain[1:]):
+            upstream.link(downstream)
+
+    def add_latency_probes(self, streammux, elements):
+        # Buffers keep their PTS through these elements, so the time between
+        # the sink and src pad probes is the time spent in the element
+        metrics = self.metrics.metrics
+        metrics.add_element('streammux')
+        streammux.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self.mux_src_probe, metrics)
+        for name in ('pgie', 'tracker', 'nvosd'):
+            if name not in elements:
+                continue
+            metrics.add_element(name)
+            elements[name].get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self.element_sink_probe, name)
+            elements[name].get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self.element_src_probe, name)
+
+    def schedule_drop_probe(self, pad, info, index):
+        if self.scheduler.admit(index):
+            return Gst.PadProbeReturn.OK
+        return Gst.PadProbeReturn.DROP
+
+    def latency_drop_probe(self, pad, info, index):
+        if self.latency_budget.admit(index, info.get_buffer().pts, self.running_time()):
+            return Gst.PadProbeReturn.OK
+        return Gst.PadProbeReturn.DROP
+
+    def apply_inference_interval(self):
+        interval = self.scheduler.pipeline_interval()
+        if interval != self.pgie_interval:
+            log.info("Inference interval %d -> %d", self.pgie_interval, interval)
+            self.pgie.set_property("interval", interval)
+            self.pgie_interval = interval
+        return True
+
+    def mux_sink_probe(self, pad, info, index):
+        stream_metrics = self.metrics.metrics.streams.get(index)
+        if stream_metrics is not None:
+            stream_metrics.arrivals.arrive(info.get_buffer().pts)
+        return Gst.PadProbeReturn.OK
+
+    def mux_src_probe(self, pad, info, metrics):
+        now = time.monotonic()
+        batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(info.get_buffer()))
+        l_frame = batch_meta.frame_meta_list
+        while l_frame is not None:
+            try:
+                frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
+            except StopIteration:
+                break
+            metrics.mux_out(frame_meta.pad_index, frame_meta.buf_pts, now)
+            try:
+                l_frame = l_frame.next
+            except StopIteration:
+                break
+        return Gst.PadProbeReturn.OK
+
+    def element_sink_probe(self, pad, info, name):
+        self.metrics.metrics.element_in(name, info.get_buffer().pts)
+        return Gst.PadProbeReturn.OK
 
-        # Link the elements
-        streammux.link(elements['pgie'])
-        elements['pgie'].link(elements['tracker'])
-        elements['tracker'].link(elements['nvvidconv'])
-        elements['nvvidconv'].link(elements['nvosd'])
-        elements['nvosd'].link(elements['sink'])
+    def element_src_probe(self, pad, info, name):
+        self.metrics.metrics.element_out(name, info.get_buffer().pts)
+        return Gst.PadProbeReturn.OK
+
+    def add_source(self, uri):
+        # Runs on the main loop while the pipeline is PLAYING
+        free = [index for index in range(self.num_sources) if index not in self.sources]
+        if not free:
+            raise RuntimeError(f"All {self.num_sources} batch slots are in use, start with a larger --max-sources")
+        index = free[0]
+        self.processor.add_stream(index)
+        if self.latency_budget is not None:
+            self.latency_budget.add_stream(index)
+        try:
+            self.attach_source(index, uri)
+        except RuntimeError:
+            self.sources.pop(index, None)
+            self.processor.remove_stream(index)
+            if self.latency_budget is not None:
+                self.latency_budget.remove_stream(index)
+            raise
+        return index
+
+    def remove_source(self, index):
+        # Runs on the main loop; the other streams keep playing
+        uri = self.teardown_source(index)
+        del self.sources[index]
+        if self.watchdog is not None:
+            self.watchdog.remove(index)
+        self.processor.remove_stream(index)
+        if self.latency_budget is not None:
+            self.latency_budget.remove_stream(index)
+        log.info("Removed source %d (%s)", index, uri)
+
+    def attach_source(self, index, uri):
+        source_bin = self.create_source_bin(index, uri)
+        if not source_bin:
+            raise RuntimeError("Unable to create source bin")
+        self.pipeline.add(source_bin)
+        if not self.link_source(self.streammux, index, source_bin):
+            self.pipeline.remove(source_bin)
+            raise RuntimeError("Unable to link source bin")
+        self.sources[index] = (source_bin, uri)
+        self.watch_source(index, uri, source_bin)
+        if source_bin.set_state(Gst.State.PLAYING) == Gst.StateChangeReturn.FAILURE:
+            self.teardown_source(index)
+            raise RuntimeError(f"Unable to start source {uri}")
+
+    def teardown_source(self, index):
+        # Stops and unlinks the source bin; the slot keeps its URI so the
+        # source can be rebuilt
+        source_bin, uri = self.sources[index]
+        if source_bin is None:
+            return uri
+        self.sources[index] = (None, uri)
+        state_return = source_bin.set_state(Gst.State.NULL)
+        if state_return == Gst.StateChangeReturn.ASYNC:
+            source_bin.get_state(Gst.CLOCK_TIME_NONE)
+        elif state_return == Gst.StateChangeReturn.FAILURE:
+            log.error("Unable to stop source %d", index)
+        sinkpad = self.streammux.get_static_pad("sink_%u" % index)
+        if sinkpad:
+            sinkpad.send_event(Gst.Event.new_flush_stop(False))
+            self.streammux.release_request_pad(sinkpad)
+        self.pipeline.remove(source_bin)
+        return uri
+
+    def watch_source(self, index, uri, source_bin):
+        # Archive files are followed to their end; live sources get stall
+        # detection; other files simply end
+        if self.archive is not None:
+            source_bin.get_static_pad("src").add_probe(
+                Gst.PadProbeType.BUFFER | Gst.PadProbeType.EVENT_DOWNSTREAM, self.archive_source_probe, index)
+            return
+        if self.watchdog is None or uri.startswith("file://"):
+            return
+        if index not in self.watchdog.sources:
+            self.watchdog.add(index, time.monotonic())
+        source_bin.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self.source_buffer_probe, index)
+
+    def source_buffer_probe(self, pad, info, index):
+        self.watchdog.buffer(index, time.monotonic())
+        return Gst.PadProbeReturn.OK
+
+    def archive_source_probe(self, pad, info, index):
+        # Counts the buffers that go into the muxer for the slot's file, and
+        # keeps its EOS from the muxer, which would end the whole pipeline
+        # once every slot's file ended; the slot gets the next file instead
+        if info.type & Gst.PadProbeType.BUFFER:
+            self.archive.decoded(index)
+            return Gst.PadProbeReturn.OK
+        event = info.get_event()
+        if event is not None and event.type == Gst.EventType.EOS:
+            self.archive.ended(index, time.monotonic())
+            return Gst.PadProbeReturn.DROP
+        return Gst.PadProbeReturn.OK
+
+    def advance_archive(self):
+        # Periodic on the main loop: report and free the slots whose files
+        # drained, start the next files, and stop after the last one
+        now = time.monotonic()
+        for index in self.archive.poll(now):
+            if index in self.sources:
+                self.remove_source(index)
+        while len(self.sources) < self.num_sources:
+            archive_file = self.archive.next_file()
+            if archive_file is None:
+                break
+            # Registered first, its buffers arrive as soon as it plays
+            self.archive.start(min(set(range(self.num_sources)) - set(self.sources)), archive_file, now)
+            try:
+                self.add_source(archive_file.uri)
+            except RuntimeError as e:
+                log.error("Unable to start %s: %s", archive_file.path, e)
+                self.archive.failed(archive_file, str(e))
+        if self.archive.finished:
+            log.info("Archive scan done")
+            self.loop.quit()
+            return False
+        return True
+
+    def on_source_error(self, index, error=None):
+        # Called from bus_call for errors inside a source bin
+        if index not in self.sources:
+            return
+        if self.archive is not None:
+            # The file is reported as failed once its slot drained
+            self.archive.ended(index, time.monotonic(), error or "source error")
+            return
+        if self.watchdog is not None and index in self.watchdog.sources:
+            self.watchdog.error(index, time.monotonic())
+            return
+        # Failed file sources are dropped, the remaining streams go on
+        self.remove_source(index)
+        if not self.sources and self.control is None:
+            log.error("No sources left")
+            self.loop.quit()
+
+    def on_fatal_error(self, error):
+        # Called from bus_call before it stops the main loop
+        self.error = error
+
+    def check_sources(self):
+        # Periodic watchdog check on the main loop; only the failing
+        # source bin is rebuilt, its zone state is kept
+        for index in self.watchdog.check(time.monotonic()):
+            if index not in self.sources:
+                continue
+            uri = self.teardown_source(index)
+            log.info("Reconnecting source %d (%s)", index, uri)
+            try:
+                self.attach_source(index, uri)
+            except RuntimeError as e:
+                log.error("Reconnect of source %d failed: %s", index, e)
+                self.watchdog.error(index, time.monotonic())
+        return True
+
+    def on_element_message(self, bus, message):
+        # With runtime sources, a finished source is removed instead of the
+        # pipeline waiting for all of them to end
+        structure = message.get_structure()
+        if structure is not None and structure.has_name("stream-eos"):
+            parsed, index = structure.get_uint("stream-id")
+            if parsed and index in self.sources:
+                log.info("End of stream on source %d", index)
+                if self.watchdog is not None and index in self.watchdog.sources:
+                    # A live source that ends is reconnected
+                    self.watchdog.error(index, time.monotonic())
+                elif self.control is not None:
+                    GLib.idle_add(self.remove_source_idle, index)
+        return True
+
+    def remove_source_idle(self, index):
+        if index in self.sources:
+            self.remove_source(index)
+        return False
+
+    def reload_zones(self):
+        # SIGHUP: re-read and validate the config, then swap in its zones.
+        # Other settings only take effect on a restart.
+        try:
+            config = self.reload_config()
+        except ConfigError as e:
+            log.error("Config reload failed, keeping the current zones: %s", e)
+            return True
+        self.processor.set_zones(config.roi, config.zones)
+        log.info("Reloaded zones: %s", ", ".join(f"stream {index}: {len(self.processor.zones_for(index))}"
+                                                  for index in sorted(self.sources)))
+        return True
 
     def run(self):
         # Create an event loop and feed GStreamer bus messages to it
         self.loop = GLib.MainLoop()
         bus = self.pipeline.get_bus()
         bus.add_signal_watch()
-        bus.connect("message", bus_call, self.loop)
+        bus.connect("message", bus_call, self.loop, self.on_source_error, self.on_fatal_error)
+        if self.control is not None or self.watchdog is not None:
+            bus.connect("message::element", self.on_element_message)
+        if self.control is not None:
+            self.control.start()
+        if self.watchdog is not None:
+            GLib.timeout_add(1000, self.check_sources)
+        if self.archive is not None:
+            GLib.timeout_add(200, self.advance_archive)
+        if self.scheduler is not None and self.schedule_mode == 'interval':
+            self.pgie_interval = self.pgie.get_property("interval")
+            GLib.timeout_add(250, self.apply_inference_interval)
+        if self.reload_config is not None:
+            GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGHUP, self.reload_zones)
+
+        if self.output.mode == 'rtsp':
+            self.rtsp_server = start_rtsp_server(self.output)
+
+        if self.metrics is not None:
+            self.metrics.start()
 
-        # Start playing
-        print("Starting pipeline \n")
+        # Start playing; nvinfer loads (or builds) its engine while starting
+        log.info("Starting pipeline, output: %s%s", self.output.mode, "" if self.output.osd else " without OSD")
+        self.startup.begin('start')
         self.pipeline.set_state(Gst.State.PLAYING)
+        self.startup.begin('first frame')
         try:
             self.loop.run()
+        except KeyboardInterrupt:
+            if self.output.needs_eos:
+                # Let the muxer finish the file before tearing down
+                log.info("Finalizing %s", self.output.path)
+                self.pipeline.send_event(Gst.Event.new_eos())
+                try:
+                    self.loop.run()
+                except KeyboardInterrupt:
+                    pass
         except:
             pass
 
         # Cleanup
         self.pipeline.set_state(Gst.State.NULL)
+        # The decoupled worker's last batch may still push events and records
+        self.processor.stop()
+        if self.archive is not None:
+            self.archive.close(time.monotonic())
+            log.info("Archive: %s", self.archive.stats())
+        if self.evidence is not None:
+            self.evidence.stop()
+            log.info("Evidence: %s", self.evidence.stats())
+        if self.control is not None:
+            self.control.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+            log.info("Recorded %d frames to %s", self.recorder.frames, self.recorder.path)
+        if self.metrics is not None:
+            self.metrics.stop()
+        if self.events is not None:
+            self.events.stop()
+            log.info("Events: %s", self.events.stats())
+        if self.processor.analytics is not None:
+            log.info("Analytics: %s", self.processor.analytics.snapshot())
 
-def main(args):
-    # Check input arguments
-    if len(args) != 7:
-        sys.stderr.write("usage: %s <video file path> <roi_x> <roi_y> <roi_width> <roi_height> <timeout_seconds>\n" % args[0])
-        sys.exit(1)
+class MainLoopSourceControl(SourceControl):
+    # Control API calls come from HTTP server threads; pipeline changes are
+    # made on the GLib main loop and the caller waits for the result
+    def __init__(self, pipeline: Pipeline, timeout: float = 10.0):
+        self.pipeline = pipeline
+        self.timeout = timeout
+
+    def _call(self, fn, *args):
+        result = {}
+        done = threading.Event()
+
+        def run():
+            try:
+                result['value'] = fn(*args)
+            except Exception as e:
+                result['error'] = e
+            done.set()
+            return False
+
+        GLib.idle_add(run)
+        if not done.wait(self.timeout):
+            raise RuntimeError("Timed out waiting for the pipeline")
+        if 'error' in result:
+            raise result['error']
+        return result.get('value')
+
+    def list_sources(self):
+        return self._call(lambda: {index: uri for index, (_, uri) in self.pipeline.sources.items()})
+
+    def add_source(self, uri):
+        return self._call(self.pipeline.add_source, uri)
+
+    def remove_source(self, index):
+        def remove():
+            if index not in self.pipeline.sources:
+                raise KeyError(index)
+            self.pipeline.remove_source(index)
+        return self._call(remove)
 
+def options_to_config(opts) -> Dict:
+    # The command line maps onto the keys of a config file, so both are
+    # validated the same way
+    return {
+        'sources': opts.sources,
+        'batch_size': opts.max_sources,
+        'roi': [opts.roi_x, opts.roi_y, opts.roi_width, opts.roi_height],
+        'timeout': opts.timeout_seconds,
+        'zones': opts.zones,
+        'clock': opts.clock,
+        'debounce': {'exit_overlap': opts.exit_overlap, 'grace': opts.grace, 'grace_frames': opts.grace_frames},
+        'tracks': {'max_age': opts.track_max_age, 'max_tracks': opts.max_tracks, 'history': opts.track_history,
+                   'reassociate_gap': opts.reassociate_gap, 'reassociate_distance': opts.reassociate_distance},
+        'inference': {'engine_cache': opts.engine_cache, 'idle_interval': opts.idle_interval,
+                      'idle_after': opts.idle_after, 'schedule': opts.schedule, 'gpu_id': opts.gpu_id},
+        'output': {'mode': opts.output, 'osd': not opts.no_osd, 'file': opts.output_file,
+                   'bitrate': opts.bitrate, 'rtsp_port': opts.rtsp_port},
+        'events': {'sinks': opts.events, 'queue_size': opts.event_queue_size},
+        'metrics': {'port': opts.metrics_port, 'file': opts.metrics_file, 'interval': opts.metrics_interval},
+        'control': {'port': opts.control_port},
+        'health': {'stall_timeout': opts.stall_timeout, 'reconnect_max_delay': opts.reconnect_max_delay},
+        'analytics': {'class_counts': opts.analytics, 'occupancy': opts.analytics,
+                      'occupancy_interval': opts.occupancy_interval, 'lines': opts.lines,
+                      'decoupled': opts.decoupled},
+        'evidence': {'dir': opts.evidence_dir, 'format': opts.evidence_format, 'crop': not opts.evidence_full_frame,
+                     'rate': opts.evidence_rate, 'max_mb': opts.evidence_max_mb,
+                     'clip_frames': opts.evidence_clip_frames},
+        'archive': {'path': opts.archive, 'report': opts.archive_report, 'resume': not opts.archive_restart},
+        'latency': {'budget': opts.latency_budget},
+        'record_meta': opts.record_meta,
+        'log_level': opts.log_level,
+    }
+
+def shard_spec(value: str) -> Tuple[int, int]:
+    # INDEX/COUNT of --shard
     try:
-        video_path = args[1]
-        roi_coords = [float(args[2]), float(args[3]), float(args[4]), float(args[5])]
-        timeout = float(args[6])
+        index, count = (int(n) for n in value.split('/'))
     except ValueError:
-        sys.stderr.write("Error: ROI coordinates and timeout must be numbers\n")
-        sys.exit(1)
+        raise argparse.ArgumentTypeError(f"expected INDEX/COUNT, got '{value}'")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index out of range in '{value}'")
+    return index, count
+
+def worker_config(config: PipelineConfig, index: int, count: int) -> PipelineConfig:
+    # A worker of supervisor.py runs its shard of the sources with zones and
+    # lines renumbered to match. The supervisor writes the events and serves
+    # the metrics; ports and files every worker would share are left out.
+    if config.archive is not None:
+        raise ConfigError("archive: not supported with --shard")
+    shards = plan_shards(config.sources, count)
+    if index >= len(shards):
+        raise ConfigError(f"--shard {index}/{count}: {len(config.sources)} sources make only {len(shards)} shards")
+    shard = shards[index]
+    evidence = config.evidence
+    if evidence is not None:
+        evidence = dict(evidence, directory=os.path.join(evidence['directory'], f"worker{index}"),
+                        max_bytes=evidence['max_bytes'] // len(shards))
+    record_meta = config.record_meta
+    if record_meta:
+        root, ext = os.path.splitext(record_meta)
+        record_meta = f"{root}.worker{index}{ext}"
+    return config._replace(sources=shard.sources, batch_size=0, zones=localize(config.zones, shard),
+                           lines=localize(config.lines, shard), events=[], metrics_port=None, metrics_file=None,
+                           control_port=None, evidence=evidence, record_meta=record_meta)
+
+def main(args):
+    # A config file replaces the command line arguments, except for the
+    # options supervisor.py starts its workers with
+    config_parser = argparse.ArgumentParser(add_help=False)
+    config_parser.add_argument("--config")
+    config_parser.add_argument("--gpu-id", type=int)
+    config_parser.add_argument("--shard", type=shard_spec)
+    config_parser.add_argument("--supervisor")
+    known, rest = config_parser.parse_known_args(args[1:])
+
+    parser = argparse.ArgumentParser(
+        prog=args[0], epilog="Instead of arguments, all settings can come from a YAML, TOML or JSON file: "
+                             "%(prog)s --config FILE (see config/pipeline_example.yaml). "
+                             "SIGHUP reloads the zones from the config file or --zones.")
+    parser.add_argument("sources", nargs="*", help="video file paths or URIs (file://, rtsp://, ...)")
+    parser.add_argument("roi_x", type=float)
+    parser.add_argument("roi_y", type=float)
+    parser.add_argument("roi_width", type=float)
+    parser.add_argument("roi_height", type=float)
+    parser.add_argument("timeout_seconds", type=float)
+    parser.add_argument("--zones", help="JSON file with additional rectangle/polygon zones")
+    parser.add_argument("--clock", choices=CLOCK_SOURCES, default="pts",
+                        help="timestamp used for dwell time: buffer PTS, NTP/capture time or wall clock (default: pts)")
+    parser.add_argument("--exit-overlap", type=float, default=None,
+                        help="overlap below which a person inside a zone has left it (default: the zone's "
+                             "min_overlap); lower values keep boxes that jitter on the edge inside")
+    parser.add_argument("--grace", type=float, default=0.0,
+                        help="seconds a person may drop out of a zone without leaving it (default: 0)")
+    parser.add_argument("--grace-frames", type=int, default=0,
+                        help="frames a person may drop out of a zone without leaving it (default: 0)")
+    parser.add_argument("--reassociate-gap", type=float, default=0.0,
+                        help="a new track id inside a zone continues the dwell time of a track lost there "
+                             "at most this many seconds ago (default: 0, disabled)")
+    parser.add_argument("--reassociate-distance", type=float, default=64.0,
+                        help="... and at most this many pixels away (default: 64)")
+    parser.add_argument("--track-max-age", type=float, default=60.0,
+                        help="forget tracks not seen for this many seconds (default: 60, 0 disables)")
+    parser.add_argument("--max-tracks", type=int, default=None,
+                        help="cap on tracks held per stream, least recently seen are evicted first")
+    parser.add_argument("--track-history", type=int, default=30,
+                        help="trajectory entries (frames) kept per track, including shadow-tracked frames "
+                             "reported by the tracker (default: 30, 0 disables)")
+    parser.add_argument("--events", action="append", default=[], metavar="SINK",
+                        help="write zone enter/leave/alert events to jsonl:PATH, rotating:PATH[:MAX_BYTES[:BACKUPS]], "
+                             "udp:HOST:PORT, tcp:HOST:PORT or an http:// webhook URL (repeatable)")
+    parser.add_argument("--event-queue-size", type=int, default=10000,
+                        help="events buffered for the sinks before the oldest are dropped")
+    parser.add_argument("--analytics", action="store_true",
+                        help="count objects per class and people per zone (exported with the metrics)")
+    parser.add_argument("--occupancy-interval", type=float, default=60.0,
+                        help="seconds of frame time per zone occupancy mean/max sample (default: 60)")
+    parser.add_argument("--lines", help="JSON file with directional counting lines, in the layout of --zones")
+    parser.add_argument("--decoupled", action="store_true",
+                        help="copy metadata in the probe and run zones, events and analytics on a worker thread; "
+                             "boxes and alerts are drawn one frame late")
+    parser.add_argument("--evidence-dir", metavar="DIR",
+                        help="save an image of every track that enters the alert state in DIR")
+    parser.add_argument("--evidence-format", choices=EVIDENCE_FORMATS, default="jpeg",
+                        help="image format; jpeg needs OpenCV or Pillow (default: jpeg)")
+    parser.add_argument("--evidence-full-frame", action="store_true",
+                        help="save the full frame instead of a crop around the person")
+    parser.add_argument("--evidence-rate", type=float, default=1.0,
+                        help="evidence images per second per stream, after a burst of 5 (default: 1)")
+    parser.add_argument("--evidence-max-mb", type=int, default=1024,
+                        help="disk space for evidence; the oldest files are removed beyond it (default: 1024)")
+    parser.add_argument("--evidence-clip-frames", type=int, default=0,
+                        help="also save this many of the following frames (every 5th, half size) per alert")
+    parser.add_argument("--archive", metavar="DIR|MANIFEST",
+                        help="scan the video files below DIR, or listed in MANIFEST, as fast as possible instead of "
+                             "playing sources, one file per batch slot (--max-sources, default 4)")
+    parser.add_argument("--archive-report", default="archive_report.jsonl",
+                        help="per-file alert report of --archive, also read to resume a scan "
+                             "(default: archive_report.jsonl)")
+    parser.add_argument("--archive-restart", action="store_true",
+                        help="scan all files again instead of skipping those the report has as done")
+    parser.add_argument("--latency-budget", type=float, default=0.0, metavar="SECONDS",
+                        help="queue the stages, with a leaky queue before inference, and drop a stream's frames "
+                             "before inference when they would reach the probe later than this after their PTS "
+                             "(default: 0, disabled)")
+    parser.add_argument("--log-level", choices=LEVELS, default="info",
+                        help="debug adds rate-limited per-frame and sampled per-object output (default: info)")
+    parser.add_argument("--output", choices=OUTPUT_MODES, default="display",
+                        help="display on screen, fake (discard frames, for throughput), file (MP4) or rtsp (default: display)")
+    parser.add_argument("--no-osd", action="store_true",
+                        help="skip nvvideoconvert/nvdsosd and the overlay, e.g. for headless --output fake runs")
+    parser.add_argument("--output-file", default="out.mp4", help="MP4 path for --output file (default: out.mp4)")
+    parser.add_argument("--bitrate", type=int, default=4000000, help="encoder bitrate for file/rtsp output")
+    parser.add_argument("--rtsp-port", type=int, default=8554, help="RTSP server port for --output rtsp (default: 8554)")
+    parser.add_argument("--record-meta", metavar="PATH",
+                        help="record detections of every frame for replay with benchmarks/bench_probe.py")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve Prometheus metrics at http://127.0.0.1:PORT/metrics (and /metrics.json)")
+    parser.add_argument("--metrics-file", help="write metrics as JSON to this file every --metrics-interval")
+    parser.add_argument("--metrics-interval", type=float, default=5.0,
+                        help="seconds between metric aggregations and PERF log lines (default: 5)")
+    parser.add_argument("--control-port", type=int,
+                        help="serve the source control API (add/remove cameras at runtime) on this local port")
+    parser.add_argument("--max-sources", type=int, default=0,
+                        help="batch slots reserved for sources added at runtime (default: number of sources)")
+    parser.add_argument("--stall-timeout", type=float, default=10.0,
+                        help="reconnect a live source that delivers no buffers for this many seconds (default: 10, 0 disables)")
+    parser.add_argument("--reconnect-max-delay", type=float, default=60.0,
+                        help="upper bound of the exponential reconnect backoff in seconds (default: 60)")
+    parser.add_argument("--engine-cache", metavar="DIR",
+                        help="directory of TensorRT engines per batch size/precision/GPU (default: next to the model)")
+    parser.add_argument("--idle-interval", type=int, default=0,
+                        help="frames to skip between inferences while nobody is near a zone (default: 0, always infer)")
+    parser.add_argument("--idle-after", type=float, default=2.0,
+                        help="seconds without people near a zone before a stream counts as idle (default: 2)")
+    parser.add_argument("--schedule", choices=SCHEDULE_MODES, default="interval",
+                        help="apply idle rates via nvinfer's interval (all streams) or by dropping frames per stream")
+    parser.add_argument("--gpu-id", type=int,
+                        help="GPU of the decoders, muxer, nvinfer, tracker and OSD (default: the nvinfer config's)")
+    parser.add_argument("--shard", type=shard_spec, metavar="INDEX/COUNT",
+                        help="run only this shard of the sources, as a worker of supervisor.py")
+    parser.add_argument("--supervisor", metavar="SOCKET",
+                        help="send events and metrics to supervisor.py over this Unix socket")
+    if known.config:
+        if rest:
+            parser.error(f"--config replaces the other arguments: {' '.join(rest)}")
+        read_config = functools.partial(load_config, known.config)
+    else:
+        opts = parser.parse_args(args[1:])
+        read_config = functools.partial(parse_config, options_to_config(opts), os.getcwd())
+
+    def reload_config() -> PipelineConfig:
+        config = read_config()
+        if known.gpu_id is not None:
+            config = config._replace(gpu_id=known.gpu_id)
+        if known.shard is not None:
+            config = worker_config(config, *known.shard)
+        return config
+    startup = PhaseTimer()
+    startup.begin('config')
+    try:
+        config = reload_config()
+    except ConfigError as e:
+        parser.error(str(e))
+    setup_logging(config.log_level)
+
+    # A supervised worker's events and metrics go to the supervisor
+    link = None
+    if known.supervisor:
+        link = SupervisorLink(known.supervisor, known.shard[0] if known.shard is not None else 0)
 
-    pipeline = Pipeline(roi_coords, timeout)
-    if pipeline.create_pipeline(video_path):
-        pipeline.run()
+    events = None
+    if config.events or link is not None:
+        try:
+            sinks = [create_sink(spec) for spec in config.events]
+        except (OSError, ValueError) as e:
+            log.error(f"Unable to create event sink: {e}")
+            sys.exit(1)
+        if link is not None:
+            sinks.append(link)
+        events = EventDispatcher(sinks, EventQueue(config.event_queue_size))
+        events.start()
+
+    output = OutputConfig(config.output_mode, osd=config.osd, path=config.output_file,
+                          bitrate=config.bitrate, rtsp_port=config.rtsp_port)
+    recorder = ReplayWriter(config.record_meta) if config.record_meta else None
+    metrics = None
+    if link is not None:
+        metrics = MetricsExporter(Metrics(), interval=config.metrics_interval, publish=link.publish)
+    elif config.metrics_port is not None or config.metrics_file:
+        try:
+            metrics = MetricsExporter(Metrics(), config.metrics_port, config.metrics_file, config.metrics_interval)
+        except OSError as e:
+            log.error(f"Unable to serve metrics on port {config.metrics_port}: {e}")
+            sys.exit(1)
+    scheduler = InferenceScheduler(config.idle_interval, config.idle_after) if config.idle_interval > 0 else None
+    latency_budget = LatencyBudget(config.latency['budget']) if config.latency is not None else None
+    analytics = None
+    if config.class_counts or config.occupancy or config.lines:
+        analytics = AnalyticsEngine()
+        if config.class_counts:
+            analytics.register(ClassCounts())
+        if config.occupancy:
+            analytics.register(ZoneOccupancy(config.occupancy_interval, config.occupancy_history))
+        if config.lines:
+            analytics.register(LineCrossing(config.lines))
+    evidence = None
+    if config.evidence is not None:
+        settings = dict(config.evidence)
+        try:
+            encoder, extension = make_encoder(settings.pop('format'), settings.pop('quality'))
+            store = EvidenceStore(settings.pop('directory'), settings.pop('max_bytes'))
+        except (OSError, ValueError) as e:
+            log.error(f"Unable to set up evidence capture: {e}")
+            sys.exit(1)
+        evidence = EvidenceRecorder(store, encoder, extension, **settings)
+        evidence.start()
+    watchdog = None
+    if config.stall_timeout > 0:
+        watchdog = SourceWatchdog(config.stall_timeout, backoff=Backoff(maximum=config.reconnect_max_delay))
+    sources = config.sources
+    batch_size = config.batch_size
+    archive = None
+    if config.archive is not None:
+        try:
+            files = find_files(config.archive['path'])
+            report = ArchiveReport(config.archive['report'], config.archive['resume'])
+        except (OSError, ValueError) as e:
+            log.error(f"Unable to start the archive scan: {e}")
+            sys.exit(1)
+        archive = ArchiveScheduler(files, report, events, config.archive['drain_timeout'])
+        log.info("Archive: %d files, %d already done", archive.total, archive.skipped)
+        # Every slot starts with a file, the rest follow as files end
+        batch_size = min(batch_size or DEFAULT_ARCHIVE_SLOTS, len(archive.pending)) or 1
+        initial = []
+        while len(initial) < batch_size:
+            archive_file = archive.next_file()
+            if archive_file is None:
+                break
+            initial.append(archive_file)
+        if not initial:
+            archive.close(time.monotonic())
+            log.info("Nothing to scan")
+            return 1 if archive.counts['error'] else 0
+        sources = [archive_file.uri for archive_file in initial]
+        # Frames go as fast as they decode: no clock sync and no rendering
+        output = OutputConfig('fake', osd=False)
+        watchdog = None
+    pipeline = Pipeline(config.roi, config.zones, config.clock, config.track_limits, events, output,
+                        recorder, metrics, batch_size, watchdog, EngineCache(config.engine_cache), startup,
+                        scheduler, config.schedule, config.infer_config, config.tracker, reload_config,
+                        config.track_history, analytics, config.decoupled, evidence, archive, config.gpu_id,
+                        latency_budget, config.latency['queue_size'] if config.latency is not None else 2)
+    if config.control_port is not None:
+        try:
+            pipeline.control = ControlServer(MainLoopSourceControl(pipeline), config.control_port)
+        except OSError as e:
+            log.error(f"Unable to serve the control API on port {config.control_port}: {e}")
+            sys.exit(1)
+    if not pipeline.create_pipeline(sources):
+        return 1
+    if archive is not None:
+        now = time.monotonic()
+        for index, archive_file in enumerate(initial):
+            archive.start(index, archive_file, now)
+    pipeline.run()
+    if pipeline.error is not None or (archive is not None and archive.counts['error']):
+        return 1
+    return 0
 
 if __name__ == '__main__':
     sys.exit(main(sys.argv))